@@ -0,0 +1,200 @@
+# Parallel batch runner for v4 programs
+#
+# run_jobs runs a list of jobs, each a program and its input lines, with up to
+# workers of them at a time. Every job runs in a child process forked for it
+# alone, with RLIMIT_CPU and RLIMIT_AS set to cpu_seconds and memory_bytes,
+# and is killed if it runs for more than timeout seconds of wall-clock time.
+# The parent is single-threaded and only waits on the children, so forking
+# from it is safe. Results come back as they finish, as dicts of
+#   name, status ("ok", "error", "timeout" or "killed"), output (the lines of
+#   get_output()), error, error_type and line (from get_error_type_and_line(),
+#   error_type by name) and seconds.
+#
+# load_jobs reads jobs from a directory, where every NAME.br is a program and
+# NAME.in, if there is one, holds its input lines, or from a manifest of JSON
+# lines {"name": ..., "program": ... or "path": ..., "inputs": [...]}, with
+# paths relative to the manifest.
+#
+# python batch_v4.py SOURCE [-j WORKERS] [--cpu-seconds S] [--memory-mb M]
+#                           [--timeout S] [-o RESULTS.jsonl]
+import argparse
+import json
+import multiprocessing
+from multiprocessing.connection import wait
+import os
+import resource
+import signal
+import sys
+import time
+
+from interpreterv4 import Interpreter
+
+CPU_SECONDS = 10
+MEMORY_BYTES = 1 << 30
+TIMEOUT = 30
+PROGRAM_SUFFIX = ".br"
+INPUT_SUFFIX = ".in"
+
+
+def load_jobs(source):
+    jobs = []
+    if os.path.isdir(source):
+        for file_name in sorted(os.listdir(source)):
+            if not file_name.endswith(PROGRAM_SUFFIX):
+                continue
+            name = file_name[: -len(PROGRAM_SUFFIX)]
+            job = {"name": name, "program": _read(os.path.join(source, file_name))}
+            input_path = os.path.join(source, name + INPUT_SUFFIX)
+            if os.path.exists(input_path):
+                job["inputs"] = _read(input_path).splitlines()
+            jobs.append(job)
+        return jobs
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            job = json.loads(line)
+            job.setdefault("name", str(number))
+            if "program" not in job:
+                job["program"] = _read(os.path.join(base, job.pop("path")))
+            jobs.append(job)
+    return jobs
+
+
+def _read(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+# runs in the job's own process
+def _run_job(job, cpu_seconds, memory_bytes, options, conn):
+    if cpu_seconds is not None:
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+    if memory_bytes is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+    interpreter = Interpreter(console_output=False, inp=job.get("inputs"), **options)
+    error = None
+    try:
+        interpreter.run(job["program"])
+    except Exception as e:
+        error = str(e) or type(e).__name__
+    error_type, line = interpreter.get_error_type_and_line()
+    conn.send(
+        {
+            "status": "ok" if error is None else "error",
+            "output": interpreter.get_output(),
+            "error": error,
+            "error_type": error_type.name if error_type is not None else None,
+            "line": line,
+        }
+    )
+    conn.close()
+
+
+def _failed(job, status, error, seconds):
+    return {
+        "name": job["name"],
+        "status": status,
+        "output": [],
+        "error": error,
+        "error_type": None,
+        "line": None,
+        "seconds": seconds,
+    }
+
+
+# yields the result of every job, in the order they finish
+def run_jobs(
+    jobs,
+    workers=None,
+    cpu_seconds=CPU_SECONDS,
+    memory_bytes=MEMORY_BYTES,
+    timeout=TIMEOUT,
+    **options,
+):
+    context = multiprocessing.get_context("fork")
+    workers = workers or os.cpu_count()
+    pending = iter(jobs)
+    running = {}  # connection -> (job, process, start time)
+    exhausted = False
+    while running or not exhausted:
+        while not exhausted and len(running) < workers:
+            job = next(pending, None)
+            if job is None:
+                exhausted = True
+                break
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(
+                target=_run_job, args=(job, cpu_seconds, memory_bytes, options, sender)
+            )
+            process.start()
+            sender.close()
+            running[receiver] = (job, process, time.monotonic())
+        if not running:
+            break
+        now = time.monotonic()
+        wait_for = None
+        if timeout is not None:
+            wait_for = max(0, min(start + timeout for _, _, start in running.values()) - now)
+        ready = wait(list(running), wait_for)
+        now = time.monotonic()
+        for receiver in list(running):
+            job, process, start = running[receiver]
+            if receiver in ready:
+                try:
+                    result = receiver.recv()
+                except EOFError:
+                    process.join()
+                    result = _failed(job, "killed", _exit_reason(process.exitcode), now - start)
+                else:
+                    process.join()
+                    result = {"name": job["name"], **result, "seconds": now - start}
+            elif timeout is not None and now - start >= timeout:
+                process.kill()
+                process.join()
+                result = _failed(job, "timeout", f"timed out after {timeout} s", now - start)
+            else:
+                continue
+            receiver.close()
+            del running[receiver]
+            yield result
+
+
+def _exit_reason(exitcode):
+    if exitcode is not None and exitcode < 0:
+        signal_number = -exitcode
+        if signal_number == signal.SIGXCPU:
+            return "CPU time limit exceeded"
+        return f"killed by {signal.Signals(signal_number).name}"
+    return f"exited with status {exitcode}"
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Run Brewin v4 programs in parallel")
+    parser.add_argument("source", help="directory of .br programs, or a JSON lines manifest")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--cpu-seconds", type=int, default=CPU_SECONDS)
+    parser.add_argument("--memory-mb", type=int, default=MEMORY_BYTES >> 20)
+    parser.add_argument("--timeout", type=float, default=TIMEOUT)
+    parser.add_argument("-o", "--output", help="results file (default: stdout)")
+    args = parser.parse_args(argv)
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for result in run_jobs(
+            load_jobs(args.source),
+            args.workers,
+            args.cpu_seconds,
+            args.memory_mb << 20,
+            args.timeout,
+        ):
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,899 @@
+# Benchmarks for the v4 interpreter
+#
+# python bench.py            runs every benchmark
+# python bench.py name ...   runs only the named benchmarks
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from batch_v4 import run_jobs
+from brewparse import parse_program
+from forkserver_v4 import start_fork_server
+from inputs_v4 import AsyncQueueInput, FileInput, IteratorInput, PrefetchInput
+from interpreterv4 import Interpreter
+from pool_v4 import POOL_SIZE, InterpreterPool
+from program_v4 import compile as compile_program
+from server_v4 import BrewinServer, run_remote, stream_remote
+from sinks_v4 import AsyncQueueSink, CallbackSink, FileSink, RingBufferSink, iter_output
+
+BENCHMARKS = {}
+
+
+def benchmark(func):
+    BENCHMARKS[func.__name__[len("bench_"):]] = func
+    return func
+
+
+# runs program once and returns (seconds, interpreter)
+def time_run(program, inp=None, **options):
+    interpreter = Interpreter(console_output=False, inp=inp, **options)
+    start = time.perf_counter()
+    interpreter.run(program)
+    return time.perf_counter() - start, interpreter
+
+
+def report(label, seconds, extra=""):
+    print(f"  {label:<40} {seconds * 1000:10.2f} ms  {extra}")
+
+
+DEPTH_PROGRAM = """
+func down(n) {
+  if (n == 0) { return 0; }
+  return 1 + down(n - 1);
+}
+func main() { print(down(%d)); }
+"""
+
+FIB_PROGRAM = """
+func fib(n) {
+  if (n < 2) { return n; }
+  return fib(n - 1) + fib(n - 2);
+}
+func main() { print(fib(%d)); }
+"""
+
+
+@benchmark
+def bench_recursion():
+    print("recursion depth (recursive vs explicit_stack)")
+    for depth in (100, 1000, 10000, 50000):
+        for explicit_stack in (False, True):
+            label = f"down({depth}) explicit_stack={explicit_stack}"
+            interpreter = Interpreter(console_output=False, explicit_stack=explicit_stack)
+            start = time.perf_counter()
+            try:
+                interpreter.run(DEPTH_PROGRAM % depth)
+            except Exception:
+                error_type, _ = interpreter.get_error_type_and_line()
+                print(f"  {label:<40} {error_type.name} at call depth {interpreter.call_depth}")
+            else:
+                report(label, time.perf_counter() - start)
+    try:
+        time_run(DEPTH_PROGRAM % 1000, explicit_stack=True, max_call_depth=500)
+    except Exception as e:
+        print(f"  max_call_depth=500 on down(1000): {e}")
+
+    print("recursion throughput")
+    for explicit_stack in (False, True):
+        seconds, _ = time_run(FIB_PROGRAM % 18, explicit_stack=explicit_stack)
+        report(f"fib(18) explicit_stack={explicit_stack}", seconds)
+
+
+LOOP_PROGRAM = """
+func main() {
+  i = 0;
+  s = 0;
+  k = 3;
+  while (i < %d) {
+    s = s + i * k;
+    if (s > 1000000) { s = s - 1000000; }
+    i = i + 1;
+  }
+  print(s);
+}
+"""
+
+
+@benchmark
+def bench_quicken():
+    print("numeric loop (generic vs quickened binary operators)")
+    for quicken in (False, True):
+        seconds, interpreter = time_run(LOOP_PROGRAM % 100000, quicken=quicken)
+        report(f"100000 iterations quicken={quicken}", seconds, interpreter.quick_stats)
+    for quicken in (False, True):
+        seconds, _ = time_run(FIB_PROGRAM % 18, quicken=quicken)
+        report(f"fib(18) quicken={quicken}", seconds)
+
+
+ONCE_PROGRAM = """
+func greet(name) { return "hello " + name; }
+func main() {
+  print(greet("a"));
+  x = 3 * 4 + 2;
+  if (x > 10) { print(x); }
+}
+"""
+
+
+@benchmark
+def bench_tiering():
+    print("tiered execution (tree walker only vs tiering)")
+    for tiering in (False, True):
+        seconds, interpreter = time_run(LOOP_PROGRAM % 100000, tiering=tiering)
+        report(f"loop 100000 tiering={tiering}", seconds, interpreter.get_tier_stats()["transitions"])
+    for tiering in (False, True):
+        seconds, interpreter = time_run(FIB_PROGRAM % 18, tiering=tiering)
+        report(f"fib(18) tiering={tiering}", seconds, interpreter.get_tier_stats()["transitions"])
+    for tiering in (False, True):
+        seconds, _ = time_run(ONCE_PROGRAM, tiering=tiering)
+        report(f"run-once program tiering={tiering}", seconds)
+
+
+@benchmark
+def bench_profile():
+    print("profile-guided runs (no profile vs cold profile vs warm profile)")
+    program = (LOOP_PROGRAM % 300) + "func unused() { return 0; }"
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "profiles.json")
+        seconds, _ = time_run(program)
+        report("no profiling", seconds)
+        seconds, _ = time_run(program, profile_path=path)
+        report("cold (records profile)", seconds)
+        for run in range(2):
+            seconds, interpreter = time_run(program, profile_path=path)
+            report(f"warm run {run + 1}", seconds, interpreter.get_tier_stats()["transitions"])
+        seconds, _ = time_run(program, profile_path=path, record_profile=False)
+        report("warm, not recording", seconds)
+
+
+@benchmark
+def bench_static_types():
+    print("static type inference (runtime checks vs proven types)")
+    for tiering in (False, True):
+        for static_types in (False, True):
+            seconds = min(
+                time_run(LOOP_PROGRAM % 50000, static_types=static_types, tiering=tiering)[0]
+                for _ in range(3)
+            )
+            report(f"loop 50000 tiering={tiering} static_types={static_types}", seconds)
+
+
+BINOM_PROGRAM = """
+func binom(n, k) {
+  if (k == 0 || k == n) { return 1; }
+  return binom(n - 1, k - 1) + binom(n - 1, k);
+}
+func main() { print(binom(%d, %d)); }
+"""
+
+
+@benchmark
+def bench_memoize():
+    print("memoization of pure functions")
+    for program, label in ((FIB_PROGRAM % 20, "fib(20)"), (BINOM_PROGRAM % (18, 9), "binom(18, 9)")):
+        for memoize in (False, True):
+            seconds, interpreter = time_run(program, memoize=memoize)
+            report(f"{label} memoize={memoize}", seconds, interpreter.get_memo_stats())
+    seconds, interpreter = time_run(FIB_PROGRAM % 20, memoize=True, memo_size=8)
+    report("fib(20) memoize=True memo_size=8", seconds, interpreter.get_memo_stats())
+
+
+POWER_PROGRAM = """
+func power(x, n) {
+  if (n == 0) { return 1; }
+  return x * power(x, n - 1);
+}
+func scale(mode, v) {
+  if (mode == "double") { return v * 2; }
+  if (mode == "half") { return v / 2; }
+  return v;
+}
+func main() {
+  i = 0;
+  s = 0;
+  while (i < %d) {
+    s = s + power(i, 12) - scale("double", i);
+    i = i + 1;
+  }
+  print(s);
+}
+"""
+
+
+@benchmark
+def bench_specialize():
+    print("specialization on constant arguments")
+    for specialize in (False, True):
+        seconds, interpreter = min(
+            (time_run(POWER_PROGRAM % 2000, specialize=specialize) for _ in range(3)),
+            key=lambda r: r[0],
+        )
+        report(f"power(i, 12) x2000 specialize={specialize}", seconds, f"{interpreter.specialized_nodes} nodes added")
+    seconds, interpreter = time_run(POWER_PROGRAM % 2000, specialize=True, specialize_budget=40)
+    report("specialize_budget=40", seconds, f"{interpreter.specialized_nodes} nodes added")
+
+
+@benchmark
+def bench_ir():
+    print("IR execution by optimization level (tree walker without tiering for reference)")
+    for program, label in ((LOOP_PROGRAM % 50000, "loop 50000"), (FIB_PROGRAM % 18, "fib(18)")):
+        seconds = min(time_run(program, tiering=False)[0] for _ in range(3))
+        report(f"{label} tree walker", seconds)
+        # the levels take turns, so that a burst of noise can't land on just one
+        best = {}
+        for _ in range(5):
+            for opt_level in (0, 1, 2):
+                result = time_run(program, opt_level=opt_level)
+                if opt_level not in best or result[0] < best[opt_level][0]:
+                    best[opt_level] = result
+        for opt_level, (seconds, interpreter) in best.items():
+            passes = interpreter.get_pass_stats()
+            compile_ms = sum(stats["seconds"] for stats in passes.values()) * 1000
+            report(f"{label} -O{opt_level}", seconds, f"lowering and passes {compile_ms:.2f} ms")
+
+
+COUNTED_PROGRAM = """
+func main() {
+  i = 0;
+  s = 0;
+  k = 3;
+  while (i < %d) {
+    s = s + i * k;
+    i = i + 1;
+  }
+  print(s);
+}
+"""
+
+
+@benchmark
+def bench_vectorize():
+    print("counted loops (one iteration at a time vs closed form)")
+    for n in (1000, 100000):
+        for vectorize in (False, True):
+            seconds, interpreter = time_run(COUNTED_PROGRAM % n, vectorize=vectorize)
+            report(f"{n} iterations vectorize={vectorize}", seconds, interpreter.counted_loop_stats)
+    seconds, interpreter = time_run(LOOP_PROGRAM % 100000)
+    report("loop with an if (not counted)", seconds, interpreter.counted_loop_stats)
+
+
+GUARD_PROGRAM = """
+func check(i) {
+  return i * i > 10000;
+}
+func main() {
+  i = 0;
+  hits = 0;
+  node = @;
+  node.ok = false;
+  while (i < %d) {
+    if (node.ok && check(i) || i < 0 && check(i) || i == -1 && check(i)) { hits = hits + 1; }
+    i = i + 1;
+  }
+  print(hits);
+}
+"""
+
+
+@benchmark
+def bench_short_circuit():
+    print("guard-heavy loop (eager vs short-circuit && and ||)")
+    for short_circuit in (False, True):
+        seconds = min(time_run(GUARD_PROGRAM % 20000, short_circuit=short_circuit)[0] for _ in range(3))
+        report(f"20000 iterations short_circuit={short_circuit}", seconds)
+    seconds = min(time_run(GUARD_PROGRAM % 20000, opt_level=2)[0] for _ in range(3))
+    report("20000 iterations short_circuit=True -O2", seconds)
+
+
+RARELY_USED_PROGRAM = """
+func fib(n) {
+  if (n < 2) { return n; }
+  return fib(n - 1) + fib(n - 2);
+}
+func pick(first, fallback, cheap) {
+  if (first) { return fallback; }
+  return cheap;
+}
+func main() {
+  i = 0;
+  s = 0;
+  while (i < %d) {
+    s = s + pick(i == 0, fib(12), i);
+    i = i + 1;
+  }
+  print(s);
+}
+"""
+
+
+@benchmark
+def bench_lazy():
+    print("rarely used expensive arguments (eager vs call-by-need)")
+    for lazy in (False, True):
+        seconds, interpreter = time_run(RARELY_USED_PROGRAM % 200, lazy=lazy)
+        report(f"200 calls lazy={lazy}", seconds, interpreter.thunk_stats)
+    for lazy in (False, True):
+        seconds, _ = time_run(FIB_PROGRAM % 18, lazy=lazy)
+        report(f"fib(18) lazy={lazy}", seconds)
+
+
+@benchmark
+def bench_intern():
+    print("value interning (new Values vs shared literals, small ints and bools)")
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 20000))
+    for intern_values in (False, True):
+        tracemalloc.start()
+        seconds, _ = time_run(DEPTH_PROGRAM % 600, intern_values=intern_values)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        report(f"down(600) intern_values={intern_values}", seconds, f"peak traced memory {peak / 1024:.0f} KiB")
+    for intern_values in (False, True):
+        seconds = min(time_run(LOOP_PROGRAM % 50000, intern_values=intern_values)[0] for _ in range(3))
+        report(f"loop 50000 intern_values={intern_values}", seconds)
+    for intern_values in (False, True):
+        seconds = min(time_run(FIB_PROGRAM % 18, intern_values=intern_values)[0] for _ in range(3))
+        report(f"fib(18) intern_values={intern_values}", seconds)
+
+
+APPEND_PROGRAM = """
+func main() {
+  i = 0;
+  s = "";
+  while (i < %d) {
+    s = s + "piece ";
+    i = i + 1;
+  }
+  print(s == s + "");
+}
+"""
+
+
+@benchmark
+def bench_ropes():
+    print("string building by repeated appends (python strings vs ropes)")
+    for n in (10000, 50000):
+        for ropes in (False, True):
+            seconds, _ = time_run(APPEND_PROGRAM % n, ropes=ropes)
+            report(f"{n} appends ropes={ropes}", seconds)
+
+
+CAPTURE_PROGRAM = """
+func make_adder(k) {
+  return lambda(x) { return x + k; };
+}
+func build(depth, n) {
+  if (depth > 0) { return build(depth - 1, n); }
+  i = 0;
+  s = 0;
+  while (i < n) {
+    f = make_adder(i);
+    s = s + f(1);
+    i = i + 1;
+  }
+  return s;
+}
+func main() { print(build(%d, %d)); }
+"""
+
+CHAIN_PROGRAM = """
+func apply(f, depth, x) {
+  if (depth == 0) { return f(x); }
+  return apply(f, depth - 1, x);
+}
+func main() {
+  i = 0;
+  s = 0;
+  step = 3;
+  g = lambda(x) { return x + step; };
+  while (i < %d) {
+    s = s + apply(g, %d, i);
+    i = i + 1;
+  }
+  print(s);
+}
+"""
+
+
+@benchmark
+def bench_persistent_env():
+    print("closures in deep call stacks (stack of dicts vs persistent map)")
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 20000))
+    for depth in (0, 100):
+        for persistent_env in (False, True):
+            seconds = min(
+                time_run(CAPTURE_PROGRAM % (depth, 1000), persistent_env=persistent_env)[0]
+                for _ in range(3)
+            )
+            report(f"1000 closures at depth {depth} persistent_env={persistent_env}", seconds)
+    for persistent_env in (False, True):
+        seconds = min(time_run(CHAIN_PROGRAM % (200, 40), persistent_env=persistent_env)[0] for _ in range(3))
+        report(f"200 higher-order calls 40 deep persistent_env={persistent_env}", seconds)
+
+
+# n functions, of which main only calls the first few
+def generated_program(n):
+    functions = [
+        f"func f{i}(x) {{ y = x * {i} + 1; if (y > {i}) {{ return y - {i}; }} return f{i}(y); }}"
+        for i in range(n)
+    ]
+    main = "func main() { print(f0(1)); print(f1(2) + f2(3)); }"
+    return "\n".join(functions + [main])
+
+
+# an output log that notes when the first line was added
+class FirstOutputLog(list):
+    first_output = None
+
+    def append(self, v):
+        if self.first_output is None:
+            self.first_output = time.perf_counter()
+        super().append(v)
+
+
+@benchmark
+def bench_lazy_functions():
+    print("time to first output of large programs (eager vs lazy function setup)")
+    for n in (1000, 10000):
+        program = generated_program(n)
+        start = time.perf_counter()
+        parse_program(program)
+        report(f"{n} functions, parse only", time.perf_counter() - start)
+        for lazy_functions in (False, True):
+            interpreter = Interpreter(console_output=False, lazy_functions=lazy_functions)
+            interpreter.output_log = FirstOutputLog()
+            start = time.perf_counter()
+            interpreter.run(program)
+            report(
+                f"{n} functions lazy_functions={lazy_functions}",
+                interpreter.output_log.first_output - start,
+                f"{interpreter.loaded_functions} functions loaded",
+            )
+
+
+SCORE_PROGRAM = """
+func score(a, b) {
+  s = 0;
+  i = 0;
+  while (i < 10) {
+    if (a > b) { s = s + a - i; } else { s = s + b + i; }
+    i = i + 1;
+  }
+  return s;
+}
+func main() {
+  a = inputi();
+  b = inputi();
+  print(score(a, b));
+}
+"""
+
+
+@benchmark
+def bench_program_handle():
+    print("1000 requests to one program (run each time vs compile once)")
+    start = time.perf_counter()
+    for i in range(1000):
+        Interpreter(console_output=False, inp=[str(i), "7"]).run(SCORE_PROGRAM)
+    report("Interpreter.run per request", time.perf_counter() - start)
+    program = compile_program(SCORE_PROGRAM)
+    start = time.perf_counter()
+    for i in range(1000):
+        program.run_main([i, 7])
+    report("compile once, run_main per request", time.perf_counter() - start)
+    start = time.perf_counter()
+    for i in range(1000):
+        program.invoke("score", i, 7)
+    report("compile once, invoke per request", time.perf_counter() - start)
+
+
+@benchmark
+def bench_batch():
+    print("score over 2000 rows (run per row vs invoke per row vs one batch)")
+    rows = [(i, 7) for i in range(2000)]
+    start = time.perf_counter()
+    for a, b in rows:
+        Interpreter(console_output=False, inp=[str(a), str(b)]).run(SCORE_PROGRAM)
+    seconds = time.perf_counter() - start
+    report("Interpreter.run per row", seconds, f"{len(rows) / seconds:.0f} rows/s")
+    program = compile_program(SCORE_PROGRAM)
+    start = time.perf_counter()
+    for a, b in rows:
+        program.invoke("score", a, b)
+    seconds = time.perf_counter() - start
+    report("invoke per row", seconds, f"{len(rows) / seconds:.0f} rows/s")
+    start = time.perf_counter()
+    program.invoke_batch("score", rows)
+    seconds = time.perf_counter() - start
+    report("invoke_batch", seconds, f"{len(rows) / seconds:.0f} rows/s")
+
+
+SHORT_PROGRAMS = [
+    ONCE_PROGRAM,
+    "func main() { x = inputi(); print(x * 2); }",
+    "func main() { o = @; o.n = 3; o.f = lambda() { return this.n + 1; }; print(o.f()); }",
+    'func main() { s = "a"; s = s + "b"; if (s == "ab") { print(s); } }',
+]
+
+
+@benchmark
+def bench_pool():
+    print("short programs (new Interpreter per run vs pool)")
+    runs = 500
+    for label, programs in (("same program", SHORT_PROGRAMS[:1]), ("4 programs", SHORT_PROGRAMS)):
+        start = time.perf_counter()
+        for i in range(runs):
+            Interpreter(console_output=False, inp=["5"]).run(programs[i % len(programs)])
+        seconds = time.perf_counter() - start
+        report(f"{label}, new Interpreter", seconds, f"{runs / seconds:.0f} programs/s")
+        saved_tables = dict(Interpreter.OP_TABLES)
+        start = time.perf_counter()
+        for i in range(runs):
+            Interpreter.OP_TABLES.clear()
+            Interpreter(console_output=False, inp=["5"]).run(programs[i % len(programs)])
+        seconds = time.perf_counter() - start
+        Interpreter.OP_TABLES.update(saved_tables)
+        report(f"{label}, new Interpreter and op tables", seconds, f"{runs / seconds:.0f} programs/s")
+        pool = InterpreterPool()
+        start = time.perf_counter()
+        for i in range(runs):
+            pool.run(programs[i % len(programs)], ["5"])
+        seconds = time.perf_counter() - start
+        report(f"{label}, pool of {POOL_SIZE}", seconds, f"{runs / seconds:.0f} programs/s")
+
+
+PRINT_PROGRAM = """
+func main() {
+  i = 0;
+  while (i < %d) {
+    print("line ", i);
+    i = i + 1;
+  }
+}
+"""
+
+# 10M lines take roughly a minute per sink in this interpreter; raise this to
+# see the same memory pattern at that scale
+PRINTED_LINES = 100000
+
+
+# seconds to run consume() once, and its peak traced memory on a second run
+def time_and_peak(consume):
+    start = time.perf_counter()
+    consume()
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    consume()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak
+
+
+@benchmark
+def bench_output():
+    print(f"printing {PRINTED_LINES} lines (output_log vs output sinks)")
+    program = PRINT_PROGRAM % PRINTED_LINES
+    sinks = {
+        "output_log": lambda: None,
+        "CallbackSink": lambda: CallbackSink(lambda line: None),
+        "RingBufferSink": RingBufferSink,
+        "FileSink to os.devnull": lambda: FileSink(os.devnull),
+    }
+    for label, make_sink in sinks.items():
+        def consume():
+            sink = make_sink()
+            time_run(program, output_sink=sink)
+            if isinstance(sink, FileSink):
+                sink.close()
+
+        seconds, peak = time_and_peak(consume)
+        report(label, seconds, f"{PRINTED_LINES / seconds:.0f} lines/s, peak traced memory {peak / 1024:.0f} KiB")
+    seconds, peak = time_and_peak(lambda: sum(1 for _ in iter_output(program)))
+    report("iter_output", seconds, f"{PRINTED_LINES / seconds:.0f} lines/s, peak traced memory {peak / 1024:.0f} KiB")
+
+
+SUM_INPUT_PROGRAM = """
+func main() {
+  n = inputi();
+  s = 0;
+  i = 0;
+  while (i < n) {
+    s = s + inputi();
+    i = i + 1;
+  }
+  print(s);
+}
+"""
+
+INPUT_LINES = 100000
+
+
+@benchmark
+def bench_input():
+    print(f"summing {INPUT_LINES} input lines (inp list vs input providers)")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "input.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"{INPUT_LINES}\n")
+            for i in range(INPUT_LINES):
+                f.write(f"{i}\n")
+
+        def read_all_lines():
+            with open(path, encoding="utf-8") as f:
+                return time_run(SUM_INPUT_PROGRAM, inp=f.read().splitlines())
+
+        def stream_lines():
+            with open(path, encoding="utf-8") as f:
+                return time_run(SUM_INPUT_PROGRAM, input_provider=IteratorInput(line.rstrip("\n") for line in f))
+
+        providers = {
+            "inp list read up front": read_all_lines,
+            "IteratorInput over file lines": stream_lines,
+            "FileInput": lambda: time_run(SUM_INPUT_PROGRAM, input_provider=FileInput(path)),
+            "PrefetchInput(FileInput)": lambda: time_run(
+                SUM_INPUT_PROGRAM, input_provider=PrefetchInput(FileInput(path))
+            ),
+        }
+        for label, consume in providers.items():
+            seconds, peak = time_and_peak(consume)
+            report(label, seconds, f"peak traced memory {peak / 1024:.0f} KiB")
+
+
+ECHO_PROGRAM = """
+func main() {
+  n = inputi();
+  i = 0;
+  while (i < n) {
+    print(inputi() * 2);
+    i = i + 1;
+  }
+}
+"""
+
+
+# sends n numbers to an ECHO_PROGRAM session, delay seconds apart, and returns
+# the longest time an answer came later than it could have
+async def echo_client(lines, answers, n, delay):
+    await lines.put(str(n))
+    longest = 0
+    for i in range(n):
+        start = time.perf_counter()
+        await asyncio.sleep(delay)
+        await lines.put(str(i))
+        await answers.get()
+        longest = max(longest, time.perf_counter() - start - delay)
+    return longest
+
+
+def echo_session(yield_every=Interpreter.YIELD_EVERY):
+    lines, answers = asyncio.Queue(), asyncio.Queue()
+    interpreter = Interpreter(
+        input_provider=AsyncQueueInput(lines),
+        output_sink=AsyncQueueSink(answers),
+        yield_every=yield_every,
+    )
+    return interpreter.run_async(ECHO_PROGRAM), lines, answers
+
+
+@benchmark
+def bench_async():
+    print("asyncio sessions (run_async)")
+
+    async def many_sessions(count):
+        sessions = [echo_session() for _ in range(count)]
+        tasks = [asyncio.create_task(run) for run, _, _ in sessions]
+        await asyncio.gather(*(echo_client(lines, answers, 5, 0.001) for _, lines, answers in sessions))
+        await asyncio.gather(*tasks)
+
+    for count in (100, 1000):
+        start = time.perf_counter()
+        asyncio.run(many_sessions(count))
+        seconds = time.perf_counter() - start
+        report(f"{count} concurrent echo sessions", seconds, f"{count / seconds:.0f} sessions/s")
+
+    async def latency_next_to_cpu_work(yield_every):
+        busy = [
+            asyncio.create_task(
+                Interpreter(console_output=False, yield_every=yield_every).run_async(FIB_PROGRAM % 16)
+            )
+            for _ in range(4)
+        ]
+        run, lines, answers = echo_session(yield_every)
+        task = asyncio.create_task(run)
+        longest = await echo_client(lines, answers, 20, 0.005)
+        await asyncio.gather(task, *busy)
+        return longest
+
+    for yield_every in (100, Interpreter.YIELD_EVERY, 10**9):
+        start = time.perf_counter()
+        longest = asyncio.run(latency_next_to_cpu_work(yield_every))
+        report(
+            f"echo next to 4x fib(16), yield_every={yield_every}",
+            time.perf_counter() - start,
+            f"longest answer delay {longest * 1000:.1f} ms",
+        )
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def report_latency(label, samples):
+    print(
+        f"  {label:<40} p50 {percentile(samples, 50) * 1000:8.2f} ms"
+        f"  p99 {percentile(samples, 99) * 1000:8.2f} ms  ({len(samples)} requests)"
+    )
+
+
+# runs program in a new python process, as a program would be run without a
+# server
+def run_fresh_process(program):
+    code = "import sys; from interpreterv4 import Interpreter; Interpreter().run(sys.stdin.read())"
+    subprocess.run(
+        [sys.executable, "-c", code],
+        input=program,
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+
+
+@benchmark
+def bench_server():
+    print("request latency (fresh python process vs Unix socket server)")
+    samples = []
+    for _ in range(10):
+        start = time.perf_counter()
+        run_fresh_process(ONCE_PROGRAM)
+        samples.append(time.perf_counter() - start)
+    report_latency("fresh process per program", samples)
+    with tempfile.TemporaryDirectory() as tmp:
+        server = BrewinServer(os.path.join(tmp, "brewin.sock"), workers=4).start()
+        try:
+            samples = []
+            for _ in range(500):
+                start = time.perf_counter()
+                run_remote(server.path, ONCE_PROGRAM)
+                samples.append(time.perf_counter() - start)
+            report_latency("server, one client", samples)
+
+            samples = []
+
+            def client():
+                for i in range(100):
+                    start = time.perf_counter()
+                    run_remote(server.path, SHORT_PROGRAMS[i % len(SHORT_PROGRAMS)], ["5"])
+                    samples.append(time.perf_counter() - start)
+
+            clients = [threading.Thread(target=client) for _ in range(8)]
+            for thread in clients:
+                thread.start()
+            for thread in clients:
+                thread.join()
+            report_latency("server, 8 clients, 4 programs", samples)
+        finally:
+            server.close()
+
+
+# seconds from starting a new python process for program to its first line of
+# output
+def fresh_process_first_output(program):
+    code = "import sys; from interpreterv4 import Interpreter; Interpreter().run(sys.stdin.read())"
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-c", code],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    process.stdin.write(program)
+    process.stdin.close()
+    process.stdout.readline()
+    seconds = time.perf_counter() - start
+    process.stdout.read()
+    process.wait()
+    return seconds
+
+
+@benchmark
+def bench_fork_server():
+    print("spawn to first output (fresh python process vs fork server)")
+    samples = [fresh_process_first_output(ONCE_PROGRAM) for _ in range(10)]
+    report_latency("fresh process", samples)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "fork.sock")
+        process = start_fork_server(path)
+        try:
+            samples = []
+            for _ in range(200):
+                start = time.perf_counter()
+                messages = stream_remote(path, ONCE_PROGRAM)
+                next(messages)
+                samples.append(time.perf_counter() - start)
+                for _ in messages:
+                    pass
+            report_latency("fork server", samples)
+        finally:
+            process.terminate()
+            process.wait()
+
+
+@benchmark
+def bench_batch_runner():
+    jobs = [{"name": str(i), "program": FIB_PROGRAM % 16} for i in range(16)]
+    print(f"{len(jobs)} isolated fib(16) jobs by worker count ({os.cpu_count()} cores here)")
+    for workers in sorted({1, 2, 4, os.cpu_count()}):
+        start = time.perf_counter()
+        results = list(run_jobs(jobs, workers))
+        seconds = time.perf_counter() - start
+        assert all(r["status"] == "ok" for r in results)
+        report(f"workers={workers}", seconds, f"{len(jobs) / seconds:.1f} jobs/s")
+
+
+GOVERNED_PROGRAM = """
+func fib(n) {
+  if (n < 2) { return n; }
+  return fib(n - 1) + fib(n - 2);
+}
+func main() {
+  i = 0;
+  s = "";
+  while (i < 3000) {
+    o = @;
+    o.n = i;
+    s = s + "x";
+    if (i / 1000 * 1000 == i) { print(i); }
+    i = i + 1;
+  }
+  print(fib(18));
+}
+"""
+
+GOVERNOR_LIMITS = {
+    "max_steps": 10**9,
+    "max_objects_created": 10**6,
+    "max_output_bytes": 1 << 20,
+    "max_string_length": 1 << 20,
+}
+
+
+@benchmark
+def bench_governor():
+    print("resource governor overhead (best of 10 interleaved runs, no limits vs every limit)")
+    engines = [
+        ("tree walker", {"tiering": False}),
+        ("tiering", {}),
+        ("explicit_stack", {"explicit_stack": True}),
+        ("opt_level=2", {"opt_level": 2}),
+    ]
+    for label, options in engines:
+        times = {False: [], True: []}
+        for _ in range(10):
+            for governed in (False, True):
+                limits = GOVERNOR_LIMITS if governed else {}
+                times[governed].append(time_run(GOVERNED_PROGRAM, **options, **limits)[0])
+        plain, governed = min(times[False]), min(times[True])
+        report(label, plain, "no limits")
+        report(f"{label} governed", governed, f"{(governed / plain - 1) * 100:+.1f}%")
+    for steps in (10**4, 10**6):
+        start = time.perf_counter()
+        try:
+            time_run("func main() { while (true) { x = 1; } }", max_steps=steps)
+        except Exception as e:
+            message = str(e)
+        report(f"while (true) with max_steps={steps}", time.perf_counter() - start, message)
+
+def main(names):
+    for name in names or BENCHMARKS:
+        BENCHMARKS[name]()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
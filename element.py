@@ -1,6 +1,8 @@
 class Element:
     def __init__(self, elem_type, **kwargs):
         self.elem_type = elem_type
+        self.quick = None  # interpreter-specialized version of this node (or a literal's shared Value), if any
+        self.static_type = None  # type of this expression proven before running, if any
         self.dict = {}
         for key, value in kwargs.items():
             self.dict[key] = value
@@ -10,6 +12,27 @@ class Element:
             return None
         return self.dict[key]
 
+    # the AST isn't modified once parsed, so values that are deep-copied while
+    # holding on to nodes (e.g. closures) can share them rather than copy them
+    def __deepcopy__(self, memo):
+        return self
+
+    # yields the Element nodes directly below this one, in field order
+    def children(self):
+        for value in self.dict.values():
+            if isinstance(value, Element):
+                yield value
+            elif isinstance(value, list):
+                for item in value:
+                    if isinstance(item, Element):
+                        yield item
+
+    # yields this node and every node below it, in preorder
+    def walk(self):
+        yield self
+        for child in self.children():
+            yield from child.walk()
+
     def __str__(self):
         s = f"{self.elem_type}: "
         for key, value in self.dict.items():
@@ -1,54 +1,246 @@
-# The EnvironmentManager class keeps a mapping between each variable name (aka symbol)
-# in a brewin program and the Value object, which stores a type, and a value.
-class EnvironmentManager:
-    def __init__(self):
-        self.environment = [{}]
-
-    # returns a VariableDef object
-    def get(self, symbol):
-        for env in reversed(self.environment):
-            if symbol in env:
-                return env[symbol]
-
-        return None
-
-    def set(self, symbol, value, force_new_var_creation=False):
-        if force_new_var_creation:
-            self.environment[-1][symbol] = value
-            return
-
-        for env in reversed(self.environment):
-            if symbol in env:
-                env[symbol] = value
-                return
-
-        # symbol not found anywhere in the environment
-        self.environment[-1][symbol] = value
-
-    # create a new symbol in the top-most environment, regardless of whether that symbol exists
-    # in a lower environment
-    def create(self, symbol, value):
-        self.environment[-1][symbol] = value
-
-    # used when we enter a nested block to create a new environment for that block
-    def push(self, env = None):
-        if env is None:
-            self.environment.append({})  # [{}] -> [{}, {}]
-        else:
-            self.environment.append(env)
-
-    # used when we exit a nested block to discard the environment for that block
-    def pop(self):
-        self.environment.pop()
-
-    def __enumerate(self):
-        captured_so_far = set()
-        for captured in reversed(self.environment):
-            for var_name, value in captured.items():
-                if var_name in captured_so_far:
-                    continue
-                captured_so_far.add(var_name)
-                yield (var_name, value)
-
-    def __iter__(self):
-        return self.__enumerate()
\ No newline at end of file
+import copy
+import itertools
+import weakref
+
+from hamt_v4 import EMPTY
+from type_value_v4 import SharedValue, Type
+
+
+# The EnvironmentManager class keeps a mapping between each variable name (aka symbol)
+# in a brewin program and the Value object, which stores a type, and a value.
+class EnvironmentManager:
+    def __init__(self):
+        self.environment = [{}]
+
+    # returns a VariableDef object
+    def get(self, symbol):
+        for env in reversed(self.environment):
+            if symbol in env:
+                return env[symbol]
+
+        return None
+
+    def set(self, symbol, value, force_new_var_creation=False):
+        if force_new_var_creation:
+            self.environment[-1][symbol] = value
+            return
+
+        for env in reversed(self.environment):
+            if symbol in env:
+                env[symbol] = value
+                return
+
+        # symbol not found anywhere in the environment
+        self.environment[-1][symbol] = value
+
+    # create a new symbol in the top-most environment, regardless of whether that symbol exists
+    # in a lower environment
+    def create(self, symbol, value):
+        self.environment[-1][symbol] = value
+
+    # used when we enter a nested block to create a new environment for that block
+    def push(self, env = None):
+        if env is None:
+            self.environment.append({})  # [{}] -> [{}, {}]
+        else:
+            self.environment.append(env)
+
+    # used when we exit a nested block to discard the environment for that block
+    def pop(self):
+        self.environment.pop()
+
+    # a manager that starts out seeing the same variables, but whose pushes and
+    # pops don't affect this one
+    def fork(self):
+        forked = EnvironmentManager()
+        forked.environment = list(self.environment)
+        return forked
+
+    # a copy of every scope for a closure, with each value passed through
+    # copy_value
+    def capture(self, copy_value):
+        captured = EnvironmentManager()
+        for sub_env in self.environment:
+            captured.push({var: copy_value(value) for var, value in sub_env.items()})
+        return captured
+
+    # adds the captured variables to scope, the dict of a call's new scope
+    def bind(self, scope):
+        for var_name, value in self:
+            scope[var_name] = value
+
+    def __enumerate(self):
+        captured_so_far = set()
+        for captured in reversed(self.environment):
+            for var_name, value in captured.items():
+                if var_name in captured_so_far:
+                    continue
+                captured_so_far.add(var_name)
+                yield (var_name, value)
+
+    def __iter__(self):
+        return self.__enumerate()
+
+
+# The same interface, backed by a persistent map (see hamt_v4.py) of the
+# variables visible from the innermost scope rather than a list of dicts, for
+# deep (dynamically scoped) call stacks: get is a single map lookup however many
+# scopes there are, push and pop save and restore the map, fork shares it, and
+# capture shares it with the closure (see CapturedEnvironment). Each variable is
+# held in a one-element list, so that setting an existing variable updates it
+# in every version of the map that has it, as updating a dict would.
+class PersistentEnvironmentManager:
+    def __init__(self, bindings=EMPTY, captures=None):
+        self.bindings = bindings
+        self.saved = []
+        self.captures = _Captures() if captures is None else captures
+
+    def get(self, symbol):
+        cell = self.bindings.get(symbol)
+        if cell is None:
+            return None
+        if self.captures.waiting:
+            self.captures.preserve(cell[0])
+        return cell[0]
+
+    def set(self, symbol, value, force_new_var_creation=False):
+        if not force_new_var_creation:
+            cell = self.bindings.get(symbol)
+            if cell is not None:
+                self.captures.materialize_all()
+                cell[0] = value
+                return
+        self.bindings = self.bindings.set(symbol, [value])
+
+    def create(self, symbol, value):
+        self.bindings = self.bindings.set(symbol, [value])
+
+    def push(self, env=None):
+        self.saved.append(self.bindings)
+        if env is not None:
+            for symbol, value in env.items():
+                self.bindings = self.bindings.set(symbol, [value])
+
+    def pop(self):
+        self.bindings = self.saved.pop()
+
+    def fork(self):
+        return PersistentEnvironmentManager(self.bindings, self.captures)
+
+    def capture(self, copy_value):
+        return CapturedEnvironment(self.bindings, copy_value, self.captures)
+
+    def __iter__(self):
+        for symbol, cell in self.bindings.items():
+            if self.captures.waiting:
+                self.captures.preserve(cell[0])
+            yield (symbol, cell[0])
+
+
+# Closures capture a PersistentEnvironmentManager in O(1): the closure keeps the
+# map as it was, and only copies the variables (each through copy_value) when it
+# is first called or copied, which is when it is materialized. Values are
+# updated in place, through any variable that holds them (ref parameters alias
+# them), so until then every Value that is read from the manager, and so might
+# be about to be updated, is first preserved: the closures waiting to be
+# materialized that were captured since it was last preserved keep a copy of it
+# to use in its place. At most CAPTURE_WINDOW closures wait; capturing another
+# materializes the oldest, so a read checks at most that many.
+#
+# Once materialized, copies of the closure (arguments are passed by deep copy)
+# share its copies of the variables until one of them is called, unless those
+# include objects or closures, which are deep-copied right away since they can
+# change through other references.
+CAPTURE_WINDOW = 8
+
+_clock = itertools.count(1)
+
+
+class _Captures:
+    def __init__(self):
+        self.waiting = []  # weak references to unmaterialized closures, oldest first
+        self.epoch = 0  # when the latest of them was captured
+
+    def add(self, captured):
+        self.waiting = [r for r in self.waiting if _unmaterialized(r) is not None]
+        if len(self.waiting) == CAPTURE_WINDOW:
+            self.waiting.pop(0)().materialize()
+        captured.epoch = self.epoch = next(_clock)
+        self.waiting.append(weakref.ref(captured))
+
+    def preserve(self, value):
+        if type(value) is SharedValue or getattr(value, "preserved", 0) >= self.epoch:
+            return
+        preserved = getattr(value, "preserved", 0)
+        copy_of_value = None
+        for ref in self.waiting:
+            captured = _unmaterialized(ref)
+            if captured is not None and captured.epoch > preserved:
+                if copy_of_value is None:
+                    copy_of_value = captured.copy_value(value)
+                captured.frozen.setdefault(id(value), (value, copy_of_value))
+        value.preserved = self.epoch
+
+    def materialize_all(self):
+        for ref in self.waiting:
+            captured = _unmaterialized(ref)
+            if captured is not None:
+                captured.materialize()
+        self.waiting = []
+
+
+def _unmaterialized(ref):
+    captured = ref()
+    if captured is None or captured.values is not None:
+        return None
+    return captured
+
+
+class CapturedEnvironment:
+    def __init__(self, bindings, copy_value, captures):
+        self.bindings = bindings
+        self.copy_value = copy_value
+        self.frozen = {}  # id of a Value updated since -> (the Value, its copy)
+        self.values = None  # the variables, once materialized
+        self.sharers = [1]  # how many closures share values
+        self.epoch = 0
+        captures.add(self)
+
+    def materialize(self):
+        values = {}
+        for symbol, cell in self.bindings.items():
+            frozen = self.frozen.get(id(cell[0]))
+            values[symbol] = self.copy_value(cell[0] if frozen is None else frozen[1])
+        self.values = values
+        self.bindings = self.frozen = None
+
+    # adds the captured variables to scope, the dict of a call's new scope
+    def bind(self, scope):
+        if self.values is None:
+            self.materialize()
+        elif self.sharers[0] > 1:
+            self.sharers[0] -= 1
+            self.values = {symbol: copy.deepcopy(v) for symbol, v in self.values.items()}
+            self.sharers = [1]
+        scope.update(self.values)
+
+    def __deepcopy__(self, memo):
+        if self.values is None:
+            self.materialize()
+        copied = CapturedEnvironment.__new__(CapturedEnvironment)
+        copied.bindings = copied.frozen = None
+        copied.copy_value = self.copy_value
+        copied.epoch = self.epoch
+        if any(v.t is Type.OBJECT or v.t is Type.CLOSURE for v in self.values.values()):
+            copied.values = copy.deepcopy(self.values, memo)
+            copied.sharers = [1]
+        else:
+            copied.values = self.values
+            self.sharers[0] += 1
+            copied.sharers = self.sharers
+        return copied
+
+    def __iter__(self):
+        if self.values is None:
+            self.materialize()
+        return iter(self.values.items())
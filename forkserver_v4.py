@@ -0,0 +1,108 @@
+# Fork server for running each v4 program in a process of its own
+#
+# Running every program in a new python process isolates programs from each
+# other, but each process pays for starting python, importing the interpreter
+# and building the parser. ForkServer pays for them once, in a template
+# process: it imports everything, runs a warm-up program so that the parser
+# and the shared operation tables are built, and then calls gc.freeze(), so
+# that garbage collection in the children doesn't write to (and so copy) the
+# memory they share with the template. It then listens on a Unix domain socket
+# and forks a child for every connection, which runs the program and exits.
+#
+# Requests and replies are those of server_v4.py, so run_remote and
+# stream_remote work with a fork server as well, and programs only read the
+# inputs they were sent, never the fork server's stdin. Unlike BrewinServer,
+# a fork server keeps nothing between programs, and a program that crashes or
+# is killed only takes its own process with it.
+#
+# python forkserver_v4.py PATH
+import gc
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+from inputs_v4 import IteratorInput
+from interpreterv4 import Interpreter
+from server_v4 import recv_request, send_frame
+from sinks_v4 import CallbackSink
+
+WARM_UP_PROGRAM = """
+func f(n) { if (n < 1) { return "done"; } return f(n - 1); }
+func main() { o = @; o.x = 1 + 2 * 3 == 7 && !false; print(f(3), o.x); }
+"""
+
+
+class ForkServer:
+    def __init__(self, path, **options):
+        self.path = path
+        self.options = options
+        self.options.setdefault("console_output", False)
+        Interpreter(**self.options).run(WARM_UP_PROGRAM)
+        # the socket only appears at path once it accepts connections
+        bind_path = path + ".tmp"
+        if os.path.exists(bind_path):
+            os.unlink(bind_path)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(bind_path)
+        self.listener.listen()
+        os.replace(bind_path, path)
+        gc.collect()
+        gc.freeze()
+
+    def serve_forever(self):
+        signal.signal(signal.SIGCHLD, signal.SIG_IGN)  # children are reaped automatically
+        while True:
+            conn, _ = self.listener.accept()
+            if os.fork() == 0:
+                self.listener.close()
+                status = 0
+                try:
+                    with conn:
+                        self.__serve(conn)
+                except BaseException:
+                    status = 1
+                os._exit(status)
+            conn.close()
+
+    def __serve(self, conn):
+        request = recv_request(conn)
+        if request is None:
+            return
+        program, inputs = request
+        sink = CallbackSink(lambda line: send_frame(conn, {"output": line}))
+        interpreter = Interpreter(
+            output_sink=sink, input_provider=IteratorInput(inputs), **self.options
+        )
+        try:
+            interpreter.run(program)
+        except OSError:
+            raise
+        except Exception as e:
+            send_frame(conn, {"error": str(e)})
+            return
+        send_frame(conn, {"done": True})
+
+
+# starts a fork server listening at path in a new process, and returns the
+# process once the server is accepting connections
+def start_fork_server(path, timeout=30):
+    if os.path.exists(path):
+        os.unlink(path)
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), path],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(path):
+        if process.poll() is not None or time.monotonic() > deadline:
+            process.kill()
+            raise RuntimeError(f"fork server at {path} didn't start")
+        time.sleep(0.01)
+    return process
+
+
+if __name__ == "__main__":
+    ForkServer(sys.argv[1]).serve_forever()
@@ -0,0 +1,120 @@
+# Persistent hash array mapped trie
+#
+# HamtMap is an immutable mapping: set returns a new map that shares every node
+# with the old one except those on the path to the changed key, so keeping old
+# versions around costs nothing and making a new one costs O(log32 n). Each
+# node covers 5 bits of the key's hash; its bitmap has a bit set for every
+# occupied slot, and its entries list holds, in slot order, either a (key,
+# value) pair or the child node for keys that share those bits. Keys whose
+# hashes are equal in all 64 bits end up in a _Collision list.
+BITS = 5
+MASK = (1 << BITS) - 1
+HASH_MASK = (1 << 64) - 1
+MAX_SHIFT = 64
+
+
+class _Node:
+    __slots__ = ("bitmap", "entries")
+
+    def __init__(self, bitmap, entries):
+        self.bitmap = bitmap
+        self.entries = entries
+
+
+class _Collision:
+    __slots__ = ("pairs",)
+
+    def __init__(self, pairs):
+        self.pairs = pairs
+
+
+def _hash(key):
+    return hash(key) & HASH_MASK
+
+
+def _assoc(node, shift, h, key, value):
+    bit = 1 << ((h >> shift) & MASK)
+    index = (node.bitmap & (bit - 1)).bit_count()
+    entries = list(node.entries)
+    if not node.bitmap & bit:
+        entries.insert(index, (key, value))
+        return _Node(node.bitmap | bit, entries), True
+    entry = entries[index]
+    if type(entry) is tuple:
+        if entry[0] == key:
+            entries[index] = (key, value)
+            return _Node(node.bitmap, entries), False
+        entries[index] = _split(shift + BITS, entry, (h, key, value))
+        return _Node(node.bitmap, entries), True
+    if type(entry) is _Collision:
+        pairs = [p for p in entry.pairs if p[0] != key]
+        added = len(pairs) == len(entry.pairs)
+        entries[index] = _Collision(pairs + [(key, value)])
+        return _Node(node.bitmap, entries), added
+    entries[index], added = _assoc(entry, shift + BITS, h, key, value)
+    return _Node(node.bitmap, entries), added
+
+
+# the node holding an existing pair and a new key that share the hash bits so far
+def _split(shift, pair, new):
+    h, key, value = new
+    if shift >= MAX_SHIFT:
+        return _Collision([pair, (key, value)])
+    node, _ = _assoc(_Node(0, []), shift, _hash(pair[0]), pair[0], pair[1])
+    node, _ = _assoc(node, shift, h, key, value)
+    return node
+
+
+def _items(node):
+    for entry in node.entries:
+        if type(entry) is tuple:
+            yield entry
+        elif type(entry) is _Collision:
+            yield from entry.pairs
+        else:
+            yield from _items(entry)
+
+
+class HamtMap:
+    __slots__ = ("root", "size")
+
+    def __init__(self, root=None, size=0):
+        self.root = root if root is not None else _Node(0, [])
+        self.size = size
+
+    def get(self, key, default=None):
+        h = _hash(key)
+        node = self.root
+        shift = 0
+        while True:
+            bit = 1 << ((h >> shift) & MASK)
+            if not node.bitmap & bit:
+                return default
+            entry = node.entries[(node.bitmap & (bit - 1)).bit_count()]
+            if type(entry) is tuple:
+                return entry[1] if entry[0] == key else default
+            if type(entry) is _Collision:
+                for k, v in entry.pairs:
+                    if k == key:
+                        return v
+                return default
+            node = entry
+            shift += BITS
+
+    # a new map in which key is bound to value
+    def set(self, key, value):
+        root, added = _assoc(self.root, 0, _hash(key), key, value)
+        return HamtMap(root, self.size + added)
+
+    def items(self):
+        return _items(self.root)
+
+    def __contains__(self, key):
+        sentinel = _Collision
+        return self.get(key, sentinel) is not sentinel
+
+    def __len__(self):
+        return self.size
+
+
+EMPTY = HamtMap()
@@ -0,0 +1,134 @@
+# Input providers for the v4 interpreter
+#
+# By default inputi reads from the interpreter's inp list, which has to hold
+# all of the input up front, or calls input() once per line. An Interpreter
+# given an input_provider asks its read_line for each line instead. read_line
+# returns the line without its line break, or None at the end of the input,
+# which is what an exhausted inp list gives.
+#
+#   IteratorInput   takes lines from any iterable, e.g. a generator
+#   FileInput       reads a file (or stdin, see stdin_input) chunk_size bytes
+#                   at a time and splits them into lines, rather than making a
+#                   read per line; only one chunk is held at a time. Text
+#                   streams without a binary buffer, e.g. io.StringIO, are
+#                   read chunk_size characters at a time
+#   PrefetchInput   reads ahead from another provider in a background thread,
+#                   so that slow reads overlap with running the program; the
+#                   thread is a daemon, left waiting if the program stops
+#                   reading early
+#   AsyncQueueInput takes lines from an asyncio.Queue; under run_async,
+#                   inputi awaits the next line (None ends the input)
+from collections import deque
+import io
+import queue
+import sys
+import threading
+
+CHUNK_SIZE = 1 << 16
+PREFETCH_LINES = 4096
+PREFETCH_BATCH = 256
+
+
+class IteratorInput:
+    def __init__(self, lines):
+        self.lines = iter(lines)
+
+    def read_line(self):
+        line = next(self.lines, None)
+        return None if line is None else str(line)
+
+
+# file is a path, which is opened (and closed by close), or an open file; text
+# files are read through their underlying binary buffer if they have one
+class FileInput:
+    def __init__(self, file, chunk_size=CHUNK_SIZE, encoding="utf-8"):
+        self.owns_file = isinstance(file, str)
+        if self.owns_file:
+            file = open(file, "rb")
+        self.file = getattr(file, "buffer", file)
+        # read1 returns what is already available instead of waiting for a full
+        # chunk, which matters for interactive stdin
+        self.read = getattr(self.file, "read1", self.file.read)
+        self.chunk_size = chunk_size
+        self.encoding = encoding
+        self.text = isinstance(self.file, io.TextIOBase)
+        self.newline = "\n" if self.text else b"\n"
+        self.lines = deque()
+        self.partial = self.newline[:0]
+
+    def read_line(self):
+        while not self.lines:
+            chunk = self.read(self.chunk_size)
+            if not chunk:
+                if not self.partial:
+                    return None
+                line, self.partial = self.partial, self.partial[:0]
+                return self.__decode(line)
+            lines = (self.partial + chunk).split(self.newline)
+            self.partial = lines.pop()
+            self.lines.extend(lines)
+        return self.__decode(self.lines.popleft())
+
+    def __decode(self, line):
+        if not self.text:
+            line = line.decode(self.encoding)
+        return line.rstrip("\r")
+
+    def close(self):
+        if self.owns_file:
+            self.file.close()
+
+
+def stdin_input(chunk_size=CHUNK_SIZE):
+    return FileInput(sys.stdin, chunk_size)
+
+
+class PrefetchInput:
+    def __init__(self, provider, prefetch_lines=PREFETCH_LINES):
+        # lines travel in batches, so the queue isn't touched once per line
+        self.queue = queue.Queue(max(1, prefetch_lines // PREFETCH_BATCH))
+        self.batch = deque()
+        self.done = False
+        self.error = None
+        self.thread = threading.Thread(target=self.__prefetch, args=(provider,), daemon=True)
+        self.thread.start()
+
+    def __prefetch(self, provider):
+        batch = []
+        try:
+            while True:
+                line = provider.read_line()
+                if line is None:
+                    break
+                batch.append(line)
+                if len(batch) == PREFETCH_BATCH:
+                    self.queue.put(batch)
+                    batch = []
+        except Exception as e:
+            self.error = e
+        self.queue.put(batch)
+        self.queue.put(None)
+
+    def read_line(self):
+        while not self.batch:
+            if self.done:
+                return None
+            batch = self.queue.get()
+            if batch is None:
+                self.done = True
+                if self.error is not None:
+                    raise self.error
+            else:
+                self.batch.extend(batch)
+        return self.batch.popleft()
+
+
+class AsyncQueueInput:
+    def __init__(self, lines):
+        self.lines = lines
+
+    async def read_line_async(self):
+        return await self.lines.get()
+
+    def read_line(self):
+        return self.lines.get_nowait()
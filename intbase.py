@@ -6,6 +6,7 @@ class ErrorType(Enum):
     TYPE_ERROR = 1
     NAME_ERROR = 2  # if a variable or function name can't be found
     FAULT_ERROR = 3  # used if an object reference is null and used to make a call
+    RESOURCE_ERROR = 4  # used if a program exceeds a configured limit (e.g. call depth)
     # Add others here
 
 
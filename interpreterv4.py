@@ -1,523 +1,2104 @@
-import copy
-from enum import Enum
-
-from brewparse import parse_program
-from env_v4 import EnvironmentManager
-from intbase import InterpreterBase, ErrorType
-from type_value_v4 import Closure, Object, Type, Value, create_value, get_printable
-
-
-class ExecStatus(Enum):
-    CONTINUE = 1
-    RETURN = 2
-
-
-# Main interpreter class
-class Interpreter(InterpreterBase):
-    # constants
-    NIL_VALUE = create_value(InterpreterBase.NIL_DEF)
-    TRUE_VALUE = create_value(InterpreterBase.TRUE_DEF)
-    BIN_OPS = {"+", "-", "*", "/", "==", "!=", ">", ">=", "<", "<=", "||", "&&"}
-
-    # methods
-    def __init__(self, console_output=True, inp=None, trace_output=False):
-        super().__init__(console_output, inp)
-        self.trace_output = trace_output
-        self.__setup_ops()
-
-    # run a program that's provided in a string
-    # usese the provided Parser found in brewparse.py to parse the program
-    # into an abstract syntax tree (ast)
-    def run(self, program):
-        ast = parse_program(program)
-        self.__set_up_function_table(ast)
-        self.env = EnvironmentManager()
-        main_func = self.__get_func_by_name("main", 0)
-        if main_func is None:
-            super().error(ErrorType.NAME_ERROR, f"Function {name} not found")
-        self.current_val_object_mcall = []
-        self.__run_statements(main_func.func_ast.get("statements"))
-
-    def __set_up_function_table(self, ast):
-        self.func_name_to_ast = {}
-        empty_env = EnvironmentManager()
-        for func_def in ast.get("functions"):
-            func_name = func_def.get("name")
-            num_params = len(func_def.get("args"))
-            if func_name not in self.func_name_to_ast:
-                self.func_name_to_ast[func_name] = {}
-            self.func_name_to_ast[func_name][num_params] = Closure(func_def, empty_env)
-
-    def __get_func_by_name(self, name, num_params):
-        if name not in self.func_name_to_ast:
-            closure_val_obj = self.env.get(name)
-            if closure_val_obj is None:
-                return None
-                # super().error(ErrorType.NAME_ERROR, f"Function {name} not found")
-            if closure_val_obj.type() != Type.CLOSURE:
-                super().error(
-                    ErrorType.TYPE_ERROR, "Trying to call function with non-closure"
-                )
-            closure = closure_val_obj.value()
-            num_formal_params = len(closure.func_ast.get("args"))
-            if num_formal_params != num_params:
-                super().error(ErrorType.TYPE_ERROR, "Invalid # of args to lambda")
-            return closure_val_obj.value()
-
-        candidate_funcs = self.func_name_to_ast[name]
-        if num_params is None:
-            # case where we want assign variable to func_name and we don't have
-            # a way to specify the # of arguments for the function, so we generate
-            # an error if there's more than one function with that name
-            if len(candidate_funcs) > 1:
-                super().error(
-                    ErrorType.NAME_ERROR,
-                    f"Function {name} has multiple overloaded versions",
-                )
-            num_args = next(iter(candidate_funcs))
-            closure = candidate_funcs[num_args]
-            return closure
-
-        if num_params not in candidate_funcs:
-            super().error(
-                ErrorType.NAME_ERROR,
-                f"Function {name} taking {num_params} params not found",
-            )
-        return candidate_funcs[num_params]
-
-    def __run_statements(self, statements):
-        self.env.push()
-        for statement in statements:
-            if self.trace_output:
-                print(statement)
-            status = ExecStatus.CONTINUE
-            if statement.elem_type == InterpreterBase.FCALL_DEF:
-                self.__call_func(statement)
-            elif statement.elem_type == InterpreterBase.MCALL_DEF:
-                self.__call_func(statement)
-            elif statement.elem_type == "=":
-                self.__assign(statement)
-            elif statement.elem_type == InterpreterBase.RETURN_DEF:
-                status, return_val = self.__do_return(statement)
-            elif statement.elem_type == Interpreter.IF_DEF:
-                status, return_val = self.__do_if(statement)
-            elif statement.elem_type == Interpreter.WHILE_DEF:
-                status, return_val = self.__do_while(statement)
-
-            if status == ExecStatus.RETURN:
-                self.env.pop()
-                return (status, return_val)
-
-        self.env.pop()
-        return (ExecStatus.CONTINUE, Interpreter.NIL_VALUE)
-
-
-    def __call_func(self, call_ast):
-        func_name = call_ast.get("name")
-        if func_name == "print" and call_ast.elem_type == "fcall":
-            return self.__call_print(call_ast)
-        if func_name == "inputi" and call_ast.elem_type == "fcall":
-            return self.__call_input(call_ast)
-
-        actual_args = call_ast.get("args")
-        if call_ast.get('objref'):
-            object_name = call_ast.get('objref')
-            object_val = self.env.get(object_name) or self.current_val_object_mcall[-1]
-            if object_val == None:
-                super().error(ErrorType.NAME_ERROR, f"Object {object_name} has not been defined")
-            if object_val != None and object_val.type() != Type.OBJECT:
-                super().error(ErrorType.TYPE_ERROR, f"{func_name} is not an object method.")
-            self.current_val_object_mcall.append(object_val)
-            target_closure = object_val.v.get(func_name)
-            #while object_val.v.proto.type() != Type.NIL and target_closure == None:
-            while object_val.v.proto != None and target_closure == None and  object_val.v.proto.type() != Type.NIL:
-                object_val = object_val.v.proto
-                target_closure = object_val.v.get(func_name)
-            if target_closure == None:
-                if func_name == "proto" and self.current_val_object_mcall[-1].v.proto:
-                    super().error(ErrorType.TYPE_ERROR, f"{func_name} is a non-closure.")
-                super().error(ErrorType.NAME_ERROR, f"{func_name} is not a defined method.")
-            if target_closure.type() != Type.CLOSURE:
-                super().error(ErrorType.TYPE_ERROR, f"{func_name} is an object field but not a function.")
-            target_closure = target_closure.value()
-        else:
-            target_closure = self.__get_func_by_name(func_name, len(actual_args))
-        if target_closure == None:
-            if func_name == "this":
-                super().error(ErrorType.TYPE_ERROR, f"this may not be called as a function.")
-            super().error(ErrorType.NAME_ERROR, f"Function {func_name} not found")
-        if target_closure.type != Type.CLOSURE:
-            super().error(ErrorType.TYPE_ERROR, f"Function {func_name} is changed to non-function type.")
-        target_ast = target_closure.func_ast
-
-        new_env = {}
-        self.__prepare_env_with_closed_variables(target_closure, new_env)
-        self.__prepare_params(target_ast,call_ast, new_env)
-        self.env.push(new_env)
-        _, return_val = self.__run_statements(target_ast.get("statements"))
-        self.env.pop()
-        if call_ast.get('objref'):
-            self.current_val_object_mcall.pop(-1)
-        return return_val
-
-    def __prepare_env_with_closed_variables(self, target_closure, temp_env):
-        for var_name, value in target_closure.captured_env:
-            # Updated here - ignore updates to the scope if we
-            #   altered a parameter, or if the argument is a similarly named variable
-            temp_env[var_name] = value
-
-
-    def __prepare_params(self, target_ast, call_ast, temp_env):
-        actual_args = call_ast.get("args")
-        formal_args = target_ast.get("args")
-        if len(actual_args) != len(formal_args):
-            super().error(
-                ErrorType.NAME_ERROR,
-                f"Function {target_ast.get('name')} with {len(actual_args)} args not found",
-            )
-
-        for formal_ast, actual_ast in zip(formal_args, actual_args):
-            if formal_ast.elem_type == InterpreterBase.REFARG_DEF:
-                #formal_ast.elem_type == InterpreterBase.LAMBDA_DEF or \
-                #formal_ast.elem_type == InterpreterBase.OBJ_DEF:
-                result = self.__eval_expr(actual_ast)
-            else:
-                result = copy.deepcopy(self.__eval_expr(actual_ast))
-            arg_name = formal_ast.get("name")
-            temp_env[arg_name] = result
-
-    def __call_print(self, call_ast):
-        output = ""
-        for arg in call_ast.get("args"):
-            result = self.__eval_expr(arg)  # result is a Value object
-            output = output + get_printable(result)
-        super().output(output)
-        return Interpreter.NIL_VALUE
-
-    def __call_input(self, call_ast):
-        args = call_ast.get("args")
-        if args is not None and len(args) == 1:
-            result = self.__eval_expr(args[0])
-            super().output(get_printable(result))
-        elif args is not None and len(args) > 1:
-            super().error(
-                ErrorType.NAME_ERROR, "No inputi() function that takes > 1 parameter"
-            )
-        inp = super().get_input()
-        if call_ast.get("name") == "inputi":
-            return Value(Type.INT, int(inp))
-        if call_ast.get("name") == "inputs":
-            return Value(Type.STRING, inp)
-
-    def __assign(self, assign_ast):
-        var_name = assign_ast.get("name")
-        src_value_obj = copy.copy(self.__eval_expr(assign_ast.get("expression")))
-        if var_name == "this":  # Handles the case that this is used inside a method
-            target_value_obj = self.current_val_object_mcall[-1]
-            target_value_obj.set(src_value_obj)
-        target_value_obj = self.env.get(var_name)
-        if("." in var_name): # Variable belongs to an object
-            period_index = var_name.index(".")
-            if var_name[0:period_index] == "this":  # Handling before the "."
-                object_var = self.current_val_object_mcall[-1]
-            else:
-                object_var = self.env.get(var_name[0:period_index])
-            if object_var == None:  # Ensures that the object exists
-                super().error(ErrorType.NAME_ERROR, f"The object on the left-hand side of the assignment doesn't exist.")
-            if var_name[period_index+1:] == "proto":    # Handling after the "."
-                if src_value_obj.type() != Type.OBJECT and src_value_obj.type() != Type.NIL:
-                    super().error(ErrorType.TYPE_ERROR, f"A non-object cannot be a prototype object.")
-                elif src_value_obj.type() == Type.NIL:
-                    object_var.v.set_proto(Value(Type.NIL, None))
-                else:
-                    object_var.v.set_proto(src_value_obj)
-            if object_var != None and object_var.type() != Type.OBJECT:
-                super().error(ErrorType.TYPE_ERROR, f"A non-object cannot use a dot operator.")
-            else:
-                object_var.v.set(var_name[period_index+1:], src_value_obj)
-        elif target_value_obj is None:
-            self.env.set(var_name, src_value_obj)
-        else:
-            # if a close is changed to another type such as int, we cannot make function calls on it any more 
-            if target_value_obj.t == Type.CLOSURE and src_value_obj.t != Type.CLOSURE:
-                target_value_obj.v.type = src_value_obj.t
-            target_value_obj.set(src_value_obj)
-
-    def __eval_expr(self, expr_ast):
-        if expr_ast.elem_type == InterpreterBase.NIL_DEF:
-            #return Interpreter.NIL_VALUE
-            return Value(Type.NIL, None)
-        if expr_ast.elem_type == InterpreterBase.INT_DEF:
-            return Value(Type.INT, expr_ast.get("val"))
-        if expr_ast.elem_type == InterpreterBase.STRING_DEF:
-            return Value(Type.STRING, expr_ast.get("val"))
-        if expr_ast.elem_type == InterpreterBase.BOOL_DEF:
-            return Value(Type.BOOL, expr_ast.get("val"))
-        if expr_ast.elem_type == InterpreterBase.VAR_DEF:
-            return self.__eval_name(expr_ast)
-        if expr_ast.elem_type == InterpreterBase.FCALL_DEF:
-            return self.__call_func(expr_ast)
-        if expr_ast.elem_type == InterpreterBase.MCALL_DEF:
-            return self.__call_func(expr_ast)
-        if expr_ast.elem_type == InterpreterBase.OBJ_DEF:
-            return Value(Type.OBJECT, Object())
-        if expr_ast.elem_type in Interpreter.BIN_OPS:
-            return self.__eval_op(expr_ast)
-        if expr_ast.elem_type == Interpreter.NEG_DEF:
-            return self.__eval_unary(expr_ast, Type.INT, lambda x: -1 * x)
-        if expr_ast.elem_type == Interpreter.NOT_DEF:
-            return self.__eval_unary(expr_ast, Type.BOOL, lambda x: not x)
-        if expr_ast.elem_type == Interpreter.LAMBDA_DEF:
-            return Value(Type.CLOSURE, Closure(expr_ast, self.env))
-
-    def __eval_name(self, name_ast):
-        var_name = name_ast.get("name")
-        if var_name == "this" and len(self.current_val_object_mcall) != 0 and self.current_val_object_mcall[-1]:
-            val = self.current_val_object_mcall[-1]
-        elif("." in var_name): # Variable belongs to an object
-            period_index = var_name.index(".")
-            if var_name[0:period_index] == "this":  # Handling before the "."
-                if len(self.current_val_object_mcall) == 0:
-                    super().error(ErrorType.NAME_ERROR, f"{var_name} is not referencing an object")
-                object_var = self.current_val_object_mcall[-1]
-            else:
-                object_var = self.env.get(var_name[0:period_index])
-            if object_var != None and object_var.type() != Type.OBJECT:
-                super().error(ErrorType.TYPE_ERROR, f"{var_name} is not an object.")
-            elif object_var == None:
-                super().error(ErrorType.NAME_ERROR, f"{var_name} is not referencing an object")
-            val = object_var.v.get(var_name[period_index+1:])
-            if var_name[period_index+1:] == "proto":    # Handles cases were the proto needs to be accessed
-                val = object_var.v.proto
-                if val == None:
-                    super().error(ErrorType.NAME_ERROR, f"{var_name} is not a variable in the object.")
-                #if val.type() == Type.NIL:
-                #    val = None
-            #while object_var.v.proto.type() != Type.NIL and val == None:
-            while object_var.v.proto != None and val == None and object_var.v.proto.type() != Type.NIL:
-                object_var = object_var.v.proto
-                val = object_var.v.get(var_name[period_index+1:])
-            if val == None:
-                super().error(ErrorType.NAME_ERROR, f"{var_name} is not a variable in the object.")
-            return val
-        else:
-            val = self.env.get(var_name)
-        if val is not None:
-            return val
-        closure = self.__get_func_by_name(var_name, None)
-        if closure is None:
-            super().error(ErrorType.NAME_ERROR, f"Variable/function {var_name} not found")
-        return Value(Type.CLOSURE, closure)
-
-    
-
-    def __eval_op(self, arith_ast):
-        left_value_obj = self.__eval_expr(arith_ast.get("op1"))
-        right_value_obj = self.__eval_expr(arith_ast.get("op2"))
-
-
-        left_value_obj, right_value_obj = self.__bin_op_promotion(
-            arith_ast.elem_type, left_value_obj, right_value_obj
-        )
-
-        if not self.__compatible_types(
-            arith_ast.elem_type, left_value_obj, right_value_obj
-        ):
-            super().error(
-                ErrorType.TYPE_ERROR,
-                f"Incompatible types for {arith_ast.elem_type} operation",
-            )
-        if arith_ast.elem_type not in self.op_to_lambda[left_value_obj.type()]:
-            super().error(
-                ErrorType.TYPE_ERROR,
-                f"Incompatible operator {arith_ast.elem_type} for type {left_value_obj.type()}",
-            )
-        f = self.op_to_lambda[left_value_obj.type()][arith_ast.elem_type]
-        return f(left_value_obj, right_value_obj)
-
-    # bool and int, int and bool for and/or/==/!= -> coerce int to bool
-    # bool and int, int and bool for arithmetic ops, coerce true to 1, false to 0
-    def __bin_op_promotion(self, operation, op1, op2):
-        if operation in self.op_to_lambda[Type.BOOL]:  # && or ||
-            
-            # If this operation is still allowed in the ints, then continue
-            if operation in self.op_to_lambda[Type.INT] and op1.type() == Type.INT \
-                and op2.type() == Type.INT:
-                pass
-            else:
-                if op1.type() == Type.INT:
-                    op1 = Interpreter.__int_to_bool(op1)
-                if op2.type() == Type.INT:
-                    op2 = Interpreter.__int_to_bool(op2)
-        if operation in self.op_to_lambda[Type.INT]:  # +, -, *, /
-            if op1.type() == Type.BOOL:
-                op1 = Interpreter.__bool_to_int(op1)
-            if op2.type() == Type.BOOL:
-                op2 = Interpreter.__bool_to_int(op2)
-        return (op1, op2)
-
-    def __unary_op_promotion(self, operation, op1):
-        if operation == "!" and op1.type() == Type.INT:
-            op1 = Interpreter.__int_to_bool(op1)
-        return op1
-
-    @staticmethod
-    def __int_to_bool(value):
-        return Value(Type.BOOL, value.value() != 0)
-
-    @staticmethod
-    def __bool_to_int(value):
-        return Value(Type.INT, 1 if value.value() else 0)
-
-    def __compatible_types(self, oper, obj1, obj2):
-        # DOCUMENT: allow comparisons ==/!= of anything against anything
-        if oper in ["==", "!="]:
-            return True
-        return obj1.type() == obj2.type()
-
-    def __eval_unary(self, arith_ast, t, f):
-        value_obj = self.__eval_expr(arith_ast.get("op1"))
-        value_obj = self.__unary_op_promotion(arith_ast.elem_type, value_obj)
-
-        if value_obj.type() != t:
-            super().error(
-                ErrorType.TYPE_ERROR,
-                f"Incompatible type for {arith_ast.elem_type} operation",
-            )
-        return Value(t, f(value_obj.value()))
-
-    def __setup_ops(self):
-        self.op_to_lambda = {}
-        # set up operations on integers
-        self.op_to_lambda[Type.INT] = {}
-        self.op_to_lambda[Type.INT]["+"] = lambda x, y: Value(
-            x.type(), x.value() + y.value()
-        )
-        self.op_to_lambda[Type.INT]["-"] = lambda x, y: Value(
-            x.type(), x.value() - y.value()
-        )
-        self.op_to_lambda[Type.INT]["*"] = lambda x, y: Value(
-            x.type(), x.value() * y.value()
-        )
-        self.op_to_lambda[Type.INT]["/"] = lambda x, y: Value(
-            x.type(), x.value() // y.value()
-        )
-        self.op_to_lambda[Type.INT]["=="] = lambda x, y: Value(
-            Type.BOOL, x.value() == y.value()
-        )
-        self.op_to_lambda[Type.INT]["!="] = lambda x, y: Value(
-            Type.BOOL, x.value() != y.value()
-        )
-        self.op_to_lambda[Type.INT]["<"] = lambda x, y: Value(
-            Type.BOOL, x.value() < y.value()
-        )
-        self.op_to_lambda[Type.INT]["<="] = lambda x, y: Value(
-            Type.BOOL, x.value() <= y.value()
-        )
-        self.op_to_lambda[Type.INT][">"] = lambda x, y: Value(
-            Type.BOOL, x.value() > y.value()
-        )
-        self.op_to_lambda[Type.INT][">="] = lambda x, y: Value(
-            Type.BOOL, x.value() >= y.value()
-        )
-        #  set up operations on strings
-        self.op_to_lambda[Type.STRING] = {}
-        self.op_to_lambda[Type.STRING]["+"] = lambda x, y: Value(
-            x.type(), x.value() + y.value()
-        )
-        self.op_to_lambda[Type.STRING]["=="] = lambda x, y: Value(
-            Type.BOOL, x.value() == y.value()
-        )
-        self.op_to_lambda[Type.STRING]["!="] = lambda x, y: Value(
-            Type.BOOL, x.value() != y.value()
-        )
-        #  set up operations on bools
-        self.op_to_lambda[Type.BOOL] = {}
-        self.op_to_lambda[Type.BOOL]["&&"] = lambda x, y: Value(
-            x.type(), x.value() and y.value()
-        )
-        self.op_to_lambda[Type.BOOL]["||"] = lambda x, y: Value(
-            x.type(), x.value() or y.value()
-        )
-        self.op_to_lambda[Type.BOOL]["=="] = lambda x, y: Value(
-            Type.BOOL, x.value() == y.value()
-        )
-        self.op_to_lambda[Type.BOOL]["!="] = lambda x, y: Value(
-            Type.BOOL, x.value() != y.value()
-        )
-
-        #  set up operations on nil
-        self.op_to_lambda[Type.NIL] = {}
-        self.op_to_lambda[Type.NIL]["=="] = lambda x, y: Value(
-            Type.BOOL, x.value() == y.value()
-        )
-        self.op_to_lambda[Type.NIL]["!="] = lambda x, y: Value(
-            Type.BOOL, x.value() != y.value()
-        )
-
-        #  set up operations on closures
-        self.op_to_lambda[Type.CLOSURE] = {}
-        self.op_to_lambda[Type.CLOSURE]["=="] = lambda x, y: Value(
-            Type.BOOL, x.value() == y.value()
-        )
-        self.op_to_lambda[Type.CLOSURE]["!="] = lambda x, y: Value(
-            Type.BOOL, x.value() != y.value()
-        )
-
-        # set up operations on objects
-        self.op_to_lambda[Type.OBJECT] = {}
-        self.op_to_lambda[Type.OBJECT]["=="] = lambda x, y: Value(
-            Type.BOOL, x.value() == y.value()
-        )
-        self.op_to_lambda[Type.OBJECT]["!="] = lambda x, y: Value(
-            Type.BOOL, x.value() != y.value()
-        )
-
-    def __do_if(self, if_ast):
-        cond_ast = if_ast.get("condition")
-        result = self.__eval_expr(cond_ast)
-        if result.type() == Type.INT:
-            result = Interpreter.__int_to_bool(result)
-        if result.type() != Type.BOOL:
-            super().error(
-                ErrorType.TYPE_ERROR,
-                "Incompatible type for if condition",
-            )
-        if result.value():
-            statements = if_ast.get("statements")
-            status, return_val = self.__run_statements(statements)
-            return (status, return_val)
-        else:
-            else_statements = if_ast.get("else_statements")
-            if else_statements is not None:
-                status, return_val = self.__run_statements(else_statements)
-                return (status, return_val)
-
-        return (ExecStatus.CONTINUE, Interpreter.NIL_VALUE)
-
-    def __do_while(self, while_ast):
-        cond_ast = while_ast.get("condition")
-        run_while = Interpreter.TRUE_VALUE
-        while run_while.value():
-            run_while = self.__eval_expr(cond_ast)
-            if run_while.type() == Type.INT:
-                run_while = Interpreter.__int_to_bool(run_while)
-            if run_while.type() != Type.BOOL:
-                super().error(
-                    ErrorType.TYPE_ERROR,
-                    "Incompatible type for while condition",
-                )
-            if run_while.value():
-                statements = while_ast.get("statements")
-                status, return_val = self.__run_statements(statements)
-                if status == ExecStatus.RETURN:
-                    return status, return_val
-
-        return (ExecStatus.CONTINUE, Interpreter.NIL_VALUE)
-
-    def __do_return(self, return_ast):
-        expr_ast = return_ast.get("expression")
-        if expr_ast is None:
-            return (ExecStatus.RETURN, Interpreter.NIL_VALUE)
-        value_obj = copy.deepcopy(self.__eval_expr(expr_ast))
-        return (ExecStatus.RETURN, value_obj)
\ No newline at end of file
+import asyncio
+import copy
+from enum import Enum
+import operator
+from functools import partial
+import sys
+
+from brewparse import parse_program
+from element import Element
+from env_v4 import EnvironmentManager, PersistentEnvironmentManager
+from intbase import InterpreterBase, ErrorType
+from ir_v4 import OPT_LEVELS, PassManager
+from loops_v4 import recognize_counted_loop
+from memo_v4 import MemoTable, find_pure_functions
+from profile_v4 import load_profile, save_profile
+from specialize_v4 import SPECIALIZE_BUDGET, specialize_program
+from typeinfer_v4 import infer_types, reachable_functions
+from type_value_v4 import (
+    BOOL_VALUES,
+    NIL,
+    SMALL_INT_MAX,
+    SMALL_INT_MIN,
+    Closure,
+    Object,
+    SharedValue,
+    Thunk,
+    Type,
+    Value,
+    concat_strings,
+    create_shared_value,
+    get_printable,
+    int_value,
+)
+
+
+class ExecStatus(Enum):
+    CONTINUE = 1
+    RETURN = 2
+
+
+# yielded by explicit stack frames under run_async for input ("input") or
+# output ("output", line), which __drive_async awaits
+class IoRequest:
+    def __init__(self, kind, line=None):
+        self.kind = kind
+        self.line = line
+
+
+# Main interpreter class
+class Interpreter(InterpreterBase):
+    # constants
+    NIL_VALUE = create_shared_value(InterpreterBase.NIL_DEF)
+    TRUE_VALUE = create_shared_value(InterpreterBase.TRUE_DEF)
+    BIN_OPS = {"+", "-", "*", "/", "==", "!=", ">", ">=", "<", "<=", "||", "&&"}
+    LOGIC_OPS = {"&&", "||"}
+    # expressions that lazy=True delays; literals, names, objects and lambdas
+    # are cheap and are evaluated as before
+    LAZY_KINDS = BIN_OPS | {
+        InterpreterBase.FCALL_DEF,
+        InterpreterBase.MCALL_DEF,
+        InterpreterBase.NEG_DEF,
+        InterpreterBase.NOT_DEF,
+    }
+    MAX_CALL_DEPTH = 100000
+    MEMO_SIZE = 4096
+    QUICK_MAX_DEOPTS = 2
+    HOT_CALL_THRESHOLD = 10
+    HOT_LOOP_THRESHOLD = 100
+    YIELD_EVERY = 1000
+    UNLIMITED = sys.maxsize  # the step and object budgets without a limit
+    OP_TABLES = {}  # (intern_values, ropes) -> tables made by __setup_ops and __setup_quick_ops
+
+    # methods
+    # explicit_stack=True evaluates the program without Python recursion: every
+    # statement, expression and call becomes a generator frame on a heap-allocated
+    # stack (see __drive), so deep Brewin recursion is bounded by max_call_depth
+    # instead of the host's recursion limit
+    # tiering=True promotes functions called more than hot_call_threshold times and
+    # while loops that run more than hot_loop_threshold iterations from the tree
+    # walker to compiled python closures (see "Compiled tier" below); it is not
+    # used together with explicit_stack or trace_output
+    # profile_path names a JSON file of per-program execution profiles (see
+    # profile_v4.py); when set, each run starts from the profile saved by previous
+    # runs of the same program and, unless record_profile=False, adds to it
+    # static_types=True runs type inference (see typeinfer_v4.py) before main so
+    # that operations whose types are proven start out quickened, with only a
+    # type tag check left; static_errors=True also reports, as soon as the
+    # program is loaded, type errors that are certain to happen if the code
+    # holding them runs, in functions main can reach (whether or not that code
+    # ever does run)
+    # memoize=True caches the results of functions that memo_v4.py proves pure,
+    # keeping up to memo_size argument tuples per function
+    # specialize=True clones functions for call sites that pass literal arguments
+    # and simplifies the clones (see specialize_v4.py), adding at most
+    # specialize_budget AST nodes to the program
+    # opt_level=0, 1 or 2 runs functions by lowering them to the control-flow graph
+    # IR of ir_v4.py, optimized by the passes of that level (see "IR execution"
+    # below); verify_ir=True checks the IR after every pass. Like tiering, it is
+    # not used together with explicit_stack or trace_output
+    # short_circuit=False restores the original eager && and ||, which always
+    # evaluate both operands; by default the right operand is skipped when the
+    # left one (coerced from int to bool as usual) already decides the result
+    # vectorize=True runs counted integer while loops (see loops_v4.py) in closed
+    # form instead of one iteration at a time; it is off while tracing or
+    # recording a profile, so that both still see every iteration
+    # intern_values=True shares the Values of literals and of the ints and bools
+    # operations produce instead of allocating new ones (see "Interned values"
+    # below)
+    # ropes=True builds strings that are concatenated into ropes (see Rope in
+    # type_value_v4.py), which are only joined when printed or compared
+    # lazy_functions=True sets up each function (its Closure, interned literals
+    # and static types) the first time it is looked up rather than all of them
+    # before main, so that large programs start running sooner. It is off with
+    # profile_path and static_errors, which need the whole program up front
+    # input_provider, if given, supplies the lines inputi reads
+    # instead of inp or stdin (see inputs_v4.py)
+    # run_async runs the program with the explicit stack (whatever the other
+    # options) as a coroutine, yielding to the event loop every yield_every
+    # steps and awaiting input and output (see "Async execution" below)
+    # output_sink, if given, receives every printed line instead of stdout and
+    # output_log (see sinks_v4.py)
+    # persistent_env=True keeps variables in a PersistentEnvironmentManager (see
+    # env_v4.py) instead of a stack of dicts
+    # lazy=True passes arguments and assigns right-hand sides by need (see "Lazy
+    # evaluation" below). It only applies to the tree walker, so it turns off
+    # tiering and opt_level, and is itself ignored with explicit_stack
+    # max_steps, max_objects_created, max_output_bytes and max_string_length
+    # govern each run of an untrusted program, along with max_call_depth (see
+    # "Resource governor" below); None, the default, leaves that resource
+    # unlimited
+    def __init__(
+        self,
+        console_output=True,
+        inp=None,
+        trace_output=False,
+        explicit_stack=False,
+        max_call_depth=MAX_CALL_DEPTH,
+        quicken=True,
+        tiering=True,
+        hot_call_threshold=HOT_CALL_THRESHOLD,
+        hot_loop_threshold=HOT_LOOP_THRESHOLD,
+        profile_path=None,
+        record_profile=True,
+        static_types=True,
+        static_errors=False,
+        memoize=False,
+        memo_size=MEMO_SIZE,
+        specialize=False,
+        specialize_budget=SPECIALIZE_BUDGET,
+        opt_level=None,
+        verify_ir=False,
+        vectorize=True,
+        short_circuit=True,
+        lazy=False,
+        intern_values=True,
+        ropes=True,
+        persistent_env=False,
+        lazy_functions=True,
+        output_sink=None,
+        input_provider=None,
+        yield_every=YIELD_EVERY,
+        max_steps=None,
+        max_objects_created=None,
+        max_output_bytes=None,
+        max_string_length=None,
+    ):
+        super().__init__(console_output, inp)
+        self.trace_output = trace_output
+        self.explicit_stack = explicit_stack
+        self.max_call_depth = max_call_depth
+        self.quicken = quicken
+        self.lazy = lazy and not explicit_stack
+        if explicit_stack or trace_output or self.lazy:
+            opt_level = None
+        self.opt_level = opt_level
+        self.verify_ir = verify_ir
+        self.vectorize = vectorize and not trace_output
+        self.short_circuit = short_circuit
+        self.tiering = (
+            tiering
+            and not explicit_stack
+            and not trace_output
+            and opt_level is None
+            and not self.lazy
+        )
+        self.hot_call_threshold = hot_call_threshold
+        self.hot_loop_threshold = hot_loop_threshold
+        self.profile_path = profile_path
+        self.record_profile = record_profile
+        self.static_types = static_types
+        self.static_errors = static_errors
+        self.memoize = memoize
+        self.memo_size = memo_size
+        self.specialize = specialize
+        self.specialize_budget = specialize_budget
+        self.intern_values = intern_values
+        self.ropes = ropes
+        self.env_class = PersistentEnvironmentManager if persistent_env else EnvironmentManager
+        self.lazy_functions = lazy_functions and profile_path is None and not static_errors
+        self.output_sink = output_sink
+        self.input_provider = input_provider
+        self.yield_every = yield_every
+        self.async_io = False
+        self.max_steps = max_steps
+        self.max_objects_created = max_objects_created
+        self.max_output_bytes = max_output_bytes
+        self.max_string_length = max_string_length
+        # the operation tables only depend on these two options, so they are
+        # built once per combination and shared by every instance, unless a
+        # string length limit makes them check concatenations for this one
+        op_key = (intern_values, ropes)
+        if max_string_length is not None:
+            self.__setup_ops()
+            self.__setup_quick_ops()
+            return
+        if op_key not in Interpreter.OP_TABLES:
+            self.__setup_ops()
+            self.__setup_quick_ops()
+            Interpreter.OP_TABLES[op_key] = (
+                self.new_value,
+                self.concat,
+                self.op_to_lambda,
+                self.quick_ops,
+            )
+        self.new_value, self.concat, self.op_to_lambda, self.quick_ops = Interpreter.OP_TABLES[op_key]
+
+    # run a program that's provided in a string
+    # usese the provided Parser found in brewparse.py to parse the program
+    # into an abstract syntax tree (ast)
+    def run(self, program):
+        self.load(program)
+        self.run_main()
+
+    # parses a program and sets it up to run; run_main and call can then run it
+    # any number of times, keeping what earlier runs compiled and specialized
+    # (see program_v4.py)
+    def load(self, program):
+        ast = parse_program(program)
+        self.program_ast = ast
+        self.specialized_nodes = 0
+        if self.specialize:
+            self.specialized_nodes = specialize_program(ast, self.specialize_budget)
+        self.constants = {}
+        if self.intern_values and not self.lazy_functions:
+            self.__intern_constants(ast)
+        self.__set_up_function_table(ast)
+        self.quick_deopts = {}
+        self.quick_stats = {"specialized": 0, "deoptimized": 0}
+        self.call_counts = {}
+        self.loop_counts = {}
+        self.compiled = {}
+        self.tier_transitions = []
+        self.site_labels = None
+        self.profile = None
+        profile = None
+        if self.profile_path is not None:
+            variant = f"specialize={self.specialize_budget}" if self.specialize else ""
+            profile = load_profile(self.profile_path, program, ast, variant)
+            if self.record_profile:
+                self.profile = profile
+        if (self.static_types or self.static_errors) and not self.lazy_functions:
+            self.__apply_static_types(ast.get("functions"))
+        self.memo_tables = {}
+        if self.memoize:
+            for func_def, free_writes in find_pure_functions(ast.get("functions")).items():
+                self.memo_tables[func_def] = MemoTable(func_def, free_writes, self.memo_size)
+        self.thunk_names = {}
+        self.delayable = {}
+        self.thunk_stats = {"delayed": 0, "forced": 0}
+        self.counted_loops = None
+        self.counted_loop_stats = {"closed_form": 0, "fallback": 0}
+        if self.vectorize and self.profile is None:
+            self.counted_loops = {}
+        self.pass_manager = None
+        self.ir_functions = None
+        if self.opt_level is not None:
+            self.pass_manager = PassManager(
+                OPT_LEVELS[self.opt_level], self.verify_ir, self.short_circuit
+            )
+            self.ir_functions = {}
+        # last, since it may compile functions and loops, which relies on
+        # everything above
+        if profile is not None:
+            self.__apply_profile(profile)
+
+    # runs main of the loaded program
+    def run_main(self):
+        self.__start_run()
+        main_func = self.__get_func_by_name("main", 0)
+        if main_func is None:
+            super().error(ErrorType.NAME_ERROR, "Function main not found")
+        statements = main_func.func_ast.get("statements")
+        try:
+            if self.ir_functions is not None:
+                self.__run_ir(self.__ir_function(main_func.func_ast))
+            elif self.explicit_stack:
+                self.__drive(self.__step_statements(statements))
+            else:
+                self.__run_statements(statements)
+        except RecursionError:
+            self.__recursion_limit()
+        finally:
+            self.__end_run()
+
+    # calls a function of the loaded program with a list of argument Values, as
+    # main would, and returns the Value it returns. The arguments are bound to
+    # names no Brewin program can use, and passed like any other variable.
+    def call(self, func_name, args):
+        self.__start_run()
+        frame = {}
+        arg_asts = []
+        for i, value_obj in enumerate(args):
+            frame[f"%arg{i}"] = value_obj
+            arg_asts.append(Element(InterpreterBase.VAR_DEF, name=f"%arg{i}"))
+        call_ast = Element(InterpreterBase.FCALL_DEF, name=func_name, args=arg_asts)
+        self.env.push(frame)
+        try:
+            if self.explicit_stack:
+                return self.__drive(self.__step_call(call_ast))
+            return self.__call_func(call_ast)
+        except RecursionError:
+            self.__recursion_limit()
+        finally:
+            self.__end_run()
+
+    # returns a function that calls func_name with a list of num_args argument
+    # Values, like call, but looks the function up and checks its arity once
+    # instead of on every call
+    def bind_call(self, func_name, num_args):
+        if self.explicit_stack:
+            return lambda args: self.call(func_name, args)
+        self.__start_run()
+        closure = self.__get_func_by_name(func_name, num_args)
+        if closure is None:
+            super().error(ErrorType.NAME_ERROR, f"Function {func_name} not found")
+        target_ast = closure.func_ast
+        formals = target_ast.get("args")
+        call_ast = Element(
+            InterpreterBase.FCALL_DEF,
+            name=func_name,
+            args=[Element(InterpreterBase.VAR_DEF, name=f"%arg{i}") for i in range(num_args)],
+        )
+
+        def bound_call(args):
+            self.__start_run()
+            new_env = {}
+            self.__prepare_env_with_closed_variables(closure, new_env)
+            for formal_ast, value_obj in zip(formals, args):
+                self.__bind_param(formal_ast, value_obj, new_env)
+            try:
+                return self.__invoke(call_ast, target_ast, new_env)
+            except RecursionError:
+                self.__recursion_limit()
+            finally:
+                self.__end_run()
+
+        return bound_call
+
+    def get_input(self):
+        if self.input_provider is None:
+            return super().get_input()
+        return self.input_provider.read_line()
+
+    def output(self, v):
+        if self.max_output_bytes is not None:
+            self.__count_output(v)
+        if self.output_sink is None:
+            super().output(v)
+        else:
+            self.output_sink.write(v)
+
+    # Call to reset I/O for another run of the program; also lets go of the
+    # variables and method-call stack of the last run, which the next run starts
+    # afresh anyway. The loaded program and what was compiled for it stay.
+    def reset(self):
+        super().reset()
+        self.env = None
+        self.current_val_object_mcall = []
+        self.call_depth = 0
+
+    def __end_run(self):
+        if self.profile is not None:
+            save_profile(self.profile_path, self.profile, self.__site_label)
+        if self.output_sink is not None:
+            self.output_sink.flush()
+
+    def __start_run(self):
+        self.env = self.env_class()
+        self.current_val_object_mcall = []
+        self.call_depth = 0
+        self.steps_left = Interpreter.UNLIMITED if self.max_steps is None else self.max_steps
+        self.objects_left = (
+            Interpreter.UNLIMITED
+            if self.max_objects_created is None
+            else self.max_objects_created
+        )
+        if self.max_output_bytes is not None:
+            self.output_bytes_left = self.max_output_bytes
+
+    def __apply_static_types(self, func_defs):
+        info = infer_types(func_defs, self.short_circuit)
+        reachable = reachable_functions(func_defs) if self.static_errors else []
+        node = next((n for f in reachable for n in f.walk() if n in info.errors), None)
+        if node is not None:
+            super().error(
+                ErrorType.TYPE_ERROR,
+                f"{info.errors[node]} ({self.__site_label(node)})",
+            )
+        if not self.static_types:
+            return
+        for node, t in info.types.items():
+            node.static_type = t
+        if not self.quicken:
+            return
+        for node in info.types:
+            if node.elem_type in Interpreter.BIN_OPS:
+                left_type = node.get("op1").static_type
+                right_type = node.get("op2").static_type
+                if left_type is not None and right_type is not None:
+                    self.__specialize(node, left_type, right_type)
+
+    # pre-specializes the program from the profile of earlier runs: operators that
+    # only ever saw one pair of operand types start out quickened, and functions
+    # and loops that reached the compiled tier are compiled before they first run
+    def __apply_profile(self, profile):
+        for node in profile.nodes:
+            if node.elem_type not in Interpreter.BIN_OPS or not self.quicken:
+                continue
+            types = profile.monomorphic_types(node)
+            if types is not None:
+                self.__specialize(node, Type[types[0]], Type[types[1]])
+        if self.tiering:
+            for node, kind in profile.tiered_sites():
+                self.__tier_up(node, kind, 0)
+
+    # with lazy_functions, the table holds each function's AST until
+    # __load_function replaces it with the function's Closure
+    def __set_up_function_table(self, ast):
+        self.func_name_to_ast = {}
+        self.empty_env = self.env_class()
+        self.loaded_functions = 0
+        for func_def in ast.get("functions"):
+            func_name = func_def.get("name")
+            num_params = len(func_def.get("args"))
+            if func_name not in self.func_name_to_ast:
+                self.func_name_to_ast[func_name] = {}
+            if self.lazy_functions:
+                self.func_name_to_ast[func_name][num_params] = func_def
+            else:
+                self.func_name_to_ast[func_name][num_params] = Closure(func_def, self.empty_env)
+
+    def __load_function(self, candidate_funcs, num_params):
+        func_def = candidate_funcs[num_params]
+        if self.intern_values:
+            self.__intern_constants(func_def)
+        if self.static_types:
+            self.__apply_static_types([func_def])
+        self.loaded_functions += 1
+        closure = Closure(func_def, self.empty_env)
+        candidate_funcs[num_params] = closure
+        return closure
+
+    def __get_func_by_name(self, name, num_params):
+        if name not in self.func_name_to_ast:
+            closure_val_obj = self.env.get(name)
+            if closure_val_obj is None:
+                return None
+                # super().error(ErrorType.NAME_ERROR, f"Function {name} not found")
+            if closure_val_obj.t is Type.THUNK:
+                self.__force(closure_val_obj)
+            if closure_val_obj.type() != Type.CLOSURE:
+                super().error(
+                    ErrorType.TYPE_ERROR, "Trying to call function with non-closure"
+                )
+            closure = closure_val_obj.value()
+            num_formal_params = len(closure.func_ast.get("args"))
+            if num_formal_params != num_params:
+                super().error(ErrorType.TYPE_ERROR, "Invalid # of args to lambda")
+            return closure_val_obj.value()
+
+        candidate_funcs = self.func_name_to_ast[name]
+        if num_params is None:
+            # case where we want assign variable to func_name and we don't have
+            # a way to specify the # of arguments for the function, so we generate
+            # an error if there's more than one function with that name
+            if len(candidate_funcs) > 1:
+                super().error(
+                    ErrorType.NAME_ERROR,
+                    f"Function {name} has multiple overloaded versions",
+                )
+            num_args = next(iter(candidate_funcs))
+            closure = candidate_funcs[num_args]
+            if type(closure) is not Closure:
+                closure = self.__load_function(candidate_funcs, num_args)
+            return closure
+
+        if num_params not in candidate_funcs:
+            super().error(
+                ErrorType.NAME_ERROR,
+                f"Function {name} taking {num_params} params not found",
+            )
+        closure = candidate_funcs[num_params]
+        if type(closure) is not Closure:
+            closure = self.__load_function(candidate_funcs, num_params)
+        return closure
+
+    def __run_statements(self, statements):
+        self.env.push()
+        for statement in statements:
+            if self.trace_output:
+                print(statement)
+            self.steps_left -= 1
+            if self.steps_left < 0:
+                self.__out_of_steps()
+            status = ExecStatus.CONTINUE
+            if statement.elem_type == InterpreterBase.FCALL_DEF:
+                self.__call_func(statement)
+            elif statement.elem_type == InterpreterBase.MCALL_DEF:
+                self.__call_func(statement)
+            elif statement.elem_type == "=":
+                self.__assign(statement)
+            elif statement.elem_type == InterpreterBase.RETURN_DEF:
+                status, return_val = self.__do_return(statement)
+            elif statement.elem_type == Interpreter.IF_DEF:
+                status, return_val = self.__do_if(statement)
+            elif statement.elem_type == Interpreter.WHILE_DEF:
+                status, return_val = self.__do_while(statement)
+
+            if status == ExecStatus.RETURN:
+                self.env.pop()
+                return (status, return_val)
+
+        self.env.pop()
+        return (ExecStatus.CONTINUE, Interpreter.NIL_VALUE)
+
+
+    def __call_func(self, call_ast):
+        func_name = call_ast.get("name")
+        if func_name == "print" and call_ast.elem_type == "fcall":
+            return self.__call_print(call_ast)
+        if func_name == "inputi" and call_ast.elem_type == "fcall":
+            return self.__call_input(call_ast)
+
+        target_closure = self.__resolve_call_target(call_ast)
+        target_ast = target_closure.func_ast
+
+        new_env = {}
+        self.__prepare_env_with_closed_variables(target_closure, new_env)
+        self.__prepare_params(target_ast,call_ast, new_env)
+        return self.__invoke(call_ast, target_ast, new_env)
+
+    # runs the body of target_ast in new_env, in whichever tier it is in
+    def __invoke(self, call_ast, target_ast, new_env):
+        if self.profile is not None:
+            self.__record_call(call_ast)
+        memo_key = None
+        if self.memo_tables:
+            memo_key = self.__memo_key(call_ast, target_ast, new_env)
+            if memo_key is not None:
+                cached = self.memo_tables[target_ast].lookup(memo_key)
+                if cached is not None:
+                    return Value(cached[0], cached[1])
+        self.__enter_call()
+        self.env.push(new_env)
+        compiled = self.compiled.get(target_ast)
+        if compiled is None and self.tiering:
+            calls = self.call_counts.get(target_ast, 0) + 1
+            self.call_counts[target_ast] = calls
+            if calls > self.hot_call_threshold:
+                compiled = self.__tier_up(target_ast, "function", calls)
+        if self.ir_functions is not None:
+            return_val = self.__run_ir(self.__ir_function(target_ast))
+        elif compiled is None:
+            _, return_val = self.__run_statements(target_ast.get("statements"))
+        else:
+            return_val = compiled()
+            if return_val is None:
+                return_val = Interpreter.NIL_VALUE
+        self.env.pop()
+        self.__exit_call(call_ast)
+        if memo_key is not None:
+            self.memo_tables[target_ast].store(memo_key, return_val)
+        return return_val
+
+    # the memo table key for a call, or None if the call can't use a memo table:
+    # the function isn't pure, an argument isn't a primitive value, or one of the
+    # function's free writes would land in a variable that is already bound
+    def __memo_key(self, call_ast, target_ast, new_env):
+        memo = self.memo_tables.get(target_ast)
+        if memo is None or call_ast.elem_type != InterpreterBase.FCALL_DEF:
+            return None
+        for var_name in memo.free_writes:
+            if self.env.get(var_name) is not None:
+                return None
+        return memo.key(new_env)
+
+    # hit/miss counts of each memoized function, keyed by name/arity
+    def get_memo_stats(self):
+        return {
+            self.__site_label(func_def): memo.stats()
+            for func_def, memo in self.memo_tables.items()
+        }
+
+    # finds the closure a call refers to; for method calls this also pushes the
+    # receiver onto current_val_object_mcall (popped again by __exit_call)
+    def __resolve_call_target(self, call_ast):
+        func_name = call_ast.get("name")
+        actual_args = call_ast.get("args")
+        if call_ast.get('objref'):
+            object_name = call_ast.get('objref')
+            object_val = self.env.get(object_name) or self.current_val_object_mcall[-1]
+            if object_val.t is Type.THUNK:
+                self.__force(object_val)
+            if object_val == None:
+                super().error(ErrorType.NAME_ERROR, f"Object {object_name} has not been defined")
+            if object_val != None and object_val.type() != Type.OBJECT:
+                super().error(ErrorType.TYPE_ERROR, f"{func_name} is not an object method.")
+            self.current_val_object_mcall.append(object_val)
+            target_closure = object_val.v.get(func_name)
+            #while object_val.v.proto.type() != Type.NIL and target_closure == None:
+            while object_val.v.proto != None and target_closure == None and  object_val.v.proto.type() != Type.NIL:
+                object_val = object_val.v.proto
+                target_closure = object_val.v.get(func_name)
+            if target_closure == None:
+                if func_name == "proto" and self.current_val_object_mcall[-1].v.proto:
+                    super().error(ErrorType.TYPE_ERROR, f"{func_name} is a non-closure.")
+                super().error(ErrorType.NAME_ERROR, f"{func_name} is not a defined method.")
+            if target_closure.type() != Type.CLOSURE:
+                super().error(ErrorType.TYPE_ERROR, f"{func_name} is an object field but not a function.")
+            target_closure = target_closure.value()
+        else:
+            target_closure = self.__get_func_by_name(func_name, len(actual_args))
+        if target_closure == None:
+            if func_name == "this":
+                super().error(ErrorType.TYPE_ERROR, f"this may not be called as a function.")
+            super().error(ErrorType.NAME_ERROR, f"Function {func_name} not found")
+        if target_closure.type != Type.CLOSURE:
+            super().error(ErrorType.TYPE_ERROR, f"Function {func_name} is changed to non-function type.")
+        return target_closure
+
+    def __enter_call(self):
+        self.call_depth += 1
+        if self.call_depth > self.max_call_depth:
+            super().error(
+                ErrorType.RESOURCE_ERROR,
+                f"Maximum call depth of {self.max_call_depth} exceeded",
+            )
+
+    def __record_call(self, call_ast):
+        receiver_shape = None
+        if call_ast.get("objref"):
+            receiver = self.current_val_object_mcall[-1].v
+            receiver_shape = ",".join(sorted(receiver.obj_env))
+            if receiver.proto is not None and receiver.proto.type() != Type.NIL:
+                receiver_shape += ",^proto"
+        self.profile.record_call(call_ast, len(call_ast.get("args")), receiver_shape)
+
+    def __exit_call(self, call_ast):
+        self.call_depth -= 1
+        if call_ast.get('objref'):
+            self.current_val_object_mcall.pop(-1)
+
+    def __prepare_env_with_closed_variables(self, target_closure, temp_env):
+        # Updated here - ignore updates to the scope if we
+        #   altered a parameter, or if the argument is a similarly named variable
+        target_closure.captured_env.bind(temp_env)
+
+
+    def __prepare_params(self, target_ast, call_ast, temp_env):
+        self.__check_arity(target_ast, call_ast)
+        for formal_ast, actual_ast in zip(target_ast.get("args"), call_ast.get("args")):
+            if self.lazy and self.__delayable(actual_ast):
+                deep = formal_ast.elem_type != InterpreterBase.REFARG_DEF
+                temp_env[formal_ast.get("name")] = self.__delay(actual_ast, deep)
+            else:
+                self.__bind_param(formal_ast, self.__eval_expr(actual_ast), temp_env)
+
+    def __check_arity(self, target_ast, call_ast):
+        actual_args = call_ast.get("args")
+        formal_args = target_ast.get("args")
+        if len(actual_args) != len(formal_args):
+            super().error(
+                ErrorType.NAME_ERROR,
+                f"Function {target_ast.get('name')} with {len(actual_args)} args not found",
+            )
+
+    def __bind_param(self, formal_ast, result, temp_env):
+        if formal_ast.elem_type != InterpreterBase.REFARG_DEF:
+            #formal_ast.elem_type == InterpreterBase.LAMBDA_DEF or \
+            #formal_ast.elem_type == InterpreterBase.OBJ_DEF:
+            result = copy.deepcopy(result)
+        elif type(result) is SharedValue:
+            result = Value(result.t, result.v)
+        arg_name = formal_ast.get("name")
+        temp_env[arg_name] = result
+
+    def __call_print(self, call_ast):
+        values = []
+        for arg in call_ast.get("args"):
+            values.append(self.__eval_expr(arg))  # result is a Value object
+        return self.__print_values(values)
+
+    def __print_values(self, values):
+        self.output("".join([get_printable(result) for result in values]))
+        return Interpreter.NIL_VALUE
+
+    def __call_input(self, call_ast):
+        args = call_ast.get("args")
+        if args is not None and len(args) == 1:
+            result = self.__eval_expr(args[0])
+            self.output(get_printable(result))
+        return self.__read_input(call_ast)
+
+    def __read_input(self, call_ast):
+        self.__check_input_args(call_ast)
+        return self.__input_value(call_ast, self.get_input())
+
+    def __check_input_args(self, call_ast):
+        args = call_ast.get("args")
+        if args is not None and len(args) > 1:
+            super().error(
+                ErrorType.NAME_ERROR, "No inputi() function that takes > 1 parameter"
+            )
+
+    def __input_value(self, call_ast, inp):
+        if inp is None:
+            super().error(ErrorType.FAULT_ERROR, "No input left to read")
+        if call_ast.get("name") == "inputi":
+            return int_value(int(inp))
+        if call_ast.get("name") == "inputs":
+            return Value(Type.STRING, inp)
+
+    def __assign(self, assign_ast):
+        var_name = assign_ast.get("name")
+        expr_ast = assign_ast.get("expression")
+        if (
+            self.lazy
+            and self.__delayable(expr_ast)
+            and var_name != "this"
+            and "." not in var_name
+        ):
+            self.__assign_value(var_name, self.__delay(expr_ast, False, var_name))
+        else:
+            self.__assign_value(var_name, self.__eval_expr(expr_ast))
+
+    def __assign_value(self, var_name, value_obj):
+        src_value_obj = copy.copy(value_obj)
+        if var_name == "this":  # Handles the case that this is used inside a method
+            target_value_obj = self.current_val_object_mcall[-1]
+            target_value_obj.set(src_value_obj)
+        target_value_obj = self.env.get(var_name)
+        if("." in var_name): # Variable belongs to an object
+            period_index = var_name.index(".")
+            if var_name[0:period_index] == "this":  # Handling before the "."
+                object_var = self.current_val_object_mcall[-1]
+            else:
+                object_var = self.env.get(var_name[0:period_index])
+                if object_var is not None and object_var.t is Type.THUNK:
+                    self.__force(object_var)
+            if object_var == None:  # Ensures that the object exists
+                super().error(ErrorType.NAME_ERROR, f"The object on the left-hand side of the assignment doesn't exist.")
+            if var_name[period_index+1:] == "proto":    # Handling after the "."
+                if src_value_obj.type() != Type.OBJECT and src_value_obj.type() != Type.NIL:
+                    super().error(ErrorType.TYPE_ERROR, f"A non-object cannot be a prototype object.")
+                elif src_value_obj.type() == Type.NIL:
+                    object_var.v.set_proto(Value(Type.NIL, None))
+                else:
+                    object_var.v.set_proto(src_value_obj)
+            if object_var != None and object_var.type() != Type.OBJECT:
+                super().error(ErrorType.TYPE_ERROR, f"A non-object cannot use a dot operator.")
+            else:
+                object_var.v.set(var_name[period_index+1:], src_value_obj)
+        elif target_value_obj is None:
+            self.env.set(var_name, src_value_obj)
+        else:
+            # if a close is changed to another type such as int, we cannot make function calls on it any more 
+            if target_value_obj.t == Type.CLOSURE and src_value_obj.t != Type.CLOSURE:
+                target_value_obj.v.type = src_value_obj.t
+            target_value_obj.set(src_value_obj)
+
+    def __eval_expr(self, expr_ast):
+        if expr_ast.elem_type == InterpreterBase.NIL_DEF:
+            return NIL
+        if expr_ast.elem_type == InterpreterBase.INT_DEF:
+            return expr_ast.quick or Value(Type.INT, expr_ast.get("val"))
+        if expr_ast.elem_type == InterpreterBase.STRING_DEF:
+            return expr_ast.quick or Value(Type.STRING, expr_ast.get("val"))
+        if expr_ast.elem_type == InterpreterBase.BOOL_DEF:
+            return expr_ast.quick or Value(Type.BOOL, expr_ast.get("val"))
+        if expr_ast.elem_type == InterpreterBase.VAR_DEF:
+            return self.__eval_name(expr_ast)
+        if expr_ast.elem_type == InterpreterBase.FCALL_DEF:
+            return self.__call_func(expr_ast)
+        if expr_ast.elem_type == InterpreterBase.MCALL_DEF:
+            return self.__call_func(expr_ast)
+        if expr_ast.elem_type == InterpreterBase.OBJ_DEF:
+            self.__count_object()
+            return Value(Type.OBJECT, Object())
+        if expr_ast.elem_type in Interpreter.BIN_OPS:
+            return self.__eval_op(expr_ast)
+        if expr_ast.elem_type == Interpreter.NEG_DEF:
+            return self.__eval_unary(expr_ast, Type.INT, lambda x: -1 * x)
+        if expr_ast.elem_type == Interpreter.NOT_DEF:
+            return self.__eval_unary(expr_ast, Type.BOOL, lambda x: not x)
+        if expr_ast.elem_type == Interpreter.LAMBDA_DEF:
+            if self.lazy:
+                self.__force_env()
+            self.__count_object()
+            return Value(Type.CLOSURE, Closure(expr_ast, self.env))
+
+    def __eval_name(self, name_ast):
+        var_name = name_ast.get("name")
+        if var_name == "this" and len(self.current_val_object_mcall) != 0 and self.current_val_object_mcall[-1]:
+            val = self.current_val_object_mcall[-1]
+        elif("." in var_name): # Variable belongs to an object
+            period_index = var_name.index(".")
+            if var_name[0:period_index] == "this":  # Handling before the "."
+                if len(self.current_val_object_mcall) == 0:
+                    super().error(ErrorType.NAME_ERROR, f"{var_name} is not referencing an object")
+                object_var = self.current_val_object_mcall[-1]
+            else:
+                object_var = self.env.get(var_name[0:period_index])
+                if object_var is not None and object_var.t is Type.THUNK:
+                    self.__force(object_var)
+            if object_var != None and object_var.type() != Type.OBJECT:
+                super().error(ErrorType.TYPE_ERROR, f"{var_name} is not an object.")
+            elif object_var == None:
+                super().error(ErrorType.NAME_ERROR, f"{var_name} is not referencing an object")
+            val = object_var.v.get(var_name[period_index+1:])
+            if var_name[period_index+1:] == "proto":    # Handles cases were the proto needs to be accessed
+                val = object_var.v.proto
+                if val == None:
+                    super().error(ErrorType.NAME_ERROR, f"{var_name} is not a variable in the object.")
+                #if val.type() == Type.NIL:
+                #    val = None
+            #while object_var.v.proto.type() != Type.NIL and val == None:
+            while object_var.v.proto != None and val == None and object_var.v.proto.type() != Type.NIL:
+                object_var = object_var.v.proto
+                val = object_var.v.get(var_name[period_index+1:])
+            if val == None:
+                super().error(ErrorType.NAME_ERROR, f"{var_name} is not a variable in the object.")
+            return val
+        else:
+            val = self.env.get(var_name)
+        if val is not None:
+            if val.t is Type.THUNK:
+                return self.__force(val)
+            return val
+        closure = self.__get_func_by_name(var_name, None)
+        if closure is None:
+            super().error(ErrorType.NAME_ERROR, f"Variable/function {var_name} not found")
+        return Value(Type.CLOSURE, closure)
+
+    
+
+    def __eval_op(self, arith_ast):
+        left_value_obj = self.__eval_expr(arith_ast.get("op1"))
+        if self.short_circuit and arith_ast.elem_type in Interpreter.LOGIC_OPS:
+            result = self.__short_circuit(arith_ast, left_value_obj)
+            if result is not None:
+                return result
+        right_value_obj = self.__eval_expr(arith_ast.get("op2"))
+        return self.__apply_bin_op(arith_ast, left_value_obj, right_value_obj)
+
+    # the result of && or || if its left operand alone decides it, else None; a
+    # left operand that isn't a bool or int leaves the type error to the full
+    # operation, after the right operand has been evaluated as before
+    @staticmethod
+    def __short_circuit(arith_ast, left_value_obj):
+        if left_value_obj.t is Type.BOOL:
+            left = left_value_obj.v
+        elif left_value_obj.t is Type.INT:
+            left = left_value_obj.v != 0
+        else:
+            return None
+        if left == (arith_ast.elem_type == "||"):
+            return BOOL_VALUES[left]
+        return None
+
+    # Quickening: after a binary operator node runs on the generic path, it caches
+    # a version of the operation specialized to the operand types it just saw
+    # (e.g. INT + INT) in arith_ast.quick as (left type, right type, lambda).
+    # Later executions only compare the two operand types before calling the
+    # lambda on the raw python values. A mismatch deoptimizes the node back to the
+    # generic path, which re-specializes it; a node that deoptimizes more than
+    # QUICK_MAX_DEOPTS times stays generic.
+    def __apply_bin_op(self, arith_ast, left_value_obj, right_value_obj):
+        quick = arith_ast.quick
+        if quick is not None:
+            if left_value_obj.t is quick[0] and right_value_obj.t is quick[1]:
+                return quick[2](left_value_obj.v, right_value_obj.v)
+            self.__deoptimize(arith_ast)
+        if self.profile is not None:
+            self.profile.record_types(arith_ast, left_value_obj.t, right_value_obj.t)
+        result = self.__apply_bin_op_generic(
+            arith_ast.elem_type, left_value_obj, right_value_obj
+        )
+        if self.quicken:
+            self.__specialize(arith_ast, left_value_obj.t, right_value_obj.t)
+        return result
+
+    def __specialize(self, arith_ast, left_type, right_type):
+        if self.quick_deopts.get(arith_ast, 0) > Interpreter.QUICK_MAX_DEOPTS:
+            return
+        f = self.quick_ops.get((arith_ast.elem_type, left_type, right_type))
+        if f is not None and self.profile is not None:
+            f = self.__profiled_quick_op(arith_ast, left_type, right_type, f)
+        if f is not None:
+            arith_ast.quick = (left_type, right_type, f)
+            self.quick_stats["specialized"] += 1
+
+    # wraps a specialized op so that profiling keeps counting its operand types
+    # without putting a check on the unprofiled fast path
+    def __profiled_quick_op(self, arith_ast, left_type, right_type, f):
+        record_types = self.profile.record_types
+
+        def profiled(x, y):
+            record_types(arith_ast, left_type, right_type)
+            return f(x, y)
+
+        return profiled
+
+    def __deoptimize(self, arith_ast):
+        arith_ast.quick = None
+        self.quick_deopts[arith_ast] = self.quick_deopts.get(arith_ast, 0) + 1
+        self.quick_stats["deoptimized"] += 1
+        if self.profile is not None:
+            self.profile.record_deopt(arith_ast)
+
+    def __apply_bin_op_generic(self, oper, left_value_obj, right_value_obj):
+        left_value_obj, right_value_obj = self.__bin_op_promotion(
+            oper, left_value_obj, right_value_obj
+        )
+
+        if not self.__compatible_types(
+            oper, left_value_obj, right_value_obj
+        ):
+            super().error(
+                ErrorType.TYPE_ERROR,
+                f"Incompatible types for {oper} operation",
+            )
+        if oper not in self.op_to_lambda[left_value_obj.type()]:
+            super().error(
+                ErrorType.TYPE_ERROR,
+                f"Incompatible operator {oper} for type {left_value_obj.type()}",
+            )
+        f = self.op_to_lambda[left_value_obj.type()][oper]
+        return f(left_value_obj, right_value_obj)
+
+    # bool and int, int and bool for and/or/==/!= -> coerce int to bool
+    # bool and int, int and bool for arithmetic ops, coerce true to 1, false to 0
+    def __bin_op_promotion(self, operation, op1, op2):
+        if operation in self.op_to_lambda[Type.BOOL]:  # && or ||
+            
+            # If this operation is still allowed in the ints, then continue
+            if operation in self.op_to_lambda[Type.INT] and op1.type() == Type.INT \
+                and op2.type() == Type.INT:
+                pass
+            else:
+                if op1.type() == Type.INT:
+                    op1 = Interpreter.__int_to_bool(op1)
+                if op2.type() == Type.INT:
+                    op2 = Interpreter.__int_to_bool(op2)
+        if operation in self.op_to_lambda[Type.INT]:  # +, -, *, /
+            if op1.type() == Type.BOOL:
+                op1 = Interpreter.__bool_to_int(op1)
+            if op2.type() == Type.BOOL:
+                op2 = Interpreter.__bool_to_int(op2)
+        return (op1, op2)
+
+    def __unary_op_promotion(self, operation, op1):
+        if operation == "!" and op1.type() == Type.INT:
+            op1 = Interpreter.__int_to_bool(op1)
+        return op1
+
+    @staticmethod
+    def __int_to_bool(value):
+        return BOOL_VALUES[value.value() != 0]
+
+    @staticmethod
+    def __bool_to_int(value):
+        return int_value(1 if value.value() else 0)
+
+    def __compatible_types(self, oper, obj1, obj2):
+        # DOCUMENT: allow comparisons ==/!= of anything against anything
+        if oper in ["==", "!="]:
+            return True
+        return obj1.type() == obj2.type()
+
+    def __eval_unary(self, arith_ast, t, f):
+        value_obj = self.__eval_expr(arith_ast.get("op1"))
+        return self.__apply_unary(arith_ast, t, f, value_obj)
+
+    def __apply_unary(self, arith_ast, t, f, value_obj):
+        value_obj = self.__unary_op_promotion(arith_ast.elem_type, value_obj)
+
+        if value_obj.type() != t:
+            super().error(
+                ErrorType.TYPE_ERROR,
+                f"Incompatible type for {arith_ast.elem_type} operation",
+            )
+        return self.new_value[t](f(value_obj.value()))
+
+    def __setup_ops(self):
+        if self.intern_values:
+            new_int, new_bool = int_value, BOOL_VALUES.__getitem__
+        else:
+            new_int, new_bool = partial(Value, Type.INT), partial(Value, Type.BOOL)
+        self.new_value = {Type.INT: new_int, Type.BOOL: new_bool}
+        self.concat = concat_strings if self.ropes else operator.add
+        if self.max_string_length is not None:
+            self.concat = self.__bounded_concat(self.concat)
+        concat = self.concat
+        self.op_to_lambda = {}
+        # set up operations on integers
+        self.op_to_lambda[Type.INT] = {}
+        self.op_to_lambda[Type.INT]["+"] = lambda x, y: new_int(
+            x.value() + y.value()
+        )
+        self.op_to_lambda[Type.INT]["-"] = lambda x, y: new_int(
+            x.value() - y.value()
+        )
+        self.op_to_lambda[Type.INT]["*"] = lambda x, y: new_int(
+            x.value() * y.value()
+        )
+        self.op_to_lambda[Type.INT]["/"] = lambda x, y: new_int(
+            x.value() // y.value()
+        )
+        self.op_to_lambda[Type.INT]["=="] = lambda x, y: new_bool(
+            x.value() == y.value()
+        )
+        self.op_to_lambda[Type.INT]["!="] = lambda x, y: new_bool(
+            x.value() != y.value()
+        )
+        self.op_to_lambda[Type.INT]["<"] = lambda x, y: new_bool(
+            x.value() < y.value()
+        )
+        self.op_to_lambda[Type.INT]["<="] = lambda x, y: new_bool(
+            x.value() <= y.value()
+        )
+        self.op_to_lambda[Type.INT][">"] = lambda x, y: new_bool(
+            x.value() > y.value()
+        )
+        self.op_to_lambda[Type.INT][">="] = lambda x, y: new_bool(
+            x.value() >= y.value()
+        )
+        #  set up operations on strings
+        self.op_to_lambda[Type.STRING] = {}
+        self.op_to_lambda[Type.STRING]["+"] = lambda x, y: Value(
+            x.type(), concat(x.value(), y.value())
+        )
+        self.op_to_lambda[Type.STRING]["=="] = lambda x, y: new_bool(
+            x.value() == y.value()
+        )
+        self.op_to_lambda[Type.STRING]["!="] = lambda x, y: new_bool(
+            x.value() != y.value()
+        )
+        #  set up operations on bools
+        self.op_to_lambda[Type.BOOL] = {}
+        self.op_to_lambda[Type.BOOL]["&&"] = lambda x, y: new_bool(
+            x.value() and y.value()
+        )
+        self.op_to_lambda[Type.BOOL]["||"] = lambda x, y: new_bool(
+            x.value() or y.value()
+        )
+        self.op_to_lambda[Type.BOOL]["=="] = lambda x, y: new_bool(
+            x.value() == y.value()
+        )
+        self.op_to_lambda[Type.BOOL]["!="] = lambda x, y: new_bool(
+            x.value() != y.value()
+        )
+
+        #  set up operations on nil
+        self.op_to_lambda[Type.NIL] = {}
+        self.op_to_lambda[Type.NIL]["=="] = lambda x, y: new_bool(
+            x.value() == y.value()
+        )
+        self.op_to_lambda[Type.NIL]["!="] = lambda x, y: new_bool(
+            x.value() != y.value()
+        )
+
+        #  set up operations on closures
+        self.op_to_lambda[Type.CLOSURE] = {}
+        self.op_to_lambda[Type.CLOSURE]["=="] = lambda x, y: new_bool(
+            x.value() == y.value()
+        )
+        self.op_to_lambda[Type.CLOSURE]["!="] = lambda x, y: new_bool(
+            x.value() != y.value()
+        )
+
+        # set up operations on objects
+        self.op_to_lambda[Type.OBJECT] = {}
+        self.op_to_lambda[Type.OBJECT]["=="] = lambda x, y: new_bool(
+            x.value() == y.value()
+        )
+        self.op_to_lambda[Type.OBJECT]["!="] = lambda x, y: new_bool(
+            x.value() != y.value()
+        )
+
+    # coerces the result of the condition of an if/while node to a python bool
+    def __condition_value(self, result, node):
+        if result.type() == Type.INT:
+            result = Interpreter.__int_to_bool(result)
+        if result.type() != Type.BOOL:
+            super().error(
+                ErrorType.TYPE_ERROR,
+                f"Incompatible type for {node.elem_type} condition",
+            )
+        if self.profile is not None:
+            self.profile.record_branch(node, result.value())
+        return result.value()
+
+    # type-specialized versions of the operations above, keyed by
+    # (operator, left type, right type); they take the operands' python values and
+    # skip promotion and type checking, which is only valid for these type pairs
+    def __setup_quick_ops(self):
+        self.quick_ops = {}
+        new_int, new_bool = self.new_value[Type.INT], self.new_value[Type.BOOL]
+        concat = self.concat
+        int_ops = {
+            "+": lambda x, y: new_int(x + y),
+            "-": lambda x, y: new_int(x - y),
+            "*": lambda x, y: new_int(x * y),
+            "/": lambda x, y: new_int(x // y),
+            "==": lambda x, y: new_bool(x == y),
+            "!=": lambda x, y: new_bool(x != y),
+            "<": lambda x, y: new_bool(x < y),
+            "<=": lambda x, y: new_bool(x <= y),
+            ">": lambda x, y: new_bool(x > y),
+            ">=": lambda x, y: new_bool(x >= y),
+        }
+        for oper, f in int_ops.items():
+            self.quick_ops[(oper, Type.INT, Type.INT)] = f
+        self.quick_ops[("+", Type.STRING, Type.STRING)] = lambda x, y: Value(
+            Type.STRING, concat(x, y)
+        )
+        self.quick_ops[("==", Type.STRING, Type.STRING)] = int_ops["=="]
+        self.quick_ops[("!=", Type.STRING, Type.STRING)] = int_ops["!="]
+        self.quick_ops[("&&", Type.BOOL, Type.BOOL)] = lambda x, y: new_bool(
+            x and y
+        )
+        self.quick_ops[("||", Type.BOOL, Type.BOOL)] = lambda x, y: new_bool(
+            x or y
+        )
+        self.quick_ops[("==", Type.BOOL, Type.BOOL)] = int_ops["=="]
+        self.quick_ops[("!=", Type.BOOL, Type.BOOL)] = int_ops["!="]
+
+    def __do_if(self, if_ast):
+        cond_ast = if_ast.get("condition")
+        result = self.__eval_expr(cond_ast)
+        if result.t is Type.BOOL and self.profile is None:
+            taken = result.v
+        else:
+            taken = self.__condition_value(result, if_ast)
+        if taken:
+            statements = if_ast.get("statements")
+            status, return_val = self.__run_statements(statements)
+            return (status, return_val)
+        else:
+            else_statements = if_ast.get("else_statements")
+            if else_statements is not None:
+                status, return_val = self.__run_statements(else_statements)
+                return (status, return_val)
+
+        return (ExecStatus.CONTINUE, Interpreter.NIL_VALUE)
+
+    def __do_while(self, while_ast):
+        cond_ast = while_ast.get("condition")
+        statements = while_ast.get("statements")
+        compiled = self.compiled.get(while_ast)
+        iterations = self.loop_counts.get(while_ast, 0)
+        profiling = self.profile is not None
+        if self.counted_loops is not None:
+            self.__run_counted_loop(while_ast)
+        while compiled is None:
+            result = self.__eval_expr(cond_ast)
+            if result.t is Type.BOOL and not profiling:
+                taken = result.v
+            else:
+                taken = self.__condition_value(result, while_ast)
+            if not taken:
+                break
+            status, return_val = self.__run_statements(statements)
+            if status == ExecStatus.RETURN:
+                return status, return_val
+            if self.tiering:
+                iterations += 1
+                self.loop_counts[while_ast] = iterations
+                if iterations > self.hot_loop_threshold:
+                    # on-stack replacement: all loop state lives in self.env, so
+                    # the compiled loop simply carries on with the next test
+                    compiled = self.__tier_up(while_ast, "loop", iterations)
+
+        if compiled is not None:
+            return_val = compiled()
+            if return_val is not None:
+                return (ExecStatus.RETURN, return_val)
+        return (ExecStatus.CONTINUE, Interpreter.NIL_VALUE)
+
+    # the counted loop for while_ast, or None if it isn't one
+    def __counted_loop(self, while_ast):
+        if while_ast not in self.counted_loops:
+            self.counted_loops[while_ast] = recognize_counted_loop(while_ast)
+        return self.counted_loops[while_ast]
+
+    # runs while_ast to completion in closed form if it is a counted loop whose
+    # variables qualify, so that its condition fails on the next test; otherwise
+    # leaves it to run normally
+    def __run_counted_loop(self, while_ast):
+        loop = self.__counted_loop(while_ast)
+        if loop is None:
+            return
+        results = loop.run(self.env.get)
+        if results is None:
+            self.counted_loop_stats["fallback"] += 1
+            return
+        if self.max_steps is not None:
+            trips = (results[loop.induction] - self.env.get(loop.induction).v) // loop.step
+            self.steps_left -= trips * len(while_ast.get("statements"))
+            if self.steps_left < 0:
+                self.__out_of_steps()
+        for var_name, val in results.items():
+            self.env.get(var_name).v = val
+        self.counted_loop_stats["closed_form"] += 1
+
+    def __do_return(self, return_ast):
+        expr_ast = return_ast.get("expression")
+        if expr_ast is None:
+            return (ExecStatus.RETURN, Interpreter.NIL_VALUE)
+        value_obj = copy.deepcopy(self.__eval_expr(expr_ast))
+        return (ExecStatus.RETURN, value_obj)
+
+    # Resource governor
+    #
+    # Every run (run_main, call, each call of a bind_call function, and
+    # run_main_async) starts with fresh budgets, and a program that goes over
+    # one stops with a RESOURCE_ERROR:
+    #   max_steps          statements executed, counted as each one starts. A
+    #                      counted loop run in closed form is charged for the
+    #                      statements of all its iterations, and under opt_level
+    #                      each basic block of the IR entered counts as one
+    #   max_call_depth     calls in progress at once; in the tree walker, running
+    #                      out of python's recursion limit first is reported as
+    #                      the same error
+    #   max_objects_created
+    #                      objects (@) and closures (lambda) created over the
+    #                      run, whether or not they are still alive, so that
+    #                      the count doesn't depend on when python frees them;
+    #                      a long run that keeps making short-lived objects
+    #                      needs a budget for all of them
+    #   max_output_bytes   UTF-8 bytes printed, counting a line break per line;
+    #                      the line that would go over isn't printed
+    #   max_string_length  characters in a string made by +, checked by the
+    #                      operation tables, which an instance with this limit
+    #                      builds for itself instead of sharing them
+    # Without a limit, the step and object budgets count down from UNLIMITED,
+    # so that counting is a subtraction and a comparison with no test of
+    # whether there is a limit at all. The counts only depend on the program,
+    # its input and the options, so a program goes over a limit at the same
+    # point on every run.
+
+    def __out_of_steps(self):
+        super().error(
+            ErrorType.RESOURCE_ERROR,
+            f"Step limit of {self.max_steps} statements exceeded",
+        )
+
+    def __count_object(self):
+        self.objects_left -= 1
+        if self.objects_left < 0:
+            super().error(
+                ErrorType.RESOURCE_ERROR,
+                f"Limit of {self.max_objects_created} objects and closures created exceeded",
+            )
+
+    def __count_output(self, v):
+        self.output_bytes_left -= len(v.encode("utf-8")) + 1
+        if self.output_bytes_left < 0:
+            super().error(
+                ErrorType.RESOURCE_ERROR,
+                f"Output limit of {self.max_output_bytes} bytes exceeded",
+            )
+
+    def __bounded_concat(self, concat):
+        limit = self.max_string_length
+        error = super().error
+
+        def bounded_concat(x, y):
+            if len(x) + len(y) > limit:
+                error(
+                    ErrorType.RESOURCE_ERROR,
+                    f"String length limit of {limit} characters exceeded",
+                )
+            return concat(x, y)
+
+        return bounded_concat
+
+    def __recursion_limit(self):
+        super().error(
+            ErrorType.RESOURCE_ERROR,
+            f"Python's recursion limit reached at call depth {self.call_depth} "
+            "(explicit_stack=True allows deeper recursion)",
+        )
+
+    # Interned values
+    #
+    # Literals, and the ints and bools that operations produce, are
+    # SharedValues (see type_value_v4.py) instead of new Values. Every literal
+    # node keeps its Value in its quick field, and literals with the same value
+    # share one. Bools, nil and ints from SMALL_INT_MIN to SMALL_INT_MAX come
+    # from tables. (NIL is the nil literal's Value; NIL_VALUE, which functions
+    # without a return value give back, is the string "nil" that create_value
+    # makes of it.) A variable's Value is updated in place, so variables never
+    # hold a shared one: assignments and non-ref arguments already store a
+    # copy, and a ref parameter bound to a SharedValue gets a copy as well.
+
+    def __intern_constants(self, ast):
+        for node in ast.walk():
+            kind = node.elem_type
+            if kind == InterpreterBase.INT_DEF:
+                node.quick = self.__shared_constant(Type.INT, node.get("val"))
+            elif kind == InterpreterBase.STRING_DEF:
+                node.quick = self.__shared_constant(Type.STRING, node.get("val"))
+            elif kind == InterpreterBase.BOOL_DEF:
+                node.quick = BOOL_VALUES[node.get("val")]
+
+    def __shared_constant(self, t, val):
+        if t is Type.NIL:
+            return NIL
+        if t is Type.BOOL:
+            return BOOL_VALUES[val]
+        if t is Type.INT and SMALL_INT_MIN <= val <= SMALL_INT_MAX:
+            return int_value(val)
+        shared = self.constants.get((t, val))
+        if shared is None:
+            shared = SharedValue(t, val)
+            self.constants[(t, val)] = shared
+        return shared
+
+    # Lazy evaluation
+    #
+    # With lazy=True, an argument or the right-hand side of an assignment to a
+    # variable that needs any work (a call or an operation) is bound as a
+    # Value(Type.THUNK) instead of being evaluated. The thunk is forced when the
+    # variable is first read: it is evaluated once, in the scopes of the call or
+    # assignment that made it, and the Value bound to the variable turns into
+    # the result in place, so ref parameters aliasing it see the result too.
+    #
+    # The variables the delayed expression names are copied into the thunk when
+    # it is made (objects and closures are shared, as closures share them). An
+    # expression that reads an object field is never delayed, since the field
+    # can't be copied, so one made only of operations on variables and literals
+    # gives the same result as it would have eagerly. A call is different: it
+    # runs when the thunk is forced, so the function sees the variables it finds
+    # through dynamic scope, and the fields of any object, as they are then,
+    # which may not be what they were where the call was written. A thunk that
+    # is overwritten or goes out of scope before it is read is never evaluated,
+    # and so never reports its errors. Side effects inside a thunk (print,
+    # inputi, assignments by the functions it calls) also happen when it is
+    # forced rather than where it was written, and so in the order the program
+    # first needs the values; they happen at most once, and assignments to the
+    # copied variables stay with the thunk. Thunks are also forced, oldest
+    # scope first, when a lambda captures them, and a variable's own thunk is
+    # forced before the variable is reassigned from an expression that names
+    # it, so that accumulating loops don't build chains of thunks. A lambda
+    # made while a thunk is being forced shares that thunk instead, and reading
+    # it from the lambda before the thunk is done is an error.
+
+    # whether expr_ast is bound as a thunk: it has to need some work, and not
+    # read an object field
+    def __delayable(self, expr_ast):
+        if expr_ast.elem_type not in Interpreter.LAZY_KINDS:
+            return False
+        delayable = self.delayable.get(expr_ast)
+        if delayable is None:
+            delayable = not any(
+                node.elem_type == InterpreterBase.VAR_DEF and "." in node.get("name")
+                for node in expr_ast.walk()
+            )
+            self.delayable[expr_ast] = delayable
+        return delayable
+
+    def __delay(self, expr_ast, deep, target=None):
+        names = self.thunk_names.get(expr_ast)
+        if names is None:
+            names = set()
+            for node in expr_ast.walk():
+                kind = node.elem_type
+                if kind == InterpreterBase.VAR_DEF or kind == InterpreterBase.FCALL_DEF:
+                    names.add(node.get("name").split(".")[0])
+                elif kind == InterpreterBase.MCALL_DEF:
+                    names.add(node.get("objref"))
+            self.thunk_names[expr_ast] = names
+        if target is not None:
+            names = names | {target}
+        snapshot = {}
+        for var_name in names:
+            value_obj = self.env.get(var_name)
+            if value_obj is None:
+                continue
+            if value_obj.t is Type.THUNK and var_name == target:
+                self.__force(value_obj)
+            if value_obj.t is Type.OBJECT or value_obj.t is Type.CLOSURE:
+                snapshot[var_name] = value_obj
+            else:
+                snapshot[var_name] = Value(value_obj.t, value_obj.v)
+        self.thunk_stats["delayed"] += 1
+        env = self.env.fork()
+        env.push(snapshot)
+        thunk = Thunk(expr_ast, env, list(self.current_val_object_mcall), deep)
+        return Value(Type.THUNK, thunk)
+
+    # evaluates the thunk held by value_obj, if that hasn't happened yet, and
+    # makes value_obj hold its result
+    def __force(self, value_obj):
+        thunk = value_obj.v
+        if thunk.forcing:
+            super().error(
+                ErrorType.NAME_ERROR,
+                "Variable read while the value being assigned to it is computed",
+            )
+        if thunk.result is None:
+            thunk.forcing = True
+            env, receivers = self.env, self.current_val_object_mcall
+            self.env = thunk.env
+            self.current_val_object_mcall = thunk.receivers
+            try:
+                thunk.result = self.__eval_expr(thunk.expr_ast)
+            finally:
+                self.env, self.current_val_object_mcall = env, receivers
+                thunk.forcing = False
+            thunk.env = thunk.receivers = None
+            self.thunk_stats["forced"] += 1
+        value_obj.set(copy.deepcopy(thunk.result) if thunk.deep else thunk.result)
+        return value_obj
+
+    def __force_env(self):
+        for _, value_obj in list(self.env):
+            if value_obj.t is Type.THUNK and not value_obj.v.forcing:
+                self.__force(value_obj)
+
+    # Compiled tier
+    #
+    # Hot functions and loops are translated once into trees of python closures
+    # that call each other directly, so executing them no longer dispatches on
+    # elem_type or re-reads the AST. A compiled expression returns its Value; a
+    # compiled statement or block returns None to continue, or the Value being
+    # returned by a return statement. Anything that isn't on a hot path is
+    # delegated to the same helpers the tree walker uses, so both tiers share
+    # their semantics and error reporting.
+
+    def __tier_up(self, node, kind, count):
+        if kind == "function":
+            compiled = self.__compile_block(node.get("statements"))
+        else:
+            compiled = self.__compile_while(node)
+        self.compiled[node] = compiled
+        self.tier_transitions.append((kind, self.__site_label(node), count))
+        if self.profile is not None:
+            self.profile.record_tier_up(node, kind)
+        return compiled
+
+    # tiering counters and transitions, keyed by a readable label for each site
+    def get_tier_stats(self):
+        return {
+            "functions": {
+                self.__site_label(n): c for n, c in self.call_counts.items()
+            },
+            "loops": {self.__site_label(n): c for n, c in self.loop_counts.items()},
+            "transitions": list(self.tier_transitions),
+        }
+
+    # labels functions as name/arity, and every other node by its kind and position
+    # among nodes of that kind in the enclosing function, e.g. "main/0:while#2"
+    def __site_label(self, node):
+        if self.site_labels is None:
+            self.site_labels = {}
+            for func_def in self.program_ast.get("functions"):
+                func_label = f"{func_def.get('name')}/{len(func_def.get('args'))}"
+                self.site_labels[func_def] = func_label
+                counts = {}
+                for sub in func_def.walk():
+                    if sub is not func_def:
+                        counts[sub.elem_type] = counts.get(sub.elem_type, 0) + 1
+                        self.site_labels[sub] = f"{func_label}:{sub.elem_type}#{counts[sub.elem_type]}"
+        return self.site_labels.get(node, node.elem_type)
+
+    def __compile_block(self, statements):
+        compiled_statements = [self.__compile_statement(s) for s in statements]
+
+        def run_block():
+            env = self.env
+            env.push()
+            for statement in compiled_statements:
+                self.steps_left -= 1
+                if self.steps_left < 0:
+                    self.__out_of_steps()
+                return_val = statement()
+                if return_val is not None:
+                    env.pop()
+                    return return_val
+            env.pop()
+            return None
+
+        return run_block
+
+    def __compile_statement(self, statement):
+        kind = statement.elem_type
+        if kind == InterpreterBase.FCALL_DEF or kind == InterpreterBase.MCALL_DEF:
+            call = self.__compile_call(statement)
+
+            def run_call():
+                call()
+
+            return run_call
+        if kind == "=":
+            return self.__compile_assign(statement)
+        if kind == InterpreterBase.RETURN_DEF:
+            if statement.get("expression") is None:
+                return lambda: Interpreter.NIL_VALUE
+            expr = self.__compile_expr(statement.get("expression"))
+            return lambda: copy.deepcopy(expr())
+        if kind == InterpreterBase.IF_DEF:
+            return self.__compile_if(statement)
+        if kind == InterpreterBase.WHILE_DEF:
+            return self.__compile_while(statement)
+        return lambda: None
+
+    def __compile_assign(self, assign_ast):
+        var_name = assign_ast.get("name")
+        expr = self.__compile_expr(assign_ast.get("expression"))
+        if var_name == "this" or "." in var_name:
+            return lambda: self.__assign_value(var_name, expr())
+
+        assign_name = self.__assign_name
+        return lambda: assign_name(var_name, expr())
+
+    # same as __assign_value for a plain variable name: an existing variable is
+    # updated in place, a new one gets its own copy of the value
+    def __assign_name(self, var_name, src_value_obj):
+        target_value_obj = self.env.get(var_name)
+        if target_value_obj is None:
+            self.env.set(var_name, Value(src_value_obj.t, src_value_obj.v))
+        elif target_value_obj.t is Type.CLOSURE:
+            self.__assign_value(var_name, src_value_obj)
+        else:
+            target_value_obj.set(src_value_obj)
+
+    def __compile_if(self, if_ast):
+        cond = self.__compile_expr(if_ast.get("condition"))
+        then_block = self.__compile_block(if_ast.get("statements"))
+        else_statements = if_ast.get("else_statements")
+        else_block = None
+        if else_statements is not None:
+            else_block = self.__compile_block(else_statements)
+
+        profiling = self.profile is not None
+
+        def run_if():
+            result = cond()
+            if result.t is Type.BOOL and not profiling:
+                taken = result.v
+            else:
+                taken = self.__condition_value(result, if_ast)
+            if taken:
+                return then_block()
+            if else_block is not None:
+                return else_block()
+            return None
+
+        return run_if
+
+    def __compile_while(self, while_ast):
+        cond = self.__compile_expr(while_ast.get("condition"))
+        body = self.__compile_block(while_ast.get("statements"))
+        counted = self.counted_loops is not None and self.__counted_loop(while_ast) is not None
+
+        profiling = self.profile is not None
+
+        def run_while():
+            if counted:
+                self.__run_counted_loop(while_ast)
+            while True:
+                result = cond()
+                if result.t is Type.BOOL and not profiling:
+                    taken = result.v
+                else:
+                    taken = self.__condition_value(result, while_ast)
+                if not taken:
+                    return None
+                return_val = body()
+                if return_val is not None:
+                    return return_val
+
+        return run_while
+
+    def __compile_expr(self, expr_ast):
+        kind = expr_ast.elem_type
+        if kind == InterpreterBase.NIL_DEF:
+            return lambda: NIL
+        if kind in (InterpreterBase.INT_DEF, InterpreterBase.STRING_DEF, InterpreterBase.BOOL_DEF):
+            shared = expr_ast.quick
+            if shared is not None:
+                return lambda: shared
+        if kind == InterpreterBase.INT_DEF:
+            int_val = expr_ast.get("val")
+            return lambda: Value(Type.INT, int_val)
+        if kind == InterpreterBase.STRING_DEF:
+            str_val = expr_ast.get("val")
+            return lambda: Value(Type.STRING, str_val)
+        if kind == InterpreterBase.BOOL_DEF:
+            bool_val = expr_ast.get("val")
+            return lambda: Value(Type.BOOL, bool_val)
+        if kind == InterpreterBase.VAR_DEF:
+            return self.__compile_name(expr_ast)
+        if kind == InterpreterBase.FCALL_DEF or kind == InterpreterBase.MCALL_DEF:
+            return self.__compile_call(expr_ast)
+        if kind == InterpreterBase.OBJ_DEF:
+            count_object = self.__count_object
+
+            def new_object():
+                count_object()
+                return Value(Type.OBJECT, Object())
+
+            return new_object
+        if kind in Interpreter.BIN_OPS:
+            return self.__compile_op(expr_ast)
+        if kind == Interpreter.NEG_DEF or kind == Interpreter.NOT_DEF:
+            operand = self.__compile_expr(expr_ast.get("op1"))
+            if kind == Interpreter.NEG_DEF:
+                t, f = Type.INT, lambda x: -1 * x
+            else:
+                t, f = Type.BOOL, lambda x: not x
+            apply_unary = self.__apply_unary
+            if expr_ast.get("op1").static_type is t:
+                new_value = self.new_value[t]
+
+                def run_quick_unary():
+                    value_obj = operand()
+                    if value_obj.t is t:
+                        return new_value(f(value_obj.v))
+                    return apply_unary(expr_ast, t, f, value_obj)
+
+                return run_quick_unary
+            return lambda: apply_unary(expr_ast, t, f, operand())
+        if kind == Interpreter.LAMBDA_DEF:
+            count_object = self.__count_object
+
+            def new_closure():
+                count_object()
+                return Value(Type.CLOSURE, Closure(expr_ast, self.env))
+
+            return new_closure
+        return lambda: None
+
+    def __compile_name(self, name_ast):
+        var_name = name_ast.get("name")
+        if var_name == "this" or "." in var_name:
+            return lambda: self.__eval_name(name_ast)
+
+        def load():
+            val = self.env.get(var_name)
+            if val is not None:
+                return val
+            return self.__eval_name(name_ast)
+
+        return load
+
+    # operand types proven by inference still get a type check: a caller's ref
+    # parameter, reached through dynamic scope, can change the type of a variable
+    # behind the function's back (see typeinfer_v4.py)
+    def __compile_op(self, arith_ast):
+        left = self.__compile_expr(arith_ast.get("op1"))
+        right = self.__compile_expr(arith_ast.get("op2"))
+        left_type = arith_ast.get("op1").static_type
+        right_type = arith_ast.get("op2").static_type
+        f = self.quick_ops.get((arith_ast.elem_type, left_type, right_type))
+        if self.short_circuit and arith_ast.elem_type in Interpreter.LOGIC_OPS:
+            return self.__compile_logic_op(arith_ast, left, right, f)
+        apply_bin_op = self.__apply_bin_op
+        if f is not None and self.profile is None:
+
+            def run_quick_op():
+                left_value_obj = left()
+                right_value_obj = right()
+                if left_value_obj.t is left_type and right_value_obj.t is right_type:
+                    return f(left_value_obj.v, right_value_obj.v)
+                return apply_bin_op(arith_ast, left_value_obj, right_value_obj)
+
+            return run_quick_op
+        return lambda: apply_bin_op(arith_ast, left(), right())
+
+    def __compile_logic_op(self, arith_ast, left, right, f):
+        short_circuit = self.__short_circuit
+        apply_bin_op = self.__apply_bin_op
+        if f is not None and self.profile is None:
+            deciding = arith_ast.elem_type == "||"
+            left_type = arith_ast.get("op1").static_type
+            right_type = arith_ast.get("op2").static_type
+
+            def run_quick_logic_op():
+                left_value_obj = left()
+                if left_value_obj.t is not left_type:
+                    result = short_circuit(arith_ast, left_value_obj)
+                    if result is not None:
+                        return result
+                    return apply_bin_op(arith_ast, left_value_obj, right())
+                left_val = left_value_obj.v
+                if left_val == deciding:
+                    return BOOL_VALUES[left_val]
+                right_value_obj = right()
+                if right_value_obj.t is not right_type:
+                    return apply_bin_op(arith_ast, left_value_obj, right_value_obj)
+                return f(left_val, right_value_obj.v)
+
+            return run_quick_logic_op
+
+
+        def run_logic_op():
+            left_value_obj = left()
+            result = short_circuit(arith_ast, left_value_obj)
+            if result is not None:
+                return result
+            return apply_bin_op(arith_ast, left_value_obj, right())
+
+        return run_logic_op
+
+    def __compile_call(self, call_ast):
+        func_name = call_ast.get("name")
+        args = [self.__compile_expr(arg) for arg in call_ast.get("args")]
+        if func_name == "print" and call_ast.elem_type == "fcall":
+            return lambda: self.__print_values([arg() for arg in args])
+        if func_name == "inputi" and call_ast.elem_type == "fcall":
+
+            def call_input():
+                if len(args) == 1:
+                    self.output(get_printable(args[0]()))
+                return self.__read_input(call_ast)
+
+            return call_input
+
+        def call():
+            target_closure = self.__resolve_call_target(call_ast)
+            target_ast = target_closure.func_ast
+            new_env = {}
+            self.__prepare_env_with_closed_variables(target_closure, new_env)
+            self.__check_arity(target_ast, call_ast)
+            for formal_ast, arg in zip(target_ast.get("args"), args):
+                self.__bind_param(formal_ast, arg(), new_env)
+            return self.__invoke(call_ast, target_ast, new_env)
+
+        return call
+
+    # IR execution
+    #
+    # With an opt_level, each function or lambda is lowered to the IR of ir_v4.py
+    # the first time it is called and run by __run_ir, which keeps the function's
+    # temporaries in a list of registers and follows the control-flow graph block
+    # by block. Instructions are carried out by the same helpers the tree walker
+    # uses, so quickening, profiling, memoization and error reporting behave the
+    # same in both.
+
+    def __ir_function(self, func_ast):
+        fn = self.ir_functions.get(func_ast)
+        if fn is None:
+            fn = self.pass_manager.compile(func_ast)
+            if self.intern_values:
+                for block in fn.blocks:
+                    for instr in block.instrs:
+                        if instr.op == "const":
+                            instr.quick = self.__shared_constant(*instr.args)
+            self.ir_functions[func_ast] = fn
+        return fn
+
+    # IR lowering and pass statistics: runs and seconds per pass
+    def get_pass_stats(self):
+        if self.pass_manager is None:
+            return {}
+        return self.pass_manager.stats
+
+    def __run_ir(self, fn):
+        regs = [None] * fn.num_regs
+        env = self.env
+        block = fn.entry
+        prev_block = None
+        while True:
+            self.steps_left -= 1
+            if self.steps_left < 0:
+                self.__out_of_steps()
+            for instr in block.instrs:
+                op = instr.op
+                if op == "load_var":
+                    val = env.get(instr.args[0])
+                    regs[instr.dst] = val if val is not None else self.__eval_name(instr.node)
+                elif op == "const":
+                    regs[instr.dst] = instr.quick or Value(*instr.args)
+                elif op == "binop":
+                    left, right = instr.srcs
+                    regs[instr.dst] = self.__apply_bin_op(instr.node, regs[left], regs[right])
+                elif op == "store":
+                    var_name = instr.args[0]
+                    if var_name == "this" or "." in var_name:
+                        self.__assign_value(var_name, regs[instr.srcs[0]])
+                    else:
+                        self.__assign_name(var_name, regs[instr.srcs[0]])
+                elif op == "push":
+                    env.push()
+                elif op == "pop":
+                    env.pop()
+                elif op == "callee":
+                    target_closure = self.__resolve_call_target(instr.node)
+                    target_ast = target_closure.func_ast
+                    new_env = {}
+                    self.__prepare_env_with_closed_variables(target_closure, new_env)
+                    self.__check_arity(target_ast, instr.node)
+                    regs[instr.dst] = (target_ast, new_env)
+                elif op == "arg":
+                    target_ast, new_env = regs[instr.srcs[0]]
+                    formal_ast = target_ast.get("args")[instr.args[0]]
+                    self.__bind_param(formal_ast, regs[instr.srcs[1]], new_env)
+                elif op == "call":
+                    target_ast, new_env = regs[instr.srcs[0]]
+                    regs[instr.dst] = self.__invoke(instr.node, target_ast, new_env)
+                elif op == "unary":
+                    t, f = instr.args
+                    regs[instr.dst] = self.__apply_unary(instr.node, t, f, regs[instr.srcs[0]])
+                elif op == "print":
+                    regs[instr.dst] = self.__print_values([regs[r] for r in instr.srcs])
+                elif op == "input":
+                    if instr.srcs:
+                        self.output(get_printable(regs[instr.srcs[0]]))
+                    regs[instr.dst] = self.__read_input(instr.node)
+                elif op == "load":
+                    regs[instr.dst] = self.__eval_name(instr.node)
+                elif op == "object":
+                    self.__count_object()
+                    regs[instr.dst] = Value(Type.OBJECT, Object())
+                elif op == "lambda":
+                    self.__count_object()
+                    regs[instr.dst] = Value(Type.CLOSURE, Closure(instr.node, env))
+                elif op == "counted_loop":
+                    if self.counted_loops is not None:
+                        self.__run_counted_loop(instr.node)
+                elif op == "phi":
+                    regs[instr.dst] = regs[instr.srcs[instr.args.index(prev_block)]]
+            term = block.term
+            prev_block = block
+            if term.op == "jump":
+                block = term.targets[0]
+            elif term.op == "shortcut":
+                decided = self.__short_circuit(term.node, regs[term.srcs[0]])
+                block = term.targets[0] if decided is not None else term.targets[1]
+            elif term.op == "branch":
+                result = regs[term.srcs[0]]
+                if result.t is Type.BOOL and self.profile is None:
+                    taken = result.v
+                else:
+                    taken = self.__condition_value(result, term.node)
+                block = term.targets[0] if taken else term.targets[1]
+            else:
+                return_val = Interpreter.NIL_VALUE
+                if term.srcs:
+                    return_val = copy.deepcopy(regs[term.srcs[0]])
+                for _ in range(term.args[0]):
+                    env.pop()
+                return return_val
+
+    # Explicit-stack evaluation
+    #
+    # The __step_* methods mirror the recursive evaluator above, but instead of
+    # calling each other they yield the sub-computation they need and receive its
+    # result back from __drive, which keeps the pending frames in a plain list.
+    # A sub-computation is either a generator (pushed as a new frame) or an
+    # already-computed Value (sent straight back), so leaf expressions never
+    # allocate a frame. Everything that doesn't recurse is shared with the
+    # recursive evaluator.
+
+    def __drive(self, frame):
+        stack = [frame]
+        result = None
+        while True:
+            try:
+                child = frame.send(result)
+            except StopIteration as done:
+                stack.pop()
+                if not stack:
+                    return done.value
+                frame = stack[-1]
+                result = done.value
+                continue
+            if isinstance(child, Value):
+                result = child
+            else:
+                stack.append(child)
+                frame = child
+                result = None
+
+    # Async execution
+    #
+    # run_async drives the same explicit stack frames as __drive, but from a
+    # coroutine, so many programs can run in one event loop. print and inputi
+    # yield an IoRequest instead of doing their I/O, and __drive_async awaits
+    # it: get_input_async and output_async use the input_provider's
+    # read_line_async and output_sink's write_async if they have one (see
+    # AsyncQueueInput and AsyncQueueSink), and the blocking versions otherwise.
+    # Every yield_every steps it also lets other tasks run, so a program that
+    # computes for a long time doesn't hold up the ones waiting on I/O.
+
+    async def run_async(self, program):
+        self.load(program)
+        await self.run_main_async()
+
+    async def run_main_async(self):
+        self.__start_run()
+        main_func = self.__get_func_by_name("main", 0)
+        if main_func is None:
+            super().error(ErrorType.NAME_ERROR, "Function main not found")
+        self.async_io = True
+        try:
+            await self.__drive_async(self.__step_statements(main_func.func_ast.get("statements")))
+        finally:
+            self.async_io = False
+            self.__end_run()
+
+    async def get_input_async(self):
+        read_line_async = getattr(self.input_provider, "read_line_async", None)
+        if read_line_async is None:
+            return self.get_input()
+        return await read_line_async()
+
+    async def output_async(self, v):
+        write_async = getattr(self.output_sink, "write_async", None)
+        if write_async is None:
+            self.output(v)
+        else:
+            if self.max_output_bytes is not None:
+                self.__count_output(v)
+            await write_async(v)
+
+    async def __drive_async(self, frame):
+        stack = [frame]
+        result = None
+        steps = 0
+        while True:
+            steps += 1
+            if steps == self.yield_every:
+                steps = 0
+                await asyncio.sleep(0)
+            try:
+                child = frame.send(result)
+            except StopIteration as done:
+                stack.pop()
+                if not stack:
+                    return done.value
+                frame = stack[-1]
+                result = done.value
+                continue
+            if isinstance(child, Value):
+                result = child
+            elif type(child) is IoRequest:
+                if child.kind == "input":
+                    result = await self.get_input_async()
+                else:
+                    await self.output_async(child.line)
+                    result = None
+            else:
+                stack.append(child)
+                frame = child
+                result = None
+
+    def __step_statements(self, statements):
+        self.env.push()
+        for statement in statements:
+            if self.trace_output:
+                print(statement)
+            self.steps_left -= 1
+            if self.steps_left < 0:
+                self.__out_of_steps()
+            status = ExecStatus.CONTINUE
+            if statement.elem_type == InterpreterBase.FCALL_DEF:
+                yield self.__step_call(statement)
+            elif statement.elem_type == InterpreterBase.MCALL_DEF:
+                yield self.__step_call(statement)
+            elif statement.elem_type == "=":
+                value_obj = yield self.__step_expr(statement.get("expression"))
+                self.__assign_value(statement.get("name"), value_obj)
+            elif statement.elem_type == InterpreterBase.RETURN_DEF:
+                status, return_val = yield self.__step_return(statement)
+            elif statement.elem_type == Interpreter.IF_DEF:
+                status, return_val = yield self.__step_if(statement)
+            elif statement.elem_type == Interpreter.WHILE_DEF:
+                status, return_val = yield self.__step_while(statement)
+
+            if status == ExecStatus.RETURN:
+                self.env.pop()
+                return (status, return_val)
+
+        self.env.pop()
+        return (ExecStatus.CONTINUE, Interpreter.NIL_VALUE)
+
+    def __step_call(self, call_ast):
+        func_name = call_ast.get("name")
+        args = call_ast.get("args")
+        if func_name == "print" and call_ast.elem_type == "fcall":
+            values = []
+            for arg in args:
+                values.append((yield self.__step_expr(arg)))
+            if self.async_io:
+                yield IoRequest("output", "".join([get_printable(r) for r in values]))
+                return Interpreter.NIL_VALUE
+            return self.__print_values(values)
+        if func_name == "inputi" and call_ast.elem_type == "fcall":
+            if args is not None and len(args) == 1:
+                result = yield self.__step_expr(args[0])
+                if self.async_io:
+                    yield IoRequest("output", get_printable(result))
+                else:
+                    self.output(get_printable(result))
+            if self.async_io:
+                self.__check_input_args(call_ast)
+                inp = yield IoRequest("input")
+                return self.__input_value(call_ast, inp)
+            return self.__read_input(call_ast)
+
+        target_closure = self.__resolve_call_target(call_ast)
+        target_ast = target_closure.func_ast
+
+        new_env = {}
+        self.__prepare_env_with_closed_variables(target_closure, new_env)
+        self.__check_arity(target_ast, call_ast)
+        for formal_ast, actual_ast in zip(target_ast.get("args"), args):
+            result = yield self.__step_expr(actual_ast)
+            self.__bind_param(formal_ast, result, new_env)
+        if self.profile is not None:
+            self.__record_call(call_ast)
+        memo_key = None
+        if self.memo_tables:
+            memo_key = self.__memo_key(call_ast, target_ast, new_env)
+            if memo_key is not None:
+                cached = self.memo_tables[target_ast].lookup(memo_key)
+                if cached is not None:
+                    return Value(cached[0], cached[1])
+        self.__enter_call()
+        self.env.push(new_env)
+        _, return_val = yield self.__step_statements(target_ast.get("statements"))
+        self.env.pop()
+        self.__exit_call(call_ast)
+        if memo_key is not None:
+            self.memo_tables[target_ast].store(memo_key, return_val)
+        return return_val
+
+    # returns either the Value of a leaf expression or a generator computing it
+    def __step_expr(self, expr_ast):
+        if expr_ast.elem_type in Interpreter.BIN_OPS:
+            return self.__step_op(expr_ast)
+        if expr_ast.elem_type == InterpreterBase.FCALL_DEF:
+            return self.__step_call(expr_ast)
+        if expr_ast.elem_type == InterpreterBase.MCALL_DEF:
+            return self.__step_call(expr_ast)
+        if expr_ast.elem_type == Interpreter.NEG_DEF:
+            return self.__step_unary(expr_ast, Type.INT, lambda x: -1 * x)
+        if expr_ast.elem_type == Interpreter.NOT_DEF:
+            return self.__step_unary(expr_ast, Type.BOOL, lambda x: not x)
+        return self.__eval_expr(expr_ast)
+
+    def __step_op(self, arith_ast):
+        left_value_obj = yield self.__step_expr(arith_ast.get("op1"))
+        if self.short_circuit and arith_ast.elem_type in Interpreter.LOGIC_OPS:
+            result = self.__short_circuit(arith_ast, left_value_obj)
+            if result is not None:
+                return result
+        right_value_obj = yield self.__step_expr(arith_ast.get("op2"))
+        return self.__apply_bin_op(arith_ast, left_value_obj, right_value_obj)
+
+    def __step_unary(self, arith_ast, t, f):
+        value_obj = yield self.__step_expr(arith_ast.get("op1"))
+        return self.__apply_unary(arith_ast, t, f, value_obj)
+
+    def __step_if(self, if_ast):
+        result = yield self.__step_expr(if_ast.get("condition"))
+        if self.__condition_value(result, if_ast):
+            return (yield self.__step_statements(if_ast.get("statements")))
+        else_statements = if_ast.get("else_statements")
+        if else_statements is not None:
+            return (yield self.__step_statements(else_statements))
+        return (ExecStatus.CONTINUE, Interpreter.NIL_VALUE)
+
+    def __step_while(self, while_ast):
+        cond_ast = while_ast.get("condition")
+        statements = while_ast.get("statements")
+        if self.counted_loops is not None:
+            self.__run_counted_loop(while_ast)
+        while self.__condition_value((yield self.__step_expr(cond_ast)), while_ast):
+            status, return_val = yield self.__step_statements(statements)
+            if status == ExecStatus.RETURN:
+                return status, return_val
+        return (ExecStatus.CONTINUE, Interpreter.NIL_VALUE)
+
+    def __step_return(self, return_ast):
+        expr_ast = return_ast.get("expression")
+        if expr_ast is None:
+            return (ExecStatus.RETURN, Interpreter.NIL_VALUE)
+        value_obj = yield self.__step_expr(expr_ast)
+        return (ExecStatus.RETURN, copy.deepcopy(value_obj))
\ No newline at end of file
@@ -0,0 +1,609 @@
+# Control-flow graph IR for v4 functions
+#
+# lower_function translates the body of a function or lambda into an IRFunction:
+# a list of basic blocks, each holding straight-line instructions and ending in
+# one terminator (jump, branch, shortcut or ret). Every intermediate value is
+# held in its own temporary register, defined by exactly one instruction; where
+# control flow merges two values (after a short-circuit && or ||), a phi at the
+# start of the block picks the one from the block control came from. Names are
+# resolved when lowering: plain variables become load_var, while "this" and
+# field paths become load, and block scopes become explicit push/pop
+# instructions, with each ret recording how many scopes it leaves.
+#
+# Calls are split so that arguments are evaluated and bound in the same order as
+# the tree walker: callee resolves the target (and checks its arity), each
+# argument is evaluated and bound by arg, and call runs the target.
+#
+# Passes transform an IRFunction in place. A PassManager runs a list of them in
+# order, timing each one and, if asked, checking the result with verify after
+# every pass; OPT_LEVELS lists the passes run at -O0 to -O2.
+#
+# python ir_v4.py <program file> [-O0|-O1|-O2]   prints the IR of a program
+import sys
+import time
+
+from brewparse import parse_program
+from intbase import InterpreterBase
+from loops_v4 import recognize_counted_loop
+from specialize_v4 import FOLDABLE
+from typeinfer_v4 import BIN_OPS, LITERAL_TYPES
+from type_value_v4 import Type
+
+LITERAL_KINDS = {t: kind for kind, t in LITERAL_TYPES.items()}
+UNARY_OPS = {
+    InterpreterBase.NEG_DEF: (Type.INT, lambda x: -1 * x),
+    InterpreterBase.NOT_DEF: (Type.BOOL, lambda x: not x),
+}
+
+TERMINATORS = ("jump", "branch", "shortcut", "ret")
+# instructions that can be dropped when their result is unused
+PURE_OPS = ("const", "object", "lambda", "phi")
+
+
+class IRVerifyError(Exception):
+    pass
+
+
+# srcs are the registers an instruction reads, args its immediate operands and
+# node the AST node it came from (used for error messages, quickening and
+# profiling); terminators also have targets, the blocks they may go to
+class Instr:
+    __slots__ = ("op", "dst", "srcs", "args", "node", "targets", "quick")
+
+    def __init__(self, op, dst=None, srcs=(), args=(), node=None, targets=()):
+        self.op = op
+        self.dst = dst
+        self.srcs = srcs
+        self.args = args
+        self.node = node
+        self.targets = targets
+        self.quick = None  # interpreter-specialized version, e.g. a const's shared Value
+
+    def __str__(self):
+        parts = []
+        if self.op in ("binop", "unary"):
+            parts.append(self.node.elem_type)
+        elif self.op in ("load", "callee"):
+            parts.append(self.node.get("name"))
+        if self.op == "phi":
+            parts += [f"%{r} from {b.label}" for r, b in zip(self.srcs, self.args)]
+        else:
+            parts += [f"%{r}" for r in self.srcs]
+        if self.op == "const":
+            parts.append(f"{self.args[0].name} {self.args[1]!r}")
+        elif self.op not in ("unary", "phi"):
+            parts += [repr(a) for a in self.args]
+        parts += [block.label for block in self.targets]
+        text = f"{self.op} {', '.join(parts)}".rstrip()
+        return text if self.dst is None else f"%{self.dst} = {text}"
+
+
+class BasicBlock:
+    def __init__(self, label):
+        self.label = label
+        self.instrs = []
+        self.term = None
+
+    def successors(self):
+        return self.term.targets if self.term is not None else ()
+
+    def phis(self):
+        return [instr for instr in self.instrs if instr.op == "phi"]
+
+
+class IRFunction:
+    def __init__(self, name, func_ast):
+        self.name = name
+        self.func_ast = func_ast
+        self.params = {arg.get("name") for arg in func_ast.get("args")}
+        self.blocks = []
+        self.entry = None
+        self.num_regs = 0
+
+    def new_block(self, hint):
+        block = BasicBlock(f"{hint}{len(self.blocks)}")
+        self.blocks.append(block)
+        return block
+
+    def new_reg(self):
+        self.num_regs += 1
+        return self.num_regs - 1
+
+    def predecessors(self):
+        preds = {block: [] for block in self.blocks}
+        for block in self.blocks:
+            for target in block.successors():
+                preds[target].append(block)
+        return preds
+
+    def reachable(self):
+        seen = [self.entry]
+        seen_set = {self.entry}
+        for block in seen:
+            for target in block.successors():
+                if target not in seen_set:
+                    seen_set.add(target)
+                    seen.append(target)
+        return seen
+
+    def __str__(self):
+        lines = [f"func {self.name}({', '.join(sorted(self.params))}):"]
+        for block in self.blocks:
+            lines.append(f"  {block.label}:")
+            for instr in block.instrs + [block.term]:
+                lines.append(f"    {instr}")
+        return "\n".join(lines)
+
+
+class _Lowering:
+    def __init__(self, func_ast, short_circuit):
+        self.short_circuit = short_circuit
+        name = func_ast.get("name") or InterpreterBase.LAMBDA_DEF
+        self.fn = IRFunction(name, func_ast)
+        self.block = self.fn.entry = self.fn.new_block("entry")
+        self.depth = 0
+        self.statements(func_ast.get("statements"))
+        if self.block is not None:
+            self.terminate(Instr("ret", args=(0,)))
+
+    def emit(self, op, srcs=(), args=(), node=None, result=True):
+        dst = self.fn.new_reg() if result else None
+        self.block.instrs.append(Instr(op, dst, srcs, args, node))
+        return dst
+
+    # ends the current block; code after a terminator is unreachable, so its
+    # statements aren't lowered
+    def terminate(self, instr):
+        self.block.term = instr
+        self.block = None
+
+    def jump(self, target):
+        self.terminate(Instr("jump", targets=(target,)))
+
+    def statements(self, statements):
+        self.emit("push", result=False)
+        self.depth += 1
+        for statement in statements:
+            self.statement(statement)
+            if self.block is None:
+                break
+        self.depth -= 1
+        if self.block is not None:
+            self.emit("pop", result=False)
+
+    def statement(self, statement):
+        kind = statement.elem_type
+        if kind == "=":
+            value = self.expr(statement.get("expression"))
+            self.emit("store", (value,), (statement.get("name"),), statement, result=False)
+        elif kind == InterpreterBase.RETURN_DEF:
+            expr_ast = statement.get("expression")
+            srcs = () if expr_ast is None else (self.expr(expr_ast),)
+            self.terminate(Instr("ret", srcs=srcs, args=(self.depth,), node=statement))
+        elif kind == InterpreterBase.IF_DEF:
+            cond = self.expr(statement.get("condition"))
+            then_block = self.fn.new_block("then")
+            else_statements = statement.get("else_statements")
+            else_block = self.fn.new_block("else") if else_statements is not None else None
+            join_block = self.fn.new_block("endif")
+            self.terminate(
+                Instr(
+                    "branch",
+                    srcs=(cond,),
+                    node=statement,
+                    targets=(then_block, else_block or join_block),
+                )
+            )
+            self.block = then_block
+            self.statements(statement.get("statements"))
+            if self.block is not None:
+                self.jump(join_block)
+            if else_block is not None:
+                self.block = else_block
+                self.statements(else_statements)
+                if self.block is not None:
+                    self.jump(join_block)
+            self.block = join_block
+        elif kind == InterpreterBase.WHILE_DEF:
+            head_block = self.fn.new_block("while")
+            body_block = self.fn.new_block("body")
+            exit_block = self.fn.new_block("endwhile")
+            if recognize_counted_loop(statement) is not None:
+                # may run the whole loop in closed form (see loops_v4.py)
+                self.emit("counted_loop", node=statement, result=False)
+            self.jump(head_block)
+            self.block = head_block
+            cond = self.expr(statement.get("condition"))
+            self.terminate(
+                Instr("branch", srcs=(cond,), node=statement, targets=(body_block, exit_block))
+            )
+            self.block = body_block
+            self.statements(statement.get("statements"))
+            if self.block is not None:
+                self.jump(head_block)
+            self.block = exit_block
+        else:
+            self.expr(statement)
+
+    def expr(self, expr_ast):
+        kind = expr_ast.elem_type
+        if kind in LITERAL_TYPES and kind != InterpreterBase.OBJ_DEF:
+            return self.emit("const", args=(LITERAL_TYPES[kind], expr_ast.get("val")))
+        if kind == InterpreterBase.OBJ_DEF:
+            return self.emit("object")
+        if kind == InterpreterBase.VAR_DEF:
+            var_name = expr_ast.get("name")
+            if var_name == "this" or "." in var_name:
+                return self.emit("load", node=expr_ast)
+            return self.emit("load_var", args=(var_name,), node=expr_ast)
+        if kind in BIN_OPS:
+            left = self.expr(expr_ast.get("op1"))
+            if self.short_circuit and (kind == "&&" or kind == "||"):
+                return self.logic_op(expr_ast, left)
+            right = self.expr(expr_ast.get("op2"))
+            return self.emit("binop", (left, right), node=expr_ast)
+        if kind in UNARY_OPS:
+            operand = self.expr(expr_ast.get("op1"))
+            return self.emit("unary", (operand,), UNARY_OPS[kind], expr_ast)
+        if kind == InterpreterBase.LAMBDA_DEF:
+            return self.emit("lambda", node=expr_ast)
+        return self.call(expr_ast)
+
+    # shortcut goes straight to the join block when the left operand decides the
+    # result, which is then the constant emitted before it; otherwise the right
+    # operand is evaluated and the full operation applied
+    def logic_op(self, expr_ast, left):
+        decided = self.emit("const", args=(Type.BOOL, expr_ast.elem_type == "||"))
+        decided_block = self.block
+        right_block = self.fn.new_block("rhs")
+        join_block = self.fn.new_block("join")
+        self.terminate(
+            Instr("shortcut", srcs=(left,), node=expr_ast, targets=(join_block, right_block))
+        )
+        self.block = right_block
+        right = self.expr(expr_ast.get("op2"))
+        full = self.emit("binop", (left, right), node=expr_ast)
+        full_block = self.block
+        self.jump(join_block)
+        self.block = join_block
+        return self.emit("phi", (decided, full), (decided_block, full_block))
+
+    def call(self, call_ast):
+        args = call_ast.get("args")
+        if call_ast.elem_type == InterpreterBase.FCALL_DEF:
+            if call_ast.get("name") == "print":
+                return self.emit("print", tuple(self.expr(arg) for arg in args), node=call_ast)
+            if call_ast.get("name") == "inputi":
+                # a prompt is only evaluated when there is exactly one argument;
+                # more is an error reported before evaluating any of them
+                srcs = (self.expr(args[0]),) if len(args) == 1 else ()
+                return self.emit("input", srcs, node=call_ast)
+        target = self.emit("callee", node=call_ast)
+        for i, arg in enumerate(args):
+            self.emit("arg", (target, self.expr(arg)), (i,), call_ast, result=False)
+        return self.emit("call", (target,), node=call_ast)
+
+
+def lower_function(func_ast, short_circuit=True):
+    return _Lowering(func_ast, short_circuit).fn
+
+
+def _scope_depths(fn):
+    # open scope depth at the start of each reachable block
+    depths = {fn.entry: 0}
+    for block in fn.reachable():
+        depth = depths[block]
+        for instr in block.instrs:
+            if instr.op == "push":
+                depth += 1
+            elif instr.op == "pop":
+                depth -= 1
+                if depth < 0:
+                    raise IRVerifyError(f"{fn.name}: {block.label} pops a scope that isn't open")
+        if block.term.op == "ret" and block.term.args[0] != depth:
+            raise IRVerifyError(
+                f"{fn.name}: {block.label} returns from {depth} scopes, not {block.term.args[0]}"
+            )
+        for target in block.successors():
+            if depths.setdefault(target, depth) != depth:
+                raise IRVerifyError(
+                    f"{fn.name}: {target.label} is entered with different scope depths"
+                )
+    return depths
+
+
+# checks the structural invariants every pass has to preserve
+def verify(fn):
+    blocks = set(fn.blocks)
+    if fn.entry not in blocks:
+        raise IRVerifyError(f"{fn.name}: entry block is missing")
+    defined = {}
+    for block in fn.blocks:
+        if block.term is None or block.term.op not in TERMINATORS:
+            raise IRVerifyError(f"{fn.name}: {block.label} has no terminator")
+        for instr in block.instrs:
+            if instr.op in TERMINATORS:
+                raise IRVerifyError(f"{fn.name}: {block.label} has {instr.op} before its end")
+        for target in block.successors():
+            if target not in blocks:
+                raise IRVerifyError(f"{fn.name}: {block.label} jumps to unknown {target.label}")
+        for instr in block.instrs:
+            if instr.dst is not None:
+                if instr.dst in defined:
+                    raise IRVerifyError(f"{fn.name}: %{instr.dst} is defined twice")
+                defined[instr.dst] = instr
+    preds = fn.predecessors()
+    reachable = set(fn.reachable())
+    for block in fn.blocks:
+        phis = block.phis()
+        if block.instrs[: len(phis)] != phis:
+            raise IRVerifyError(f"{fn.name}: {block.label} has a phi after other instructions")
+        for phi in phis:
+            if len(phi.srcs) != len(phi.args) or (
+                block in reachable and set(phi.args) != set(preds[block])
+            ):
+                raise IRVerifyError(
+                    f"{fn.name}: a phi in {block.label} doesn't match its predecessors"
+                )
+        for instr in block.instrs + [block.term]:
+            for reg in instr.srcs:
+                if reg not in defined:
+                    raise IRVerifyError(f"{fn.name}: %{reg} is used but never defined")
+            if instr.op in ("arg", "call") and defined[instr.srcs[0]].op != "callee":
+                raise IRVerifyError(f"{fn.name}: {instr.op} doesn't refer to a callee")
+    _scope_depths(fn)
+
+
+PASSES = {}
+
+
+def ir_pass(name):
+    def register(func):
+        PASSES[name] = func
+        return func
+
+    return register
+
+
+# drops the phi entries of edges that no longer exist
+def _prune_phis(fn):
+    preds = fn.predecessors()
+    for block in fn.blocks:
+        for phi in block.phis():
+            entries = [(r, b) for r, b in zip(phi.srcs, phi.args) if b in preds[block]]
+            phi.srcs = tuple(r for r, _ in entries)
+            phi.args = tuple(b for _, b in entries)
+
+
+@ir_pass("simplify-cfg")
+def simplify_cfg(fn):
+    # jumps to an empty block that just jumps on go straight to its target
+    # (unless a phi there needs to know where control came from)
+    def forward(block):
+        seen = set()
+        while (
+            not block.instrs
+            and block.term.op == "jump"
+            and not block.term.targets[0].phis()
+            and block not in seen
+        ):
+            seen.add(block)
+            block = block.term.targets[0]
+        return block
+
+    for block in fn.blocks:
+        block.term.targets = tuple(forward(target) for target in block.term.targets)
+    fn.entry = forward(fn.entry)
+    reachable = set(fn.reachable())
+    fn.blocks = [block for block in fn.blocks if block in reachable]
+
+    # a block that is only ever entered from the block before it is merged into it
+    preds = fn.predecessors()
+    merged = set()
+    for block in fn.blocks:
+        if block in merged:
+            continue
+        while block.term.op == "jump":
+            target = block.term.targets[0]
+            if target is block or target is fn.entry or len(preds[target]) != 1 or target.phis():
+                break
+            block.instrs.extend(target.instrs)
+            block.term = target.term
+            merged.add(target)
+            for succ in target.successors():
+                preds[succ] = [block if p is target else p for p in preds[succ]]
+                for phi in succ.phis():
+                    phi.args = tuple(block if b is target else b for b in phi.args)
+    fn.blocks = [block for block in fn.blocks if block not in merged]
+    _prune_phis(fn)
+
+
+def _fold(instr, consts):
+    if instr.op == "binop":
+        (left_type, left), (right_type, right) = (consts[r] for r in instr.srcs)
+        if left_type is not right_type:
+            return None
+        fold = FOLDABLE.get(LITERAL_KINDS[left_type], {}).get(instr.node.elem_type)
+        if fold is None:
+            return None
+        result_kind, f = fold
+        try:
+            return LITERAL_TYPES[result_kind], f(left, right)
+        except ZeroDivisionError:
+            return None  # left to fail at runtime
+    operand_type, operand = consts[instr.srcs[0]]
+    t, f = instr.args
+    if operand_type is t or (t is Type.BOOL and operand_type is Type.INT):
+        return t, f(operand)
+    return None
+
+
+@ir_pass("fold-constants")
+def fold_constants(fn):
+    consts = {}
+    changed = True
+    while changed:
+        changed = False
+        for block in fn.blocks:
+            for instr in block.instrs:
+                if instr.op == "const":
+                    consts[instr.dst] = instr.args
+                elif instr.op in ("binop", "unary") and all(r in consts for r in instr.srcs):
+                    folded = _fold(instr, consts)
+                    if folded is not None:
+                        instr.op, instr.srcs, instr.args = "const", (), folded
+                        consts[instr.dst] = folded
+                        changed = True
+            term = block.term
+            if term.op in ("branch", "shortcut") and term.srcs[0] in consts:
+                cond_type, cond = consts[term.srcs[0]]
+                if cond_type is Type.INT or cond_type is Type.BOOL:
+                    if term.op == "shortcut":
+                        # the first target is taken when the left operand decides
+                        cond = bool(cond) == (term.node.elem_type == "||")
+                    target = term.targets[0] if cond else term.targets[1]
+                    block.term = Instr("jump", targets=(target,))
+                    changed = True
+    _prune_phis(fn)
+
+
+@ir_pass("dce")
+def eliminate_dead_code(fn):
+    changed = True
+    while changed:
+        used = set()
+        for block in fn.blocks:
+            for instr in block.instrs + [block.term]:
+                used.update(instr.srcs)
+        changed = False
+        for block in fn.blocks:
+            kept = [i for i in block.instrs if i.op not in PURE_OPS or i.dst in used]
+            if len(kept) != len(block.instrs):
+                block.instrs = kept
+                changed = True
+
+
+# A block scope only matters if a variable is created in it: an assignment to a
+# name that isn't already bound in one of the function's open scopes (or a
+# parameter) creates it in the innermost scope. Scopes that never get a new
+# variable are dropped. So is the function's outermost scope, since nothing runs
+# between it closing and the function returning.
+@ir_pass("elide-scopes")
+def elide_scopes(fn):
+    # the state on entry to a block is a tuple of (push, names bound) for each
+    # open scope, innermost last
+    states = {fn.entry: ()}
+    creates = set()
+    outermost = set()
+    closes = {}  # pop -> the push it closes
+    worklist = [fn.entry]
+    while worklist:
+        block = worklist.pop()
+        state = list(states[block])
+        for instr in block.instrs:
+            if instr.op == "push":
+                if not state:
+                    outermost.add(instr)
+                state.append((instr, frozenset()))
+            elif instr.op == "pop":
+                closes[instr] = state.pop()[0]
+            elif instr.op == "store":
+                var_name = instr.args[0]
+                if var_name == "this" or "." in var_name or var_name in fn.params:
+                    continue
+                if not any(var_name in names for _, names in state):
+                    push, names = state[-1]
+                    creates.add(push)
+                    state[-1] = (push, names | {var_name})
+        state = tuple(state)
+        for target in block.successors():
+            old = states.get(target)
+            if old is None:
+                new = state
+            else:
+                if [p for p, _ in old] != [p for p, _ in state]:
+                    return  # scopes aren't nested; leave them alone
+                new = tuple((p, n1 & n2) for (p, n1), (_, n2) in zip(old, state))
+            if new != old:
+                states[target] = new
+                worklist.append(target)
+
+    def elided(push):
+        return push not in creates or push in outermost
+
+    for block in fn.blocks:
+        if block not in states:
+            continue
+        if block.term.op == "ret":
+            open_scopes = [p for p, _ in states[block]]
+            for instr in block.instrs:
+                if instr.op == "push":
+                    open_scopes.append(instr)
+                elif instr.op == "pop":
+                    open_scopes.pop()
+            kept = sum(1 for push in open_scopes if not elided(push))
+            block.term.args = (kept,)
+        block.instrs = [
+            i
+            for i in block.instrs
+            if not (i.op == "push" and elided(i)) and not (i.op == "pop" and elided(closes[i]))
+        ]
+
+
+# Every pass only removes instructions, blocks or scopes, so no level executes
+# more instructions than a lower one. Each level costs more to compile, though,
+# once per function (see get_pass_stats), which a program that only runs for
+# a few milliseconds may not earn back.
+OPT_LEVELS = {
+    0: [],
+    1: ["simplify-cfg", "elide-scopes"],
+    2: ["fold-constants", "dce", "simplify-cfg", "elide-scopes"],
+}
+
+
+class PassManager:
+    def __init__(self, passes, verify_ir=False, short_circuit=True):
+        for name in passes:
+            if name not in PASSES:
+                raise ValueError(f"unknown IR pass {name}")
+        self.passes = list(passes)
+        self.verify_ir = verify_ir
+        self.short_circuit = short_circuit
+        self.stats = {name: {"runs": 0, "seconds": 0.0} for name in ["lower"] + self.passes}
+
+    def timed(self, name, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        stats = self.stats.setdefault(name, {"runs": 0, "seconds": 0.0})
+        stats["runs"] += 1
+        stats["seconds"] += time.perf_counter() - start
+        return result
+
+    # lowers func_ast and runs the passes on it
+    def compile(self, func_ast):
+        fn = self.timed("lower", lower_function, func_ast, self.short_circuit)
+        if self.verify_ir:
+            self.timed("verify", verify, fn)
+        for name in self.passes:
+            self.timed(name, PASSES[name], fn)
+            if self.verify_ir:
+                self.timed("verify", verify, fn)
+        return fn
+
+
+def show_program(path, opt_level):
+    with open(path, encoding="utf-8") as f:
+        ast = parse_program(f.read())
+    manager = PassManager(OPT_LEVELS[opt_level], verify_ir=True)
+    for func_def in ast.get("functions"):
+        print(manager.compile(func_def))
+    for name, stats in manager.stats.items():
+        print(f"# {name:<16} {stats['runs']:4} runs {stats['seconds'] * 1000:8.3f} ms")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python ir_v4.py <program file> [-O0|-O1|-O2]")
+        sys.exit(1)
+    level = int(sys.argv[2][2:]) if len(sys.argv) > 2 else 2
+    show_program(sys.argv[1], level)
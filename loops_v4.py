@@ -0,0 +1,247 @@
+# Closed-form execution of counted v4 loops
+#
+# recognize_counted_loop matches while loops of the form
+#
+#   while (i < n) { s = s + <term>; t = t - <term> + <term>; ...; i = i + c; }
+#
+# The condition compares an induction variable i with a bound (a literal or a
+# variable the body doesn't assign) using <, <=, >, >= or !=, in either order.
+# One statement steps i by integer literals. Every other statement adds terms
+# to, or subtracts them from, an accumulator. Terms use +, - and * over i,
+# integer literals and variables the body doesn't assign.
+#
+# CountedLoop.run computes the final value of i and of every accumulator in
+# one go. Each term is a polynomial in i, so its sum over the iterations has a
+# closed form for degrees up to 3. Higher degrees are summed over the range of
+# i with python built-ins. run returns None when the loop doesn't qualify at
+# runtime: a variable it involves doesn't hold an INT in a Value of its own
+# (ref parameters can alias), or the loop never terminates. The loop then runs
+# normally.
+#
+# NumPy isn't used for the batched case: its fixed-width integers would wrap
+# around where Brewin's integers don't.
+import operator
+
+from intbase import InterpreterBase
+from type_value_v4 import Type
+
+MAX_CLOSED_FORM_DEGREE = 3
+
+COMPARISONS = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "!=": operator.ne,
+}
+SWAPPED = {"<": ">", "<=": ">=", ">": "<", ">=": "<=", "!=": "!="}
+
+
+# polynomials in i are lists of coefficients, lowest degree first
+def poly_add(p, q, sign=1):
+    result = [0] * max(len(p), len(q))
+    for d, c in enumerate(p):
+        result[d] += c
+    for d, c in enumerate(q):
+        result[d] += sign * c
+    return result
+
+
+def poly_mul(p, q):
+    result = [0] * (len(p) + len(q) - 1)
+    for d1, c1 in enumerate(p):
+        for d2, c2 in enumerate(q):
+            result[d1 + d2] += c1 * c2
+    return result
+
+
+# p(x) with x replaced by the polynomial q
+def poly_compose(p, q):
+    result = [0]
+    for c in reversed(p):
+        result = poly_add(poly_mul(result, q), [c])
+    return result
+
+
+def poly_eval(p, x):
+    result = 0
+    for c in reversed(p):
+        result = result * x + c
+    return result
+
+
+# sum of k**d for k in range(m)
+def power_sum(d, m):
+    if d == 0:
+        return m
+    s1 = m * (m - 1) // 2
+    if d == 1:
+        return s1
+    if d == 2:
+        return (m - 1) * m * (2 * m - 1) // 6
+    return s1 * s1
+
+
+def _is_var(node, name=None):
+    return node.elem_type == InterpreterBase.VAR_DEF and (name is None or node.get("name") == name)
+
+
+def _plain_name(name):
+    return name != "this" and "." not in name
+
+
+class CountedLoop:
+    def __init__(self, induction, oper, bound, step, updates, invariants):
+        self.induction = induction
+        self.oper = oper
+        self.bound = bound  # an int, or the name of a variable
+        self.step = step
+        self.updates = updates  # [(accumulator, [(sign, term)], seen_step)]
+        self.names = [induction] + sorted(invariants | {u[0] for u in updates})
+        if isinstance(bound, str) and bound not in self.names:
+            self.names.append(bound)
+
+    # number of iterations starting from i = start, or None if there's no end
+    def trip_count(self, start, bound):
+        if not COMPARISONS[self.oper](start, bound):
+            return 0
+        step = self.step
+        distance = bound - start
+        if self.oper == "!=":
+            if distance % step != 0 or distance // step < 0:
+                return None
+            return distance // step
+        if (step > 0) != (self.oper in ("<", "<=")):
+            return None
+        if self.oper in ("<=", ">="):
+            return distance // step + 1
+        return -(-distance // step)
+
+    # the term's polynomial in i, with the invariants' values filled in
+    def term(self, node, values):
+        kind = node.elem_type
+        if kind == InterpreterBase.INT_DEF:
+            return [node.get("val")]
+        if kind == InterpreterBase.VAR_DEF:
+            if node.get("name") == self.induction:
+                return [0, 1]
+            return [values[node.get("name")]]
+        left = self.term(node.get("op1"), values)
+        right = self.term(node.get("op2"), values)
+        if kind == "*":
+            return poly_mul(left, right)
+        return poly_add(left, right, 1 if kind == "+" else -1)
+
+    # the final values of the induction variable and accumulators, given a
+    # function that looks up the Value of a variable
+    def run(self, lookup):
+        values = {}
+        value_objs = []
+        for name in self.names:
+            value_obj = lookup(name)
+            if value_obj is None or value_obj.t is not Type.INT:
+                return None
+            values[name] = value_obj.v
+            value_objs.append(value_obj)
+        if len({id(v) for v in value_objs}) != len(value_objs):
+            return None
+        start = values[self.induction]
+        bound = values[self.bound] if isinstance(self.bound, str) else self.bound
+        m = self.trip_count(start, bound)
+        if m is None:
+            return None
+
+        results = {self.induction: start + m * self.step}
+        for accumulator, terms, seen_step in self.updates:
+            poly = [0]
+            for sign, node in terms:
+                poly = poly_add(poly, self.term(node, values), sign)
+            # iteration k sees i = start + step * k, or one step further on if it
+            # comes after the step statement
+            first = start + self.step if seen_step else start
+            if len(poly) - 1 <= MAX_CLOSED_FORM_DEGREE:
+                by_k = poly_compose(poly, [first, self.step])
+                total = sum(c * power_sum(d, m) for d, c in enumerate(by_k))
+            else:
+                total = sum(poly_eval(poly, first + self.step * k) for k in range(m))
+            results[accumulator] = results.get(accumulator, values[accumulator]) + total
+        return results
+
+
+# splits a chain of + and - into (sign, operand) terms
+def _flatten(node, sign, terms):
+    if node.elem_type == "+" or node.elem_type == "-":
+        _flatten(node.get("op1"), sign, terms)
+        _flatten(node.get("op2"), sign if node.elem_type == "+" else -sign, terms)
+    else:
+        terms.append((sign, node))
+
+
+def _term_names(node, names):
+    kind = node.elem_type
+    if kind == InterpreterBase.INT_DEF:
+        return True
+    if kind == InterpreterBase.VAR_DEF:
+        if not _plain_name(node.get("name")):
+            return False
+        names.add(node.get("name"))
+        return True
+    if kind in ("+", "-", "*"):
+        return _term_names(node.get("op1"), names) and _term_names(node.get("op2"), names)
+    return False
+
+
+# returns a CountedLoop for while_ast, or None if it isn't a counted loop
+def recognize_counted_loop(while_ast):
+    cond = while_ast.get("condition")
+    oper = cond.elem_type
+    if oper not in COMPARISONS:
+        return None
+    left, right = cond.get("op1"), cond.get("op2")
+    # the induction variable may be on either side of the comparison
+    return _recognize(while_ast, left, oper, right) or _recognize(
+        while_ast, right, SWAPPED[oper], left
+    )
+
+
+def _recognize(while_ast, left, oper, right):
+    if not _is_var(left) or not _plain_name(left.get("name")):
+        return None
+    induction = left.get("name")
+    if right.elem_type == InterpreterBase.INT_DEF:
+        bound = right.get("val")
+    elif _is_var(right) and _plain_name(right.get("name")):
+        bound = right.get("name")
+    else:
+        return None
+
+    step = None
+    updates = []
+    term_names = set()
+    for statement in while_ast.get("statements"):
+        if statement.elem_type != "=" or not _plain_name(statement.get("name")):
+            return None
+        target = statement.get("name")
+        terms = []
+        _flatten(statement.get("expression"), 1, terms)
+        own = [t for t in terms if _is_var(t[1], target)]
+        if len(own) != 1 or own[0][0] != 1:
+            return None
+        terms.remove(own[0])
+        if target == induction:
+            if step is not None or any(n.elem_type != InterpreterBase.INT_DEF for _, n in terms):
+                return None
+            step = sum(sign * n.get("val") for sign, n in terms)
+            if step == 0:
+                return None
+            continue
+        if not all(_term_names(n, term_names) for _, n in terms):
+            return None
+        updates.append((target, terms, step is not None))
+    if step is None:
+        return None
+
+    assigned = {induction} | {u[0] for u in updates}
+    if bound in assigned or (term_names - {induction}) & assigned:
+        return None
+    return CountedLoop(induction, oper, bound, step, updates, term_names - {induction})
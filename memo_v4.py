@@ -0,0 +1,157 @@
+# Memoization of pure v4 functions
+#
+# find_pure_functions decides which top-level functions can be memoized: their
+# result must depend only on their arguments, and calling them must have no
+# effect other than returning it. A pure function
+#   - doesn't call print or inputi, call methods or lambdas, or create objects
+#     or lambdas
+#   - has no ref parameters and doesn't use "this" or object fields
+#   - only reads its parameters and variables it has already assigned, since
+#     any other name would be read from its caller's scope (Brewin is
+#     dynamically scoped)
+#   - only calls top-level functions that are pure themselves
+#
+# Assigning a new local variable is the one effect that can't be ruled out
+# statically: if the caller happens to have a variable of the same name, the
+# assignment updates the caller's variable instead. These names are collected
+# as the function's free writes, and a memoized call only uses its memo table
+# if none of them is bound when the call is made.
+from collections import OrderedDict
+
+from intbase import InterpreterBase
+from type_value_v4 import Type
+
+MEMO_TYPES = (Type.INT, Type.BOOL, Type.STRING, Type.NIL)
+
+
+class _PurityCheck:
+    def __init__(self, func_def):
+        self.pure = True
+        self.free_writes = set()
+        self.callees = set()
+        defined = set()
+        for arg in func_def.get("args"):
+            if arg.elem_type == InterpreterBase.REFARG_DEF:
+                self.pure = False
+            defined.add(arg.get("name"))
+        self.block(func_def.get("statements"), defined)
+
+    # variables first assigned in a block go away with it, so each block works
+    # on its own copy of the defined names
+    def block(self, statements, defined):
+        defined = set(defined)
+        for statement in statements:
+            self.statement(statement, defined)
+
+    def statement(self, statement, defined):
+        kind = statement.elem_type
+        if kind == "=":
+            self.expr(statement.get("expression"), defined)
+            var_name = statement.get("name")
+            if var_name == "this" or "." in var_name:
+                self.pure = False
+            elif var_name not in defined:
+                self.free_writes.add(var_name)
+                defined.add(var_name)
+        elif kind == InterpreterBase.RETURN_DEF:
+            if statement.get("expression") is not None:
+                self.expr(statement.get("expression"), defined)
+        elif kind == InterpreterBase.IF_DEF or kind == InterpreterBase.WHILE_DEF:
+            self.expr(statement.get("condition"), defined)
+            self.block(statement.get("statements"), defined)
+            if statement.get("else_statements") is not None:
+                self.block(statement.get("else_statements"), defined)
+        else:
+            self.expr(statement, defined)
+
+    def expr(self, expr_ast, defined):
+        kind = expr_ast.elem_type
+        if kind in (InterpreterBase.OBJ_DEF, InterpreterBase.LAMBDA_DEF, InterpreterBase.MCALL_DEF):
+            self.pure = False
+        elif kind == InterpreterBase.VAR_DEF:
+            if expr_ast.get("name") not in defined:
+                self.pure = False
+        elif kind == InterpreterBase.FCALL_DEF:
+            name = expr_ast.get("name")
+            if name in ("print", "inputi"):
+                self.pure = False
+            self.callees.add((name, len(expr_ast.get("args"))))
+        for child in expr_ast.children():
+            self.expr(child, defined)
+
+
+# returns {func_def: free write names} for every pure top-level function
+def find_pure_functions(func_defs):
+    by_signature = {}
+    checks = {}
+    for func_def in func_defs:
+        by_signature[(func_def.get("name"), len(func_def.get("args")))] = func_def
+        checks[func_def] = _PurityCheck(func_def)
+    pure = {f: set(c.free_writes) for f, c in checks.items() if c.pure}
+
+    # a function stays pure while all its callees do; it also inherits their free
+    # writes, since they land in whatever scope is visible to the callee
+    changed = True
+    while changed:
+        changed = False
+        for func_def in list(pure):
+            for signature in checks[func_def].callees:
+                callee = by_signature.get(signature)
+                if callee not in pure:
+                    del pure[func_def]
+                    changed = True
+                    break
+                if not pure[callee] <= pure[func_def]:
+                    pure[func_def] |= pure[callee]
+                    changed = True
+    return {f: frozenset(writes) for f, writes in pure.items()}
+
+
+# bounded memo table for one function, evicting the least recently used entry
+class MemoTable:
+    def __init__(self, func_def, free_writes, max_size):
+        self.param_names = [arg.get("name") for arg in func_def.get("args")]
+        self.free_writes = free_writes
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # the memo key for a call's bound parameters, or None if an argument can't
+    # be used as a key
+    def key(self, params):
+        key = []
+        for name in self.param_names:
+            value = params[name]
+            if value.t not in MEMO_TYPES:
+                return None
+            key.append((value.t, value.v))
+        return tuple(key)
+
+    def lookup(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def store(self, key, value):
+        if value.t not in MEMO_TYPES or self.max_size <= 0:
+            return
+        self.entries[key] = (value.t, value.v)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        calls = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / calls if calls else 0.0,
+            "entries": len(self.entries),
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,75 @@
+# Pool of reusable v4 interpreters
+#
+# InterpreterPool creates size Interpreters with the same options up front, and
+# hands them out one at a time, so programs can run without paying for a new
+# Interpreter each time. Every checkout resets the interpreter's I/O, variables
+# and method-call stack (see Interpreter.reset). Everything else stays: the
+# operation tables all instances share, and the last program each interpreter
+# loaded. run prefers a free interpreter that last ran the same program, and
+# otherwise takes the one that has been free the longest and loads the program
+# into it, so programs that are run repeatedly keep their quickened operators
+# and compiled functions.
+#
+# Checkouts block until an interpreter is free, so one pool can be shared by
+# several threads. Loading is serialized, since the parser brewparse.py builds
+# is shared and not reentrant.
+from contextlib import contextmanager
+import threading
+
+from interpreterv4 import Interpreter
+
+POOL_SIZE = 4
+
+_parse_lock = threading.Lock()
+
+
+class InterpreterPool:
+    def __init__(self, size=POOL_SIZE, **options):
+        options.setdefault("console_output", False)
+        self.free = []  # longest free first
+        self.available = threading.Condition()
+        self.loaded = {}  # interpreter -> the program it last loaded
+        for _ in range(size):
+            interpreter = Interpreter(**options)
+            self.loaded[interpreter] = None
+            self.free.append(interpreter)
+
+    # with pool.checkout() as interpreter: ...
+    @contextmanager
+    def checkout(self, program=None):
+        with self.available:
+            while not self.free:
+                self.available.wait()
+            interpreter = next(
+                (i for i in self.free if self.loaded[i] == program), self.free[0]
+            )
+            self.free.remove(interpreter)
+        try:
+            interpreter.reset()
+            yield interpreter
+        finally:
+            interpreter.reset()
+            interpreter.inp = None
+            with self.available:
+                self.free.append(interpreter)
+                self.available.notify()
+
+    # runs program with the given lines of input and returns the lines it
+    # printed, or sends them to output_sink if one is given (see sinks_v4.py).
+    # input_provider, if given, supplies the input instead (see inputs_v4.py)
+    def run(self, program, inputs=None, output_sink=None, input_provider=None):
+        with self.checkout(program) as interpreter:
+            interpreter.inp = None if inputs is None else [str(line) for line in inputs]
+            interpreter.input_provider = input_provider
+            if self.loaded[interpreter] != program:
+                self.loaded[interpreter] = None
+                with _parse_lock:
+                    interpreter.load(program)
+                self.loaded[interpreter] = program
+            interpreter.output_sink = output_sink
+            try:
+                interpreter.run_main()
+            finally:
+                interpreter.output_sink = None
+                interpreter.input_provider = None
+            return interpreter.get_output()
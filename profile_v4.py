@@ -0,0 +1,168 @@
+# Persistent execution profiles for the v4 interpreter
+#
+# A profile records, per site of a program, what the interpreter observed while
+# running it: operand types at binary operators, how often each if/while
+# condition was taken, the arity and receiver shapes seen at call sites, and
+# which functions and loops were promoted to the compiled tier. Profiles are
+# saved in a JSON file keyed by a hash of the program's source, so a later run
+# of the same program can pre-specialize from them instead of warming up again.
+# Options that rewrite the AST (specialize) give the same source a different
+# AST, so they are part of the key as its variant, e.g. "<hash>/specialize=500".
+#
+# python profile_v4.py <profile file> [program hash prefix]   prints profiles
+import hashlib
+import json
+import os
+import sys
+
+
+def program_hash(program):
+    return hashlib.sha256(program.encode("utf-8")).hexdigest()
+
+
+def profile_key(program, variant=""):
+    key = program_hash(program)
+    return f"{key}/{variant}" if variant else key
+
+
+# Sites are AST nodes. They are saved under their preorder position in the
+# program's AST, which is stable across runs of the same source. A saved
+# profile whose AST had a different number of nodes is dropped, and sites
+# that don't match a node of the same kind are skipped, so a profile saved
+# for a differently shaped AST can't be applied to the wrong nodes.
+class Profile:
+    def __init__(self, program, program_ast, saved=None, variant=""):
+        self.key = profile_key(program, variant)
+        self.nodes = list(program_ast.walk())
+        self.site_ids = {node: i for i, node in enumerate(self.nodes)}
+        self.sites = {}
+        self.runs = 0
+        if saved is not None and saved.get("nodes", len(self.nodes)) != len(self.nodes):
+            saved = None
+        if saved is not None:
+            self.runs = saved.get("runs", 0)
+            for site_id, record in saved.get("sites", {}).items():
+                site_id = int(site_id)
+                if not 0 <= site_id < len(self.nodes):
+                    continue
+                node = self.nodes[site_id]
+                if record.get("elem_type") == node.elem_type:
+                    self.sites[node] = record
+
+    def site(self, node, kind):
+        record = self.sites.get(node)
+        if record is None:
+            record = {"kind": kind, "elem_type": node.elem_type}
+            self.sites[node] = record
+        return record
+
+    def record_types(self, node, left_type, right_type):
+        types = self.site(node, "op").setdefault("types", {})
+        key = f"{left_type.name},{right_type.name}"
+        types[key] = types.get(key, 0) + 1
+
+    def record_deopt(self, node):
+        record = self.site(node, "op")
+        record["deopts"] = record.get("deopts", 0) + 1
+
+    def record_branch(self, node, taken):
+        record = self.site(node, "branch")
+        key = "taken" if taken else "not_taken"
+        record[key] = record.get(key, 0) + 1
+
+    def record_call(self, node, arity, receiver_shape=None):
+        record = self.site(node, "call")
+        arities = record.setdefault("arity", {})
+        arities[str(arity)] = arities.get(str(arity), 0) + 1
+        if receiver_shape is not None:
+            shapes = record.setdefault("receivers", {})
+            shapes[receiver_shape] = shapes.get(receiver_shape, 0) + 1
+
+    def record_tier_up(self, node, kind):
+        self.site(node, kind)["tier"] = kind
+
+    # the single operand type pair seen at a binary operator, if it only ever saw one
+    def monomorphic_types(self, node):
+        record = self.sites.get(node)
+        if record is None or record.get("deopts") or len(record.get("types", {})) != 1:
+            return None
+        return next(iter(record["types"])).split(",")
+
+    def tiered_sites(self):
+        return [
+            (node, record["tier"]) for node, record in self.sites.items() if "tier" in record
+        ]
+
+    def to_json(self, label):
+        sites = {}
+        for node, record in self.sites.items():
+            if node not in self.site_ids:
+                continue
+            record["label"] = label(node)
+            sites[str(self.site_ids[node])] = record
+        return {"runs": self.runs, "nodes": len(self.nodes), "sites": sites}
+
+
+def read_profiles(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_profile(path, program, program_ast, variant=""):
+    saved = read_profiles(path).get(profile_key(program, variant))
+    return Profile(program, program_ast, saved, variant)
+
+
+def save_profile(path, profile, label):
+    profiles = read_profiles(path)
+    profile.runs += 1
+    profiles[profile.key] = profile.to_json(label)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(profiles, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def describe(record):
+    kind = record["kind"]
+    tier = f"compiled as {record['tier']}" if "tier" in record else ""
+    if kind == "op":
+        types = ", ".join(f"{t} x{n}" for t, n in record.get("types", {}).items())
+        deopts = record.get("deopts", 0)
+        return f"types {types}" + (f", {deopts} deopts" if deopts else "")
+    if kind == "branch":
+        taken = record.get("taken", 0)
+        not_taken = record.get("not_taken", 0)
+        percent = 100 * taken // max(taken + not_taken, 1)
+        return f"taken {taken}, not taken {not_taken} ({percent}% taken) {tier}".rstrip()
+    if kind == "call":
+        arity = ", ".join(f"{a} args x{n}" for a, n in record.get("arity", {}).items())
+        shapes = record.get("receivers")
+        if shapes:
+            arity += "; receivers " + ", ".join(
+                f"{{{s}}} x{n}" for s, n in shapes.items()
+            )
+        return arity
+    return tier
+
+
+def show_profiles(path, hash_prefix=""):
+    for key, profile in sorted(read_profiles(path).items()):
+        if not key.startswith(hash_prefix):
+            continue
+        hash_value, _, variant = key.partition("/")
+        variant = f" {variant}" if variant else ""
+        print(f"program {hash_value[:16]}{variant} ({profile['runs']} runs)")
+        sites = sorted(profile["sites"].items(), key=lambda item: int(item[0]))
+        for _, record in sites:
+            extra = describe(record)
+            print(f"  {record['label']:<32} {record['kind']:<9} {extra}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python profile_v4.py <profile file> [program hash prefix]")
+        sys.exit(1)
+    show_profiles(*sys.argv[1:3])
@@ -0,0 +1,129 @@
+# Compiled v4 program handles
+#
+# compile parses a program once and returns a Program, which can run main with
+# run_main, or call any top-level function with invoke, as many times as
+# needed. Every run reuses the same Interpreter (see Interpreter.load), so the
+# program is parsed and set up once, and its functions stay quickened and
+# compiled from one run to the next. Each run starts with empty variables and
+# output.
+#
+# Host values are converted to Values by their python type: None to nil,
+# bools, ints and strings to the Brewin type of the same name, and dicts to
+# objects, field by field. Values are passed through as they are. Results
+# convert back the same way, except that objects and closures are returned as
+# their Value, which can be passed to later calls. A function that doesn't
+# return a value gives None.
+#
+# invoke_batch calls one function over many rows of arguments, looking the
+# function up once (see Interpreter.bind_call). A row that fails gives a
+# RowError in its place instead of ending the batch. invoke_columns takes the
+# arguments as columns instead, e.g. NumPy arrays, which are turned into lists
+# of python values with their tolist method.
+from interpreterv4 import Interpreter
+from type_value_v4 import Object, Type, Value
+
+
+def _object_value(fields):
+    obj = Object()
+    for name, x in fields.items():
+        obj.set(name, to_value(x))
+    return Value(Type.OBJECT, obj)
+
+
+TO_VALUE = {
+    type(None): lambda x: Value(Type.NIL, None),
+    bool: lambda x: Value(Type.BOOL, x),
+    int: lambda x: Value(Type.INT, x),
+    str: lambda x: Value(Type.STRING, x),
+    dict: _object_value,
+}
+
+
+def to_value(x):
+    convert = TO_VALUE.get(type(x))
+    if convert is not None:
+        return convert(x)
+    if isinstance(x, Value):
+        return x
+    raise TypeError(f"{type(x).__name__} can't be passed to a Brewin program")
+
+
+def from_value(value_obj):
+    if value_obj is Interpreter.NIL_VALUE:
+        return None
+    t = value_obj.t
+    if t is Type.INT or t is Type.BOOL:
+        return value_obj.v
+    if t is Type.STRING:
+        return str(value_obj.v)
+    if t is Type.NIL:
+        return None
+    return value_obj
+
+
+class RowError:
+    def __init__(self, error_type, line, message):
+        self.error_type = error_type
+        self.line = line
+        self.message = message
+
+    def __repr__(self):
+        return f"RowError({self.message!r})"
+
+
+class Program:
+    def __init__(self, source, **options):
+        options.setdefault("console_output", False)
+        self.interpreter = Interpreter(**options)
+        self.interpreter.load(source)
+
+    # runs main with the given lines of input and returns the lines it printed
+    def run_main(self, inputs=None):
+        interpreter = self.interpreter
+        interpreter.inp = None if inputs is None else [str(line) for line in inputs]
+        interpreter.reset()
+        interpreter.run_main()
+        return interpreter.get_output()
+
+    # calls func_name with the given host values and returns its result as one
+    def invoke(self, func_name, *args):
+        interpreter = self.interpreter
+        interpreter.reset()
+        return from_value(interpreter.call(func_name, [to_value(x) for x in args]))
+
+    # calls func_name once per row (a sequence of host values) and returns the
+    # list of results, with a RowError for each row that failed
+    def invoke_batch(self, func_name, rows):
+        interpreter = self.interpreter
+        rows = [[to_value(x) for x in row] for row in rows]
+        if not rows:
+            return []
+        num_args = len(rows[0])
+        bound_call = interpreter.bind_call(func_name, num_args)
+        results = []
+        for args in rows:
+            interpreter.reset()
+            try:
+                if len(args) == num_args:
+                    results.append(from_value(bound_call(args)))
+                else:
+                    results.append(from_value(interpreter.call(func_name, args)))
+            except Exception as e:
+                error_type, line = interpreter.get_error_type_and_line()
+                results.append(RowError(error_type, line, str(e)))
+        return results
+
+    # like invoke_batch, with the i-th argument of every row taken from the i-th
+    # column
+    def invoke_columns(self, func_name, *columns):
+        columns = [c.tolist() if hasattr(c, "tolist") else c for c in columns]
+        return self.invoke_batch(func_name, zip(*columns))
+
+    # the lines printed by the last run
+    def get_output(self):
+        return self.interpreter.get_output()
+
+
+# parses source once into a Program; options are those of Interpreter
+def compile(source, **options):
+    return Program(source, **options)
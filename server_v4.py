@@ -0,0 +1,228 @@
+# Brewin v4 server over a Unix domain socket
+#
+# Starting python, building the parser and creating an Interpreter take far
+# longer than most short programs run. BrewinServer does all of that once and
+# then runs programs sent to it over a Unix domain socket, on an
+# InterpreterPool (see pool_v4.py) of workers interpreters.
+#
+# Every message is a frame: a 4-byte big-endian length, then that many bytes
+# of UTF-8 JSON. A client connects and sends one request,
+#   {"program": "...", "inputs": ["1", "2"]}      (inputs may be left out)
+# and gets back a frame for each line the program prints, as it prints it,
+#   {"output": "..."}
+# followed by one of
+#   {"done": true}
+#   {"error": "ErrorType.NAME_ERROR: ..."}
+#   {"error": "server busy", "busy": true}
+# The last is sent right away, with no outputs, when max_queue connections
+# are already waiting for a worker. A request that isn't valid JSON, or has no
+# program, gets {"error": "bad request: ..."}. The program only ever reads the
+# inputs it was sent; running out of them is an error like any other.
+#
+# python server_v4.py serve PATH [--workers N] [--max-queue N]
+# python server_v4.py run PATH FILE [INPUT ...]
+import argparse
+import json
+import os
+import queue
+import socket
+import struct
+import sys
+import threading
+
+from inputs_v4 import IteratorInput
+from pool_v4 import InterpreterPool
+from sinks_v4 import CallbackSink
+
+WORKERS = 4
+MAX_QUEUE = 64
+HEADER = struct.Struct(">I")
+
+
+def send_frame(sock, message):
+    data = json.dumps(message).encode("utf-8")
+    sock.sendall(HEADER.pack(len(data)) + data)
+
+
+def _recv_exactly(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+# the next message, or None if the other end has closed the connection; a
+# message that isn't UTF-8 JSON raises ValueError
+def recv_frame(sock):
+    header = _recv_exactly(sock, HEADER.size)
+    if header is None:
+        return None
+    data = _recv_exactly(sock, HEADER.unpack(header)[0])
+    if data is None:
+        return None
+    return json.loads(data.decode("utf-8"))
+
+
+# the program and the input lines of a request, or ValueError if it isn't one
+def parse_request(request):
+    if not isinstance(request, dict) or not isinstance(request.get("program"), str):
+        raise ValueError("no program")
+    inputs = request.get("inputs", [])
+    if not isinstance(inputs, list):
+        raise ValueError("inputs isn't a list")
+    return request["program"], [str(line) for line in inputs]
+
+
+# receives a request, replying with an error and returning None if it isn't
+# valid
+def recv_request(sock):
+    try:
+        request = recv_frame(sock)
+        if request is None:
+            return None
+        return parse_request(request)
+    except ValueError as e:
+        send_frame(sock, {"error": f"bad request: {e}"})
+        return None
+
+
+class BrewinServer:
+    def __init__(self, path, workers=WORKERS, max_queue=MAX_QUEUE, **options):
+        self.path = path
+        self.pool = InterpreterPool(workers, **options)
+        self.jobs = queue.Queue(max_queue)
+        if os.path.exists(path):
+            os.unlink(path)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(path)
+        self.listener.listen()
+        self.threads = []
+        for _ in range(workers):
+            thread = threading.Thread(target=self.__work, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def serve_forever(self):
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return  # closed
+            try:
+                self.jobs.put_nowait(conn)
+            except queue.Full:
+                with conn:
+                    send_frame(conn, {"error": "server busy", "busy": True})
+
+    # serves from a background thread
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def close(self):
+        try:
+            self.listener.shutdown(socket.SHUT_RDWR)  # wakes up accept
+        except OSError:
+            pass
+        self.listener.close()
+        for _ in self.threads:
+            self.jobs.put(None)
+        for thread in self.threads:
+            thread.join()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def __work(self):
+        while True:
+            conn = self.jobs.get()
+            if conn is None:
+                return
+            with conn:
+                try:
+                    self.__serve(conn)
+                except OSError:
+                    pass  # the client went away
+                except Exception:
+                    pass  # keep the worker for the next connection
+
+    def __serve(self, conn):
+        request = recv_request(conn)
+        if request is None:
+            return
+        program, inputs = request
+        sink = CallbackSink(lambda line: send_frame(conn, {"output": line}))
+        try:
+            self.pool.run(program, output_sink=sink, input_provider=IteratorInput(inputs))
+        except OSError:
+            raise
+        except Exception as e:
+            send_frame(conn, {"error": str(e)})
+            return
+        send_frame(conn, {"done": True})
+
+
+# sends a program to the server at path and yields the messages that come
+# back, up to and including the last one
+def stream_remote(path, program, inputs=None):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        request = {"program": program}
+        if inputs is not None:
+            request["inputs"] = [str(line) for line in inputs]
+        try:
+            send_frame(sock, request)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # turned away as busy; the reply is still there to read
+        while True:
+            message = recv_frame(sock)
+            if message is None:
+                yield {"error": "connection closed"}
+                return
+            yield message
+            if "output" not in message:
+                return
+
+
+# sends a program to the server at path and returns (lines printed, error),
+# where error is None if the program ran to the end
+def run_remote(path, program, inputs=None):
+    lines = []
+    for message in stream_remote(path, program, inputs):
+        if "output" in message:
+            lines.append(message["output"])
+        elif message.get("done"):
+            return lines, None
+        else:
+            return lines, message["error"]
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Brewin v4 server over a Unix domain socket")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve")
+    serve.add_argument("path")
+    serve.add_argument("--workers", type=int, default=WORKERS)
+    serve.add_argument("--max-queue", type=int, default=MAX_QUEUE)
+    run = commands.add_parser("run")
+    run.add_argument("path")
+    run.add_argument("file")
+    run.add_argument("inputs", nargs="*")
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        BrewinServer(args.path, args.workers, args.max_queue).serve_forever()
+        return 0
+    with open(args.file, encoding="utf-8") as f:
+        lines, error = run_remote(args.path, f.read(), args.inputs or None)
+    for line in lines:
+        print(line)
+    if error is not None:
+        print(error, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,150 @@
+# Output sinks for the v4 interpreter
+#
+# By default every line a program prints goes to stdout (with console_output)
+# and into the interpreter's output_log, which keeps all of them until the run
+# ends. An Interpreter given an output_sink sends each line to the sink's
+# write instead, and nothing is kept, so a program can print any number of
+# lines in constant memory. flush is called when a run ends, however it ends.
+#
+#   CallbackSink     calls a function with each line
+#   RingBufferSink   keeps only the last capacity lines
+#   FileSink         writes lines to a file, buffer_lines at a time
+#   QueueSink        hands lines to another thread through a bounded queue;
+#                    iter_output uses it to run a program in a thread and
+#                    yield its lines as they are printed
+#   AsyncQueueSink   puts lines on an asyncio.Queue; under run_async, print
+#                    awaits room in the queue
+from collections import deque
+import queue
+import threading
+
+from interpreterv4 import Interpreter
+
+RING_CAPACITY = 1000
+BUFFER_LINES = 4096
+QUEUE_SIZE = 1024
+
+
+class CallbackSink:
+    def __init__(self, callback):
+        self.write = callback
+
+    def flush(self):
+        pass
+
+
+class RingBufferSink:
+    def __init__(self, capacity=RING_CAPACITY):
+        self.lines = deque(maxlen=capacity)
+        self.write = self.lines.append
+
+    def flush(self):
+        pass
+
+    def get_lines(self):
+        return list(self.lines)
+
+
+# file is a path, which is opened for writing (and closed by close), or an
+# open text file
+class FileSink:
+    def __init__(self, file, buffer_lines=BUFFER_LINES):
+        self.owns_file = isinstance(file, str)
+        self.file = open(file, "w", encoding="utf-8") if self.owns_file else file
+        self.buffer_lines = buffer_lines
+        self.buffer = []
+
+    def write(self, line):
+        self.buffer.append(line)
+        if len(self.buffer) >= self.buffer_lines:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.buffer.append("")
+            self.file.write("\n".join(self.buffer))
+            self.buffer.clear()
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        if self.owns_file:
+            self.file.close()
+
+
+# raised in the interpreter's thread when the reader of a QueueSink has gone
+class OutputClosed(Exception):
+    pass
+
+
+class QueueSink:
+    def __init__(self, queue_size=QUEUE_SIZE):
+        self.queue = queue.Queue(queue_size)
+        self.closed = False
+
+    def write(self, line):
+        while True:
+            if self.closed:
+                raise OutputClosed()
+            try:
+                self.queue.put(line, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def flush(self):
+        pass
+
+
+class AsyncQueueSink:
+    def __init__(self, lines):
+        self.lines = lines
+
+    async def write_async(self, line):
+        await self.lines.put(line)
+
+    def write(self, line):
+        self.lines.put_nowait(line)
+
+    def flush(self):
+        pass
+
+
+_DONE = object()
+
+
+# runs program in a thread and yields the lines it prints as they come; an
+# error in the program is raised here once the lines before it are yielded.
+# Closing the generator early stops the program at its next print.
+def iter_output(program, queue_size=QUEUE_SIZE, **options):
+    sink = QueueSink(queue_size)
+    failure = []
+
+    def run():
+        try:
+            Interpreter(output_sink=sink, **options).run(program)
+        except OutputClosed:
+            pass
+        except BaseException as e:
+            failure.append(e)
+        finally:
+            while not sink.closed:
+                try:
+                    sink.queue.put(_DONE, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        while True:
+            line = sink.queue.get()
+            if line is _DONE:
+                break
+            yield line
+    finally:
+        sink.closed = True
+        thread.join()
+    if failure:
+        raise failure[0]
@@ -0,0 +1,332 @@
+# Specialization of v4 functions on constant arguments
+#
+# specialize_program looks for calls to top-level functions that pass literal
+# arguments, e.g. power(x, 8), and points them at a copy of the function in
+# which those parameters are replaced by the literals. The copy is simplified:
+# operations on constants are folded, if/while statements whose condition is
+# now constant are pruned and statements after a return are dropped. Calls in
+# the copy that now pass literals are specialized in turn, so recursion on a
+# constant unrolls, until the budget of AST nodes that may be added to the
+# program runs out.
+#
+# Brewin is dynamically scoped, so a parameter is only replaced if nothing can
+# rebind it while its function runs: the function never assigns it or passes it
+# where it could be taken by ref, and no function or lambda in the program
+# assigns a variable of that name other than its own parameter. The parameter
+# stays in the copy's signature, so callees that read it dynamically still see
+# it, and reads inside lambda bodies are left alone, unless no function or
+# lambda reads a variable of that name other than its own parameter; then
+# nothing can see it, and it is dropped from the copy and the calls to it, so
+# that calls no longer pay for passing it.
+import operator
+
+from element import Element
+from intbase import InterpreterBase
+
+SPECIALIZE_BUDGET = 2000
+
+LITERALS = (
+    InterpreterBase.INT_DEF,
+    InterpreterBase.STRING_DEF,
+    InterpreterBase.BOOL_DEF,
+    InterpreterBase.NIL_DEF,
+)
+
+
+def _int_div(x, y):
+    if y == 0:
+        raise ZeroDivisionError  # left for the interpreter to fail on at runtime
+    return x // y
+
+
+# operations that can be folded, by the literal kind of both operands; each
+# gives the kind of the result and how to compute it, matching __setup_ops
+_COMPARISONS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+FOLDABLE = {
+    InterpreterBase.INT_DEF: {
+        "+": (InterpreterBase.INT_DEF, operator.add),
+        "-": (InterpreterBase.INT_DEF, operator.sub),
+        "*": (InterpreterBase.INT_DEF, operator.mul),
+        "/": (InterpreterBase.INT_DEF, _int_div),
+        "<": (InterpreterBase.BOOL_DEF, operator.lt),
+        "<=": (InterpreterBase.BOOL_DEF, operator.le),
+        ">": (InterpreterBase.BOOL_DEF, operator.gt),
+        ">=": (InterpreterBase.BOOL_DEF, operator.ge),
+    },
+    InterpreterBase.STRING_DEF: {
+        "+": (InterpreterBase.STRING_DEF, operator.add),
+    },
+    InterpreterBase.BOOL_DEF: {
+        "&&": (InterpreterBase.BOOL_DEF, lambda x, y: x and y),
+        "||": (InterpreterBase.BOOL_DEF, lambda x, y: x or y),
+    },
+}
+for _ops in FOLDABLE.values():
+    for _oper, _f in _COMPARISONS.items():
+        _ops[_oper] = (InterpreterBase.BOOL_DEF, _f)
+
+
+def literal(kind, val):
+    if kind == InterpreterBase.NIL_DEF:
+        return Element(kind)
+    return Element(kind, val=val)
+
+
+def clone(node):
+    fields = {}
+    for key, value in node.dict.items():
+        if isinstance(value, Element):
+            value = clone(value)
+        elif isinstance(value, list):
+            value = [clone(v) if isinstance(v, Element) else v for v in value]
+        fields[key] = value
+    return Element(node.elem_type, **fields)
+
+
+def size(node):
+    return sum(1 for _ in node.walk())
+
+
+# statements and expressions both only hold Elements and lists of Elements
+def _walk_outside_lambdas(node):
+    yield node
+    for child in node.children():
+        if child.elem_type != InterpreterBase.LAMBDA_DEF:
+            yield from _walk_outside_lambdas(child)
+
+
+class _Specializer:
+    def __init__(self, ast, budget):
+        self.ast = ast
+        self.budget = budget
+        self.added = 0
+        self.functions = {}
+        for func_def in ast.get("functions"):
+            self.functions[(func_def.get("name"), len(func_def.get("args")))] = func_def
+        self.clones = {}
+        self.safe = {}
+
+        # names that may be rebound in the scope of whichever function is running:
+        # those assigned by a function or lambda other than as its own parameter,
+        # and those passed as arguments that might be taken by ref. Functions
+        # that are never referenced (main) only run at the bottom of the stack,
+        # where their assignments can't reach anyone's parameters.
+        referenced = set()
+        for node in ast.walk():
+            if node.elem_type in (InterpreterBase.FCALL_DEF, InterpreterBase.VAR_DEF):
+                referenced.add(node.get("name"))
+        # Likewise, names that may be read from the scope of another function:
+        # those read by a function or lambda other than as its own parameter.
+        self.rebindable = set()
+        self.readable = set()
+        for node in ast.walk():
+            if node.elem_type == InterpreterBase.FUNC_DEF and node.get("name") not in referenced:
+                continue
+            if node.elem_type in (InterpreterBase.FUNC_DEF, InterpreterBase.LAMBDA_DEF):
+                params = {arg.get("name") for arg in node.get("args")}
+                for sub in _walk_outside_lambdas(node):
+                    if sub.elem_type == "=" and sub.get("name") not in params:
+                        self.rebindable.add(sub.get("name"))
+                    elif sub.elem_type == InterpreterBase.VAR_DEF and sub.get("name") not in params:
+                        self.readable.add(sub.get("name"))
+            elif node.elem_type in (InterpreterBase.FCALL_DEF, InterpreterBase.MCALL_DEF):
+                if node.get("name") in ("print", "inputi"):
+                    continue
+                callee = self.callee(node)
+                for i, arg in enumerate(node.get("args")):
+                    if arg.elem_type != InterpreterBase.VAR_DEF:
+                        continue
+                    if callee is None or callee.get("args")[i].elem_type != InterpreterBase.ARG_DEF:
+                        self.rebindable.add(arg.get("name"))
+
+    # indexes of the parameters of func_def that can be replaced by constants
+    def safe_params(self, func_def):
+        if func_def in self.safe:
+            return self.safe[func_def]
+        names = {}
+        for i, arg in enumerate(func_def.get("args")):
+            if arg.elem_type == InterpreterBase.ARG_DEF:
+                names[arg.get("name")] = i
+        for node in _walk_outside_lambdas(func_def):
+            if node.elem_type == "=":
+                names.pop(node.get("name"), None)
+        safe = {i for name, i in names.items() if name not in self.rebindable}
+        self.safe[func_def] = safe
+        return safe
+
+    def callee(self, call_ast):
+        if call_ast.elem_type != InterpreterBase.FCALL_DEF:
+            return None
+        return self.functions.get((call_ast.get("name"), len(call_ast.get("args"))))
+
+    def run(self):
+        worklist = list(self.ast.get("functions"))
+        while worklist:
+            func_def = worklist.pop()
+            for node in func_def.walk():
+                if node.elem_type == InterpreterBase.FCALL_DEF:
+                    new_clone = self.specialize_call(node)
+                    if new_clone is not None:
+                        worklist.append(new_clone)
+
+    # points call_ast at a specialized copy of its callee, and returns the copy
+    # if it had to be created
+    def specialize_call(self, call_ast):
+        func_def = self.callee(call_ast)
+        if func_def is None:
+            return None
+        constants = []
+        for i in sorted(self.safe_params(func_def)):
+            arg = call_ast.get("args")[i]
+            if arg.elem_type in LITERALS:
+                constants.append((i, arg.elem_type, arg.get("val")))
+        if not constants:
+            return None
+        key = (func_def, tuple(constants))
+        args = func_def.get("args")
+        dropped = {i for i, _, _ in constants if args[i].get("name") not in self.readable}
+        if key in self.clones:
+            self.point_at(call_ast, self.clones[key], dropped)
+            return None
+
+        name = f"{func_def.get('name')}#{len(self.clones) + 1}"
+        replacements = {args[i].get("name"): (kind, val) for i, kind, val in constants}
+        simplifier = _Simplifier(replacements)
+        statements = simplifier.block(clone(func_def).get("statements"))
+        if not simplifier.changes:
+            return None  # the copy would be no better than the original
+        args = [arg for i, arg in enumerate(args) if i not in dropped]
+        new_clone = Element(InterpreterBase.FUNC_DEF, name=name, args=args, statements=statements)
+        cost = size(new_clone)
+        if self.added + cost > self.budget:
+            return None
+        self.added += cost
+        self.clones[key] = name
+        self.functions[(name, len(args))] = new_clone
+        self.ast.get("functions").append(new_clone)
+        self.point_at(call_ast, name, dropped)
+        return new_clone
+
+    @staticmethod
+    def point_at(call_ast, name, dropped):
+        call_ast.dict["name"] = name
+        if dropped:
+            call_ast.dict["args"] = [a for i, a in enumerate(call_ast.get("args")) if i not in dropped]
+
+
+class _Simplifier:
+    def __init__(self, replacements):
+        self.replacements = replacements
+        # folds and prunes made, and constants passed on to calls
+        self.changes = 0
+
+    def block(self, statements):
+        result = []
+        for statement in statements:
+            result.extend(self.statement(statement))
+            if result and result[-1].elem_type == InterpreterBase.RETURN_DEF:
+                break
+        return result
+
+    # returns the statements that replace statement
+    def statement(self, statement):
+        kind = statement.elem_type
+        if kind == InterpreterBase.IF_DEF or kind == InterpreterBase.WHILE_DEF:
+            cond = self.expr(statement.get("condition"))
+            statement.dict["condition"] = cond
+            taken = self.constant_condition(cond)
+            if kind == InterpreterBase.WHILE_DEF and taken is False:
+                self.changes += 1
+                return []
+            if kind == InterpreterBase.IF_DEF and taken is not None:
+                self.changes += 1
+                branch = statement.get("statements" if taken else "else_statements")
+                if branch is None:
+                    return []
+                branch = self.block(branch)
+                if not any(s.elem_type == "=" and "." not in s.get("name") for s in branch):
+                    # the branch creates no variables, so it doesn't need its own
+                    # scope and can be inlined
+                    return branch
+                return [
+                    Element(
+                        InterpreterBase.IF_DEF,
+                        condition=literal(InterpreterBase.BOOL_DEF, True),
+                        statements=branch,
+                        else_statements=None,
+                    )
+                ]
+            statement.dict["statements"] = self.block(statement.get("statements"))
+            if statement.get("else_statements") is not None:
+                statement.dict["else_statements"] = self.block(statement.get("else_statements"))
+            return [statement]
+        if kind == "=" or kind == InterpreterBase.RETURN_DEF:
+            if statement.get("expression") is not None:
+                statement.dict["expression"] = self.expr(statement.get("expression"))
+            return [statement]
+        return [self.expr(statement)]
+
+    @staticmethod
+    def constant_condition(cond):
+        if cond.elem_type in (InterpreterBase.BOOL_DEF, InterpreterBase.INT_DEF):
+            return cond.get("val") != 0 if cond.elem_type == InterpreterBase.INT_DEF else cond.get("val")
+        return None
+
+    def expr(self, expr_ast):
+        kind = expr_ast.elem_type
+        if kind == InterpreterBase.VAR_DEF and expr_ast.get("name") in self.replacements:
+            return literal(*self.replacements[expr_ast.get("name")])
+        if kind == InterpreterBase.LAMBDA_DEF:
+            return expr_ast
+        for key, value in expr_ast.dict.items():
+            if isinstance(value, Element):
+                expr_ast.dict[key] = self.expr(value)
+            elif isinstance(value, list):
+                args = [self.expr(v) for v in value]
+                if kind == InterpreterBase.FCALL_DEF:
+                    self.changes += sum(a is not v for a, v in zip(args, value))
+                expr_ast.dict[key] = args
+        if "op2" in expr_ast.dict:
+            return self.fold_binary(expr_ast)
+        if kind in (InterpreterBase.NEG_DEF, InterpreterBase.NOT_DEF):
+            return self.fold_unary(expr_ast)
+        return expr_ast
+
+    def fold_binary(self, expr_ast):
+        left = expr_ast.get("op1")
+        right = expr_ast.get("op2")
+        if left.elem_type != right.elem_type:
+            return expr_ast
+        fold = FOLDABLE.get(left.elem_type, {}).get(expr_ast.elem_type)
+        if fold is None:
+            return expr_ast
+        result_kind, f = fold
+        try:
+            folded = literal(result_kind, f(left.get("val"), right.get("val")))
+        except ZeroDivisionError:
+            return expr_ast
+        self.changes += 1
+        return folded
+
+    def fold_unary(self, expr_ast):
+        operand = expr_ast.get("op1")
+        if expr_ast.elem_type == InterpreterBase.NEG_DEF and operand.elem_type == InterpreterBase.INT_DEF:
+            self.changes += 1
+            return literal(InterpreterBase.INT_DEF, -1 * operand.get("val"))
+        if expr_ast.elem_type == InterpreterBase.NOT_DEF and operand.elem_type in (
+            InterpreterBase.INT_DEF,
+            InterpreterBase.BOOL_DEF,
+        ):
+            self.changes += 1
+            return literal(InterpreterBase.BOOL_DEF, not operand.get("val"))
+        return expr_ast
+
+
+# returns the number of AST nodes added to the program
+def specialize_program(ast, budget=SPECIALIZE_BUDGET):
+    specializer = _Specializer(ast, budget)
+    specializer.run()
+    return specializer.added
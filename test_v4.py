@@ -0,0 +1,897 @@
+# Regression tests for the v4 interpreter
+#
+# python -m pytest test_v4.py
+import asyncio
+import copy
+import io
+import json
+import os
+import socket
+import tempfile
+import threading
+import unittest
+
+from batch_v4 import load_jobs, run_jobs
+from env_v4 import PersistentEnvironmentManager
+from forkserver_v4 import start_fork_server
+from inputs_v4 import AsyncQueueInput, FileInput
+from intbase import ErrorType
+from interpreterv4 import Interpreter
+from pool_v4 import InterpreterPool
+from profile_v4 import program_hash
+from program_v4 import RowError, compile as compile_program
+from server_v4 import HEADER, BrewinServer, recv_frame, run_remote
+from sinks_v4 import AsyncQueueSink, OutputClosed, QueueSink, iter_output
+from specialize_v4 import SPECIALIZE_BUDGET
+from type_value_v4 import (
+    ROPE_MIN_LENGTH,
+    SMALL_INT_MAX,
+    Rope,
+    SharedValue,
+    Type,
+    Value,
+    concat_strings,
+    int_value,
+)
+
+# every engine a program can run on, by name
+ENGINES = {
+    "tree walker": {"tiering": False},
+    "tiering": {},
+    "no static types": {"static_types": False},
+    "explicit_stack": {"explicit_stack": True},
+    "opt_level=2": {"opt_level": 2},
+}
+
+
+# runs program and returns (lines printed, error type or None)
+def run(program, inputs=None, **options):
+    interpreter = Interpreter(console_output=False, inp=inputs, **options)
+    try:
+        interpreter.run(program)
+    except Exception:
+        return interpreter.get_output(), interpreter.get_error_type_and_line()[0]
+    return interpreter.get_output(), None
+
+
+# g's x is main's x, which f's ref parameter a aliases; once k reaches 20,
+# a = "s" makes it a string behind g's back
+REF_ALIAS_PROGRAMS = {
+    "+": """
+func g(k) { x = 1; if (k == 20) { a = "s"; } return x + 1; }
+func f(ref a, k) { return g(k); }
+func main() { x = 0; i = 0; while (i < 30) { print(f(x, i)); i = i + 1; } }
+""",
+    "if": """
+func g(k) { x = true; if (k == 20) { a = "s"; } if (x) { return 1; } return 0; }
+func f(ref a, k) { return g(k); }
+func main() { x = 0; i = 0; while (i < 30) { print(f(x, i)); i = i + 1; } }
+""",
+    "&&": """
+func g(k) { x = true; if (k == 20) { a = "s"; } return x && true; }
+func f(ref a, k) { return g(k); }
+func main() { x = 0; i = 0; while (i < 30) { print(f(x, i)); i = i + 1; } }
+""",
+    "neg": """
+func g(k) { x = 1; if (k == 20) { a = "s"; } return -x; }
+func f(ref a, k) { return g(k); }
+func main() { x = 0; i = 0; while (i < 30) { print(f(x, i)); i = i + 1; } }
+""",
+}
+
+
+class StaticTypesTest(unittest.TestCase):
+    def test_type_changed_through_caller_ref_is_a_type_error(self):
+        for oper, program in REF_ALIAS_PROGRAMS.items():
+            for engine, options in ENGINES.items():
+                with self.subTest(oper=oper, engine=engine):
+                    output, error_type = run(program, **options)
+                    self.assertEqual(len(output), 20)
+                    self.assertIs(error_type, ErrorType.TYPE_ERROR)
+
+    def test_static_errors_skips_code_that_cannot_run(self):
+        programs = [
+            'func main() { if (false) { x = "a" - 1; } print(1); }',
+            'func main() { while (0) { x = "a" - 1; } print(1); }',
+            'func main() { if (true) { print(1); } else { x = 1 + "b"; } }',
+            'func unused() { return "a" - 1; } func main() { print(1); }',
+        ]
+        for program in programs:
+            with self.subTest(program=program):
+                self.assertEqual(run(program, static_errors=True), (["1"], None))
+
+    def test_static_errors_reports_reachable_errors_at_load(self):
+        programs = [
+            'func main() { print(1); x = "a" - 1; }',
+            'func used() { return "a" - 1; } func main() { print(1); f = used; }',
+        ]
+        for program in programs:
+            with self.subTest(program=program):
+                self.assertEqual(run(program, static_errors=True), ([], ErrorType.TYPE_ERROR))
+
+
+MIXED_TYPES_PROGRAM = """
+func add(a, b) { return a + b; }
+func main() { i = 0; while (i < 10) { print(add(i, 1)); print(add("x", "y")); i = i + 1; } }
+"""
+
+
+class QuickeningTest(unittest.TestCase):
+    def run_generic_and_quickened(self, program):
+        generic = run(program, quicken=False, static_types=False, tiering=False)
+        interpreter = Interpreter(console_output=False, static_types=False, tiering=False)
+        try:
+            interpreter.run(program)
+        except Exception:
+            quickened = interpreter.get_output(), interpreter.get_error_type_and_line()[0]
+        else:
+            quickened = interpreter.get_output(), None
+        self.assertEqual(quickened, generic)
+        return interpreter.quick_stats
+
+    def test_nodes_that_keep_changing_types_stay_generic(self):
+        stats = self.run_generic_and_quickened(MIXED_TYPES_PROGRAM)
+        self.assertEqual(stats["deoptimized"], Interpreter.QUICK_MAX_DEOPTS + 1)
+
+    def test_deoptimized_nodes_still_report_type_errors(self):
+        programs = [
+            'func add(a, b) { return a + b; } func main() { print(add(1, 2)); print(add(1, "s")); }',
+            "func lt(a, b) { return a < b; } func main() { print(lt(1, 2)); print(lt(true, 2)); }",
+            'func eq(a, b) { return a == b; } func main() { print(eq(1, 1)); print(eq(1, "1")); }',
+        ]
+        for program in programs:
+            with self.subTest(program=program):
+                stats = self.run_generic_and_quickened(program)
+                self.assertGreater(stats["specialized"], 0)
+
+
+TIERED_PROGRAMS = {
+    "mixed types": MIXED_TYPES_PROGRAM,
+    "dynamic scope": """
+func get() { return x; }
+func main() { i = 0; while (i < 30) { x = i * 2; if (i > 20) { x = "s"; } print(get()); i = i + 1; } }
+""",
+    "closures": """
+func make(n) { return lambda(k) { n = n + k; return n; }; }
+func main() { f = make(1); i = 0; while (i < 150) { r = f(i); i = i + 1; } print(r); }
+""",
+    "objects and recursion": """
+func fib(n) { if (n < 2) { return n; } return fib(n - 1) + fib(n - 2); }
+func main() { o = @; o.n = 0; while (o.n < 120) { o.n = o.n + 1; } print(o.n); print(fib(12)); }
+""",
+    "errors in compiled code": """
+func f(x) { return x + 1; }
+func main() { i = 0; while (i < 20) { print(f(i)); i = i + 1; } print(f("s")); }
+""",
+}
+
+
+class TieringTest(unittest.TestCase):
+    def test_compiled_code_gives_the_tree_walker_result(self):
+        for name, program in TIERED_PROGRAMS.items():
+            for calls, loops in ((10, 100), (0, 0)):
+                with self.subTest(program=name, calls=calls, loops=loops):
+                    tiered = run(program, hot_call_threshold=calls, hot_loop_threshold=loops)
+                    self.assertEqual(tiered, run(program, tiering=False))
+
+    def test_hot_functions_and_loops_tier_up_once(self):
+        interpreter = Interpreter(console_output=False)
+        interpreter.run(SQUARES_PROGRAM)
+        transitions = interpreter.get_tier_stats()["transitions"]
+        self.assertEqual(
+            transitions,
+            [
+                ("function", "sq/1", Interpreter.HOT_CALL_THRESHOLD + 1),
+                ("loop", "main/0:while#1", Interpreter.HOT_LOOP_THRESHOLD + 1),
+            ],
+        )
+
+    def test_cold_code_stays_in_the_tree_walker(self):
+        interpreter = Interpreter(console_output=False)
+        interpreter.run("func f() { return 1; } func main() { print(f()); }")
+        self.assertEqual(interpreter.get_tier_stats()["transitions"], [])
+
+
+# f's t is main's t once main has assigned one
+FREE_WRITE_PROGRAM = """
+func f(n) { t = n * 2; return t; }
+func main() { print(f(1)); print(f(1)); t = 5; print(f(1)); print(t); print(f(3)); }
+"""
+
+
+class MemoTest(unittest.TestCase):
+    def test_calls_that_would_write_a_caller_variable_skip_the_memo_table(self):
+        for engine, options in ENGINES.items():
+            with self.subTest(engine=engine):
+                interpreter = Interpreter(console_output=False, memoize=True, **options)
+                interpreter.run(FREE_WRITE_PROGRAM)
+                self.assertEqual(interpreter.get_output(), ["2", "2", "2", "2", "6"])
+                stats = interpreter.get_memo_stats()["f/1"]
+                self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+    def test_memoized_results_match_unmemoized_ones(self):
+        program = """
+func fib(n) { if (n < 2) { return n; } return fib(n - 1) + fib(n - 2); }
+func main() { i = 0; while (i < 20) { print(fib(i)); i = i + 1; } }
+"""
+        interpreter = Interpreter(console_output=False, memoize=True)
+        interpreter.run(program)
+        self.assertEqual((interpreter.get_output(), None), run(program))
+        self.assertGreater(interpreter.get_memo_stats()["fib/1"]["hits"], 0)
+
+
+# variables that start out as a shared literal or small int and are then
+# modified in place, through ref parameters and by assignment
+INTERNED_PROGRAMS = [
+    """
+func bump(ref a) { a = a + 1; }
+func main() { i = 0; while (i < 3) { x = 1; bump(x); print(x); i = i + 1; } print(1); }
+""",
+    """
+func set(ref a, v) { a = v; }
+func main() { t = true; set(t, 5); print(t); f = 2 < 3; set(f, "s"); print(f); print(2 < 3); }
+""",
+    """
+func main() { o = @; o.n = 7; p = o.n; p = p + 1; print(o.n); n = nil; print(n == nil); }
+""",
+]
+
+
+class InternedValueTest(unittest.TestCase):
+    def test_shared_values_cant_be_modified(self):
+        with self.assertRaises(TypeError):
+            int_value(1).set(Value(Type.INT, 2))
+        self.assertIs(int_value(SMALL_INT_MAX), int_value(SMALL_INT_MAX))
+        self.assertIsNot(int_value(SMALL_INT_MAX + 1), int_value(SMALL_INT_MAX + 1))
+
+    def test_copies_of_shared_values_are_their_own(self):
+        for copier in (copy.copy, copy.deepcopy):
+            with self.subTest(copier=copier.__name__):
+                value = copier(int_value(3))
+                self.assertIsNot(type(value), SharedValue)
+                value.set(Value(Type.INT, 4))
+                self.assertEqual(int_value(3).v, 3)
+
+    def test_interned_values_give_the_same_results(self):
+        for program in INTERNED_PROGRAMS:
+            for engine, options in ENGINES.items():
+                with self.subTest(program=program, engine=engine):
+                    self.assertEqual(
+                        run(program, **options), run(program, intern_values=False, **options)
+                    )
+
+
+# long strings built by concatenation, branching from a shared prefix and
+# compared with each other and with plain strings
+ROPE_PROGRAM = """
+func main() {
+  s = "";
+  i = 0;
+  while (i < 60) { s = s + "ab" + "c"; i = i + 1; }
+  t = s + "x";
+  u = s + "y";
+  v = s + "x";
+  print(t == v); print(t == u); print(t != u);
+  print(s + s == s + s); print(t); print(u);
+  w = "q" + t;
+  print(w);
+  print(w == "q" + v);
+}
+"""
+
+
+class RopeTest(unittest.TestCase):
+    def test_ropes_sharing_a_prefix_stay_apart(self):
+        prefix = concat_strings("a" * ROPE_MIN_LENGTH, "b")
+        left = concat_strings(prefix, "x")
+        right = concat_strings(prefix, "y")
+        self.assertEqual(str(left), "a" * ROPE_MIN_LENGTH + "bx")
+        self.assertEqual(str(right), "a" * ROPE_MIN_LENGTH + "by")
+        self.assertEqual(str(prefix), "a" * ROPE_MIN_LENGTH + "b")
+        self.assertEqual(str(concat_strings("z", right)), "z" + str(right))
+        self.assertEqual(str(concat_strings(left, right)), str(left) + str(right))
+
+    def test_ropes_equal_the_strings_they_hold(self):
+        rope = concat_strings("a" * ROPE_MIN_LENGTH, "b")
+        text = "a" * ROPE_MIN_LENGTH + "b"
+        self.assertIsInstance(rope, Rope)
+        self.assertEqual(rope, text)
+        self.assertEqual(rope, concat_strings("a", "a" * (ROPE_MIN_LENGTH - 1) + "b"))
+        self.assertNotEqual(rope, text + "c")
+        self.assertEqual(hash(rope), hash(text))
+        self.assertEqual(len(rope), len(text))
+        self.assertEqual(concat_strings("a", "b"), "ab")
+
+    def test_ropes_give_the_same_results(self):
+        for engine, options in ENGINES.items():
+            with self.subTest(engine=engine):
+                self.assertEqual(
+                    run(ROPE_PROGRAM, **options), run(ROPE_PROGRAM, ropes=False, **options)
+                )
+
+
+# n is passed as a literal; only in the first program can nothing else read it
+SPECIALIZED_PROGRAMS = [
+    """
+func power(x, n) { if (n == 0) { return 1; } return x * power(x, n - 1); }
+func main() { i = 0; while (i < 20) { print(power(i, 5)); i = i + 1; } }
+""",
+    """
+func get() { return n + 1; }
+func f(x, n) { if (n == 0) { return x; } return get() + f(x, n - 1); }
+func main() { a = 2; print(f(a, 4)); }
+""",
+    """
+func f(x, n) { g = lambda() { return n; }; if (n > 2) { return g(); } return x; }
+func main() { a = 1; print(f(a, 3)); print(f(a, 1)); }
+""",
+]
+
+
+class SpecializeTest(unittest.TestCase):
+    def test_specialized_programs_give_the_same_results(self):
+        for program in SPECIALIZED_PROGRAMS:
+            for engine, options in ENGINES.items():
+                with self.subTest(program=program, engine=engine):
+                    self.assertEqual(
+                        run(program, specialize=True, **options), run(program, **options)
+                    )
+
+    def test_constant_parameters_nothing_else_reads_are_dropped(self):
+        arities = []
+        for program in SPECIALIZED_PROGRAMS:
+            interpreter = Interpreter(console_output=False, specialize=True)
+            interpreter.run(program)
+            arities.append(
+                {
+                    len(func_def.get("args"))
+                    for func_def in interpreter.program_ast.get("functions")
+                    if "#" in func_def.get("name")
+                }
+            )
+        self.assertEqual(arities, [{1}, {2}, {2}])
+
+
+
+# closures whose captured variables are updated afterwards, directly, through
+# ref parameters and inside the closure, and closures passed by value
+CLOSURE_PROGRAMS = {
+    """
+func bump(ref a) { a = a + 1; }
+func main() {
+  x = 1;
+  f = lambda() { return x; };
+  bump(x);
+  g = lambda() { return x; };
+  x = x + 10;
+  bump(x);
+  print(f(), " ", g(), " ", x);
+}
+""": ["1 2 13"],
+    """
+func mk(ref a) { a = a * 2; h = lambda() { return a; }; a = a + 1; return h; }
+func main() { y = 5; h = mk(y); y = 100; print(h(), " ", y); }
+""": ["10 100"],
+    """
+func twice(f) { print(f()); print(f()); return f; }
+func main() {
+  n = 10;
+  c = lambda() { n = n + 1; return n; };
+  k = twice(c);
+  print(c()); print(k()); print(k());
+}
+""": ["11", "12", "11", "13", "14"],
+    """
+func main() {
+  i = 0; v = 0; first = nil; last = nil;
+  while (i < 30) {
+    f = lambda() { return v; };
+    if (i == 0) { first = f; }
+    last = f;
+    v = v + 1;
+    i = i + 1;
+  }
+  print(first(), " ", last(), " ", v);
+}
+""": ["0 29 30"],
+}
+
+
+class CapturedEnvironmentTest(unittest.TestCase):
+    def test_closures_see_variables_as_captured(self):
+        for program, output in CLOSURE_PROGRAMS.items():
+            for engine, options in ENGINES.items():
+                for persistent_env in (False, True):
+                    with self.subTest(program=program, engine=engine, persistent_env=persistent_env):
+                        self.assertEqual(
+                            run(program, persistent_env=persistent_env, **options), (output, None)
+                        )
+
+    def test_capture_copies_nothing_until_the_closure_is_called(self):
+        env = PersistentEnvironmentManager()
+        for i in range(100):
+            env.push({f"v{i}": Value(Type.INT, i)})
+        copied = []
+        captured = env.capture(lambda value: copied.append(value) or copy.copy(value))
+        self.assertEqual(copied, [])
+        captured.bind({})
+        self.assertEqual(len(copied), 100)
+
+    def test_captured_values_are_kept_when_updated_in_place(self):
+        env = PersistentEnvironmentManager()
+        env.push({"x": Value(Type.INT, 1)})
+        captured = env.capture(copy.copy)
+        env.get("x").v = 2
+        scope = {}
+        captured.bind(scope)
+        self.assertEqual((scope["x"].v, env.get("x").v), (1, 2))
+
+class LazyTest(unittest.TestCase):
+    def test_field_reads_give_the_eager_result(self):
+        programs = [
+            "func main() { o = @; o.v = 1; y = o.v + 1; o.v = 50; print(y); }",
+            "func f(x) { o.v = 50; return x; } func main() { o = @; o.v = 1; print(f(o.v * 2)); }",
+        ]
+        for program in programs:
+            with self.subTest(program=program):
+                self.assertEqual(run(program, lazy=True), run(program))
+
+    # documented: a delayed call runs when it is forced
+    def test_delayed_calls_see_variables_and_fields_when_forced(self):
+        programs = {
+            "func g() { return q; } func main() { q = 1; r = g(); q = 2; print(r); }": "2",
+            "func main() { o = @; o.v = 1; o.get = lambda() { return this.v; }; "
+            "r = o.get(); o.v = 7; print(r); }": "7",
+        }
+        for program, forced in programs.items():
+            with self.subTest(program=program):
+                self.assertEqual(run(program, lazy=True), ([forced], None))
+
+
+class FileInputTest(unittest.TestCase):
+    def test_binary_and_text_streams(self):
+        streams = {
+            "binary": io.BytesIO(b"1\n22\r\n333"),
+            "text with a buffer": io.TextIOWrapper(io.BytesIO(b"1\n22\r\n333")),
+            "text": io.StringIO("1\n22\r\n333"),
+        }
+        for kind, stream in streams.items():
+            with self.subTest(kind=kind):
+                provider = FileInput(stream, chunk_size=2)
+                lines = [provider.read_line() for _ in range(4)]
+                self.assertEqual(lines, ["1", "22", "333", None])
+
+
+HANDLE_PROGRAM = """
+func add(a, b) { return a + b; }
+func field(o) { return o.x; }
+func none() { return; }
+func main() { n = inputi(); print(n * 2); }
+"""
+
+
+class ProgramTest(unittest.TestCase):
+    def test_run_main_starts_afresh_every_time(self):
+        program = compile_program(HANDLE_PROGRAM)
+        self.assertEqual(program.run_main(["2"]), ["4"])
+        self.assertEqual(program.run_main(["5"]), ["10"])
+
+    def test_invoke_converts_host_values(self):
+        program = compile_program(HANDLE_PROGRAM)
+        self.assertEqual(program.invoke("add", 2, 3), 5)
+        self.assertEqual(program.invoke("add", "a", "b"), "ab")
+        self.assertEqual(program.invoke("field", {"x": True}), True)
+        self.assertIsNone(program.invoke("none"))
+
+    def test_invoke_errors_are_brewin_errors(self):
+        program = compile_program(HANDLE_PROGRAM)
+        with self.assertRaisesRegex(Exception, "ErrorType.TYPE_ERROR"):
+            program.invoke("add", 1, "b")
+        with self.assertRaisesRegex(Exception, "ErrorType.NAME_ERROR"):
+            program.invoke("missing", 1)
+        self.assertEqual(program.invoke("add", 1, 2), 3)
+
+    def test_invoke_batch_keeps_going_past_failed_rows(self):
+        program = compile_program(HANDLE_PROGRAM)
+        results = program.invoke_batch("add", [(1, 2), (1, "b"), ("a", "b"), (1,), (4, 5)])
+        self.assertEqual(results[0], 3)
+        self.assertIsInstance(results[1], RowError)
+        self.assertIs(results[1].error_type, ErrorType.TYPE_ERROR)
+        self.assertEqual(results[2], "ab")
+        self.assertIsInstance(results[3], RowError)
+        self.assertIs(results[3].error_type, ErrorType.NAME_ERROR)
+        self.assertEqual(results[4], 9)
+        self.assertEqual(program.invoke_batch("add", []), [])
+
+    def test_invoke_columns_takes_arguments_by_column(self):
+        class Column(list):
+            def tolist(self):
+                return list(self)
+
+        program = compile_program(HANDLE_PROGRAM)
+        self.assertEqual(program.invoke_columns("add", [1, 2, 3], [10, 20, 30]), [11, 22, 33])
+        self.assertEqual(program.invoke_columns("add", Column([1, 2]), (5, 6)), [6, 8])
+
+    def test_program_without_main_is_a_name_error(self):
+        program = compile_program("func f() { return 1; }")
+        with self.assertRaisesRegex(Exception, "ErrorType.NAME_ERROR: Function main not found"):
+            program.run_main()
+        self.assertEqual(run("func f() { return 1; }"), ([], ErrorType.NAME_ERROR))
+
+
+COUNTED_LOOP_PROGRAMS = {
+    "increasing": """
+func main() { n = inputi(); i = 0; s = 0; t = 7;
+  while (i < n) { s = s + i * i * i; t = t - 2 * i + 5; i = i + 1; }
+  print(i); print(s); print(t); }
+""",
+    "decreasing": """
+func main() { n = inputi(); i = n; s = 0;
+  while (i > 0) { s = s + i * 3 - 1; i = i - 2; }
+  print(i); print(s); }
+""",
+    "bound first": """
+func main() { n = inputi(); i = 0; s = 0;
+  while (n >= i) { s = s + i * i; i = i + 3; }
+  print(i); print(s); }
+""",
+}
+
+
+# runs program with the counted loops in closed form and returns
+# ((lines printed, error type or None), counted_loop_stats)
+def run_counted(program, inputs=None, **options):
+    interpreter = Interpreter(console_output=False, inp=inputs, vectorize=True, **options)
+    try:
+        interpreter.run(program)
+    except Exception:
+        result = interpreter.get_output(), interpreter.get_error_type_and_line()[0]
+    else:
+        result = interpreter.get_output(), None
+    return result, interpreter.counted_loop_stats
+
+
+class CountedLoopTest(unittest.TestCase):
+    def test_closed_form_matches_running_the_loop(self):
+        for shape, program in COUNTED_LOOP_PROGRAMS.items():
+            for n in ("0", "1", "2", "17", "1000"):
+                with self.subTest(shape=shape, n=n):
+                    result, stats = run_counted(program, [n])
+                    self.assertEqual(result, run(program, [n], vectorize=False))
+                    self.assertEqual(stats, {"closed_form": 1, "fallback": 0})
+
+    def test_zero_trip_loops_leave_their_variables_alone(self):
+        program = """
+func main() { i = 5; s = 1; while (i < 3) { s = s + i; i = i + 1; } print(i); print(s); }
+"""
+        result, stats = run_counted(program)
+        self.assertEqual(result, (["5", "1"], None))
+        self.assertEqual(stats["fallback"], 0)
+
+    def test_loop_variables_aliased_by_ref_parameters_fall_back(self):
+        program = """
+func f(ref a, ref b) { while (a < 10) { b = b + a; a = a + 1; } }
+func main() { x = 0; f(x, x); print(x); y = 0; z = 0; f(y, z); print(y); print(z); }
+"""
+        result, stats = run_counted(program)
+        self.assertEqual(result, run(program, vectorize=False))
+        self.assertEqual(result, (["15", "10", "45"], None))
+        self.assertEqual(stats, {"closed_form": 1, "fallback": 1})
+
+    def test_loops_whose_bound_changes_run_normally(self):
+        program = """
+func main() { n = 10; i = 0; s = 0; while (i < n) { s = s + i; n = n - 1; i = i + 1; }
+  print(i); print(s); print(n); }
+"""
+        result, stats = run_counted(program)
+        self.assertEqual(result, run(program, vectorize=False))
+        self.assertEqual(result, (["5", "10", "5"], None))
+        self.assertEqual(stats, {"closed_form": 0, "fallback": 0})
+
+    def test_closed_form_loops_use_up_max_steps(self):
+        program = COUNTED_LOOP_PROGRAMS["increasing"]
+        result, stats = run_counted(program, ["100000"], max_steps=10000)
+        self.assertEqual(result, ([], ErrorType.RESOURCE_ERROR))
+        self.assertEqual(run(program, ["100000"], vectorize=False, max_steps=10000), result)
+        result, _ = run_counted(program, ["100"], max_steps=10000)
+        self.assertEqual(result, run(program, ["100"], vectorize=False))
+
+
+COUNTING_PROGRAM = "func main() { i = 0; while (true) { print(i); i = i + 1; } }"
+
+
+class OutputSinkTest(unittest.TestCase):
+    def test_iter_output_yields_lines_as_they_are_printed(self):
+        program = "func main() { i = 0; while (i < 50) { print(i); i = i + 1; } }"
+        lines = list(iter_output(program, queue_size=4))
+        self.assertEqual(lines, [str(i) for i in range(50)])
+
+    def test_errors_are_raised_after_the_lines_before_them(self):
+        program = 'func main() { print(1); print(2); print(1 + "s"); }'
+        lines = []
+        with self.assertRaisesRegex(Exception, "ErrorType.TYPE_ERROR"):
+            for line in iter_output(program, queue_size=1):
+                lines.append(line)
+        self.assertEqual(lines, ["1", "2"])
+
+    def test_closing_early_stops_the_program(self):
+        for engine, options in ENGINES.items():
+            with self.subTest(engine=engine):
+                threads = threading.active_count()
+                lines = iter_output(COUNTING_PROGRAM, queue_size=4, **options)
+                self.assertEqual([next(lines) for _ in range(10)], [str(i) for i in range(10)])
+                lines.close()
+                self.assertEqual(threading.active_count(), threads)
+
+    def test_writes_to_a_closed_queue_sink_fail(self):
+        sink = QueueSink(queue_size=1)
+        sink.write("a")
+        sink.closed = True
+        with self.assertRaises(OutputClosed):
+            sink.write("b")
+        self.assertEqual(sink.queue.get_nowait(), "a")
+
+
+ECHO_PROGRAM = """
+func main() { n = inputi(); while (n != 0) { print(n * 2); n = inputi(); } print("done"); }
+"""
+
+
+# runs program under run_async and returns (lines printed, error type or None)
+def run_async(program, inputs=None, **options):
+    interpreter = Interpreter(console_output=False, inp=inputs, **options)
+    try:
+        asyncio.run(interpreter.run_async(program))
+    except Exception:
+        return interpreter.get_output(), interpreter.get_error_type_and_line()[0]
+    return interpreter.get_output(), None
+
+
+class AsyncTest(unittest.TestCase):
+    def test_run_async_gives_the_synchronous_result(self):
+        programs = [
+            (ECHO_PROGRAM, ["1", "5", "0"]),
+            (TIERED_PROGRAMS["objects and recursion"], None),
+            (TIERED_PROGRAMS["errors in compiled code"], None),
+            (GOVERNED_PROGRAMS["max_call_depth"], None),
+        ]
+        for program, inputs in programs:
+            with self.subTest(program=program):
+                expected = run(program, inputs, explicit_stack=True, max_call_depth=1000)
+                self.assertEqual(run_async(program, inputs, max_call_depth=1000), expected)
+
+    def test_programs_share_an_event_loop(self):
+        async def echo(lines_in, lines_out):
+            interpreter = Interpreter(
+                console_output=False,
+                input_provider=AsyncQueueInput(lines_in),
+                output_sink=AsyncQueueSink(lines_out),
+            )
+            await interpreter.run_async(ECHO_PROGRAM)
+
+        async def compute():
+            interpreter = Interpreter(console_output=False, yield_every=10)
+            await interpreter.run_async(SQUARES_PROGRAM)
+            return interpreter.get_output()
+
+        async def main():
+            lines_in, lines_out = asyncio.Queue(), asyncio.Queue(1)
+            tasks = [asyncio.create_task(echo(lines_in, lines_out)), asyncio.create_task(compute())]
+            replies = []
+            for n in ("3", "4", "0"):
+                await lines_in.put(n)
+                replies.append(await lines_out.get())
+            await tasks[0]
+            self.assertFalse(tasks[1].done())
+            return replies, await tasks[1]
+
+        self.assertEqual(asyncio.run(main()), (["6", "8", "done"], ["2648500"]))
+
+
+class InterpreterPoolTest(unittest.TestCase):
+    def test_checkouts_start_afresh(self):
+        pool = InterpreterPool(size=1)
+        self.assertEqual(pool.run(INPUT_PROGRAM, ["1", "2"]), ["2"])
+        with pool.checkout() as interpreter:
+            self.assertEqual(interpreter.get_output(), [])
+            self.assertIsNone(interpreter.inp)
+            self.assertEqual(interpreter.call_depth, 0)
+        with self.assertRaisesRegex(Exception, "ErrorType.FAULT_ERROR"):
+            pool.run("func main() { print(inputi()); print(inputi()); }", ["3"])
+        self.assertEqual(pool.run(INPUT_PROGRAM, ["5"]), ["6"])
+
+    def test_failed_runs_leave_nothing_behind(self):
+        program = """
+func main() { o = @; o.f = lambda(n) { print(n); return n + this.x; }; o.f(1); }
+"""
+        pool = InterpreterPool(size=1)
+        for _ in range(2):
+            with self.assertRaisesRegex(Exception, "ErrorType.NAME_ERROR"):
+                pool.run(program)
+            with pool.checkout() as interpreter:
+                self.assertEqual(interpreter.get_output(), [])
+                self.assertEqual(interpreter.current_val_object_mcall, [])
+                self.assertEqual(interpreter.call_depth, 0)
+        self.assertEqual(pool.run(INPUT_PROGRAM, ["1"]), ["2"])
+
+    def test_programs_go_back_to_the_interpreter_that_loaded_them(self):
+        pool = InterpreterPool(size=2)
+        other = "func main() { print(0); }"
+        pool.run(INPUT_PROGRAM, ["1"])
+        pool.run(other)
+        with pool.checkout(INPUT_PROGRAM) as interpreter:
+            self.assertIs(pool.loaded[interpreter], INPUT_PROGRAM)
+        with pool.checkout(other) as interpreter:
+            self.assertIs(pool.loaded[interpreter], other)
+
+
+GOVERNED_PROGRAMS = {
+    "max_steps": "func main() { while (true) { x = 1; } }",
+    "max_call_depth": "func f(n) { return f(n + 1); } func main() { f(0); }",
+    "max_objects_created": "func main() { while (true) { o = @; f = lambda() { return 1; }; } }",
+    "max_output_bytes": 'func main() { while (true) { print("hello"); } }',
+    "max_string_length": 'func main() { s = "ab"; while (true) { s = s + s; } }',
+}
+
+
+class GovernorTest(unittest.TestCase):
+    def test_every_limit_is_a_resource_error(self):
+        for limit, program in GOVERNED_PROGRAMS.items():
+            for engine, options in ENGINES.items():
+                with self.subTest(limit=limit, engine=engine):
+                    _, error_type = run(program, **{limit: 1000}, **options)
+                    self.assertIs(error_type, ErrorType.RESOURCE_ERROR)
+
+
+SQUARES_PROGRAM = """
+func sq(x) { return x * x; }
+func main() {
+  i = 0;
+  s = 0;
+  while (i < 200) { s = s + sq(3) + sq(i); i = i + 1; }
+  print(s);
+}
+"""
+
+
+class ProfileTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "profiles.json")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_profile_of_another_ast_shape_is_not_applied(self):
+        saved = {
+            "runs": 1,
+            "sites": {
+                "100000": {"kind": "op", "elem_type": "+", "types": {"INT,INT": 5}},
+                "3": {"kind": "op", "elem_type": "+", "types": {"INT,INT": 5}},
+            },
+        }
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({program_hash(SQUARES_PROGRAM): saved}, f)
+        self.assertEqual(run(SQUARES_PROGRAM, profile_path=self.path), (["2648500"], None))
+
+    def test_same_profile_path_with_and_without_specialize(self):
+        for specialize in (True, False, True, False):
+            with self.subTest(specialize=specialize):
+                output = run(SQUARES_PROGRAM, profile_path=self.path, specialize=specialize)
+                self.assertEqual(output, (["2648500"], None))
+
+    def test_specialized_runs_keep_a_profile_of_their_own(self):
+        for specialize in (True, False, True, False):
+            run(SQUARES_PROGRAM, profile_path=self.path, specialize=specialize)
+        with open(self.path, encoding="utf-8") as f:
+            profiles = json.load(f)
+        runs = {key.partition("/")[2]: profile["runs"] for key, profile in profiles.items()}
+        self.assertEqual(runs, {"": 2, f"specialize={SPECIALIZE_BUDGET}": 2})
+
+
+# sends data as one frame to the server at path and returns its reply
+def send_raw_frame(path, data):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall(HEADER.pack(len(data)) + data)
+        return recv_frame(sock)
+
+
+INPUT_PROGRAM = "func main() { print(inputi() + 1); }"
+BAD_FRAMES = [b"\xff\xfe", b"{not json", b'{"inputs": []}', b"[1]", b'{"program": 1}']
+
+
+LOOPING_PROGRAM = "func main() { while (true) { x = 1; } }"
+
+
+class BatchTest(unittest.TestCase):
+    def run_jobs(self, jobs, **limits):
+        return {result["name"]: result for result in run_jobs(jobs, workers=2, **limits)}
+
+    def test_every_job_gets_a_result(self):
+        jobs = [
+            {"name": "ok", "program": INPUT_PROGRAM, "inputs": ["1"]},
+            {"name": "error", "program": 'func main() { print(1); print(1 + "s"); }'},
+            {"name": "timeout", "program": LOOPING_PROGRAM},
+        ]
+        results = self.run_jobs(jobs, timeout=1)
+        self.assertEqual(results["ok"]["status"], "ok")
+        self.assertEqual(results["ok"]["output"], ["2"])
+        self.assertEqual(results["error"]["status"], "error")
+        self.assertEqual(results["error"]["output"], ["1"])
+        self.assertEqual(results["error"]["error_type"], "TYPE_ERROR")
+        self.assertEqual(results["timeout"]["status"], "timeout")
+        self.assertEqual(results["timeout"]["error"], "timed out after 1 s")
+
+    def test_jobs_over_their_cpu_time_are_killed(self):
+        results = self.run_jobs([{"name": "loop", "program": LOOPING_PROGRAM}], cpu_seconds=1)
+        self.assertEqual(results["loop"]["status"], "killed")
+        self.assertEqual(results["loop"]["error"], "CPU time limit exceeded")
+        self.assertEqual(results["loop"]["output"], [])
+
+    def test_jobs_from_a_directory(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for name, text in {"a.br": INPUT_PROGRAM, "a.in": "4\n", "b.br": INPUT_PROGRAM}.items():
+                with open(os.path.join(directory, name), "w", encoding="utf-8") as f:
+                    f.write(text)
+            jobs = load_jobs(directory)
+        self.assertEqual([job["name"] for job in jobs], ["a", "b"])
+        self.assertEqual(jobs[0]["inputs"], ["4"])
+        self.assertNotIn("inputs", jobs[1])
+
+
+class ServerTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "brewin.sock")
+        self.server = BrewinServer(self.path, workers=2).start()
+
+    def tearDown(self):
+        self.server.close()
+        self.dir.cleanup()
+
+    def test_bad_requests_get_an_error_and_leave_the_workers_running(self):
+        for data in BAD_FRAMES:
+            with self.subTest(data=data):
+                reply = send_raw_frame(self.path, data)
+                self.assertTrue(reply["error"].startswith("bad request"), reply)
+        self.assertEqual(run_remote(self.path, INPUT_PROGRAM, ["41"]), (["42"], None))
+
+    def test_running_out_of_inputs_is_an_error(self):
+        for inputs in (None, []):
+            with self.subTest(inputs=inputs):
+                lines, error = run_remote(self.path, INPUT_PROGRAM, inputs)
+                self.assertEqual(lines, [])
+                self.assertEqual(error, "ErrorType.FAULT_ERROR: No input left to read")
+
+
+class ForkServerTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.dir.name, "fork.sock")
+        cls.process = start_fork_server(cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.process.terminate()
+        cls.process.wait()
+        cls.dir.cleanup()
+
+    def test_running_out_of_inputs_is_an_error(self):
+        for inputs in (None, []):
+            with self.subTest(inputs=inputs):
+                lines, error = run_remote(self.path, INPUT_PROGRAM, inputs)
+                self.assertEqual(lines, [])
+                self.assertEqual(error, "ErrorType.FAULT_ERROR: No input left to read")
+        self.assertEqual(run_remote(self.path, INPUT_PROGRAM, ["1"]), (["2"], None))
+
+    def test_bad_requests_get_an_error(self):
+        for data in BAD_FRAMES:
+            with self.subTest(data=data):
+                reply = send_raw_frame(self.path, data)
+                self.assertTrue(reply["error"].startswith("bad request"), reply)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,90 +1,193 @@
-import copy
-
-from enum import Enum
-from intbase import InterpreterBase
-from env_v4 import EnvironmentManager
-
-
-# Enumerated type for our different language data types
-class Type(Enum):
-    INT = 1
-    BOOL = 2
-    STRING = 3
-    CLOSURE = 4
-    NIL = 5
-    OBJECT = 6
-
-class Object:
-    def __init__(self):
-        self.type = Type.OBJECT
-        self.obj_env = {}
-        self.proto = None
-
-    def set(self, var_name, value):
-        self.obj_env[var_name] = value
-
-    def get(self, var_name):
-        if var_name in self.obj_env:
-            return self.obj_env[var_name]
-        return None
-    
-    def set_proto(self, new_proto):
-        self.proto = new_proto
-
-class Closure:
-    def __init__(self, func_ast, env):
-        self.func_ast = func_ast
-        self.type = Type.CLOSURE
-        self.captured_env = EnvironmentManager()
-        for sub_env in env.environment:
-            temp_env= {}
-            for var, value in sub_env.items():
-                if value.type() == Type.CLOSURE or value.type() == Type.OBJECT:
-                    temp_env[var] = value
-                else:
-                    temp_env[var] = copy.deepcopy(value)
-            self.captured_env.push(temp_env)
-
-
-# Represents a value, which has a type and its value
-class Value:
-    def __init__(self, t, v=None):
-        self.t = t
-        self.v = v
-
-    def value(self):
-        return self.v
-
-    def type(self):
-        return self.t
-
-    def set(self, other):
-        self.t = other.t
-        self.v = other.v
-
-
-def create_value(val):
-    if val == InterpreterBase.TRUE_DEF:
-        return Value(Type.BOOL, True)
-    elif val == InterpreterBase.FALSE_DEF:
-        return Value(Type.BOOL, False)
-    elif isinstance(val, str):
-        return Value(Type.STRING, val)
-    elif isinstance(val, int):
-        return Value(Type.INT, val)
-    elif val == InterpreterBase.NIL_DEF:
-        return Value(Type.NIL, None)
-    else:
-        raise ValueError("Unknown value type")
-
-
-def get_printable(val):
-    if val.type() == Type.INT:
-        return str(val.value())
-    if val.type() == Type.STRING:
-        return val.value()
-    if val.type() == Type.BOOL:
-        if val.value() is True:
-            return "true"
-        return "false"
+import copy
+
+from enum import Enum
+from intbase import InterpreterBase
+
+
+# Enumerated type for our different language data types
+class Type(Enum):
+    INT = 1
+    BOOL = 2
+    STRING = 3
+    CLOSURE = 4
+    NIL = 5
+    OBJECT = 6
+    THUNK = 7
+
+class Object:
+    def __init__(self):
+        self.type = Type.OBJECT
+        self.obj_env = {}
+        self.proto = None
+
+    def set(self, var_name, value):
+        self.obj_env[var_name] = value
+
+    def get(self, var_name):
+        if var_name in self.obj_env:
+            return self.obj_env[var_name]
+        return None
+    
+    def set_proto(self, new_proto):
+        self.proto = new_proto
+
+def _captured_value(value):
+    if value.type() == Type.CLOSURE or value.type() == Type.OBJECT:
+        return value
+    return copy.deepcopy(value)
+
+
+class Closure:
+    def __init__(self, func_ast, env):
+        self.func_ast = func_ast
+        self.type = Type.CLOSURE
+        self.captured_env = env.capture(_captured_value)
+
+# An argument or right-hand side whose evaluation is delayed (lazy=True in
+# interpreterv4.py): the expression, the environment and method receivers it
+# is evaluated with, and whether the Value it produces is deep-copied the way a
+# non-ref argument is. result holds that Value once the thunk has been forced.
+class Thunk:
+    def __init__(self, expr_ast, env, receivers, deep):
+        self.expr_ast = expr_ast
+        self.env = env
+        self.receivers = receivers
+        self.deep = deep
+        self.forcing = False
+        self.result = None
+
+    # copies of a thunk are forced together, so that it runs at most once
+    def __deepcopy__(self, memo):
+        return self
+
+
+# A string built by concatenation (ropes=True in interpreterv4.py), kept as
+# the list of pieces it was built from until something needs its text. Appending
+# to the newest rope built on a list extends the list in place, so building a
+# string piece by piece costs amortized O(1) per piece; the text is joined once,
+# when it is printed or compared, and then cached. Ropes compare and hash like
+# their text, and are never modified, so copies can share them.
+class Rope:
+    __slots__ = ("parts", "count", "length", "text")
+
+    def __init__(self, parts, count, length):
+        self.parts = parts  # may be shared with longer ropes
+        self.count = count  # the first count parts are this rope's
+        self.length = length
+        self.text = None
+
+    def __len__(self):
+        return self.length
+
+    def __str__(self):
+        if self.text is None:
+            self.text = "".join(self.parts[: self.count])
+        return self.text
+
+    def __eq__(self, other):
+        return str(self) == str(other)
+
+    def __ne__(self, other):
+        return str(self) != str(other)
+
+    def __hash__(self):
+        return hash(str(self))
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+# strings shorter than this are concatenated directly
+ROPE_MIN_LENGTH = 128
+
+
+def concat_strings(x, y):
+    if type(x) is Rope:
+        if type(y) is Rope:
+            y = str(y)
+        if x.count == len(x.parts):
+            x.parts.append(y)
+            return Rope(x.parts, x.count + 1, x.length + len(y))
+        return Rope(x.parts[: x.count] + [y], x.count + 1, x.length + len(y))
+    if type(y) is Rope:
+        return Rope([x] + y.parts[: y.count], y.count + 1, len(x) + y.length)
+    length = len(x) + len(y)
+    if length < ROPE_MIN_LENGTH:
+        return x + y
+    return Rope([x, y], 2, length)
+
+
+# Represents a value, which has a type and its value
+class Value:
+    def __init__(self, t, v=None):
+        self.t = t
+        self.v = v
+
+    def value(self):
+        return self.v
+
+    def type(self):
+        return self.t
+
+    def set(self, other):
+        self.t = other.t
+        self.v = other.v
+
+
+# A Value shared by every use of the same constant or small result (see
+# "Interned values" in interpreterv4.py). Variables never hold one: copying it
+# gives a plain Value, and modifying it is a bug.
+class SharedValue(Value):
+    def set(self, other):
+        raise TypeError("shared values can't be modified")
+
+    def __copy__(self):
+        return Value(self.t, self.v)
+
+    def __deepcopy__(self, memo):
+        return Value(self.t, self.v)
+
+
+NIL = SharedValue(Type.NIL, None)
+BOOL_VALUES = (SharedValue(Type.BOOL, False), SharedValue(Type.BOOL, True))  # indexed by a python bool
+SMALL_INT_MIN = -5
+SMALL_INT_MAX = 256
+SMALL_INT_VALUES = [SharedValue(Type.INT, i) for i in range(SMALL_INT_MIN, SMALL_INT_MAX + 1)]
+
+
+def int_value(i):
+    if SMALL_INT_MIN <= i <= SMALL_INT_MAX:
+        return SMALL_INT_VALUES[i - SMALL_INT_MIN]
+    return Value(Type.INT, i)
+
+
+def create_value(val):
+    if val == InterpreterBase.TRUE_DEF:
+        return Value(Type.BOOL, True)
+    elif val == InterpreterBase.FALSE_DEF:
+        return Value(Type.BOOL, False)
+    elif isinstance(val, str):
+        return Value(Type.STRING, val)
+    elif isinstance(val, int):
+        return Value(Type.INT, val)
+    elif val == InterpreterBase.NIL_DEF:
+        return Value(Type.NIL, None)
+    else:
+        raise ValueError("Unknown value type")
+
+
+def create_shared_value(val):
+    value = create_value(val)
+    return SharedValue(value.t, value.v)
+
+
+def get_printable(val):
+    if val.type() == Type.INT:
+        return str(val.value())
+    if val.type() == Type.STRING:
+        return str(val.value())
+    if val.type() == Type.BOOL:
+        if val.value() is True:
+            return "true"
+        return "false"
     return None
\ No newline at end of file
@@ -0,0 +1,268 @@
+# Static type inference for v4 programs
+#
+# infer_types walks each function and lambda body once, following the type of
+# every local variable through assignments, if/else and while loops, and
+# records the type of each expression node whose type it can prove. It also
+# collects the type errors that are certain to happen if a node ever runs,
+# e.g. "a" - 1, leaving out code under a constant condition that keeps it from
+# running (if (false) { ... }). reachable_functions picks out the functions
+# main can call, so that errors in the others can be left out as well.
+#
+# Brewin is dynamically scoped and passes ref arguments by alias, so the
+# analysis is deliberately conservative:
+#   - any call to a user function, lambda or method may reassign any variable
+#     the caller can see, so all known variable types are dropped after a call
+#   - ref parameters are never tracked, and assigning to one drops all known
+#     types (it may alias any variable of the caller)
+#   - variables first assigned inside a block are forgotten when it ends, since
+#     the block's scope goes away with them
+#   - parameters, "this" and object fields are never tracked
+# That still isn't sound: a variable the function reaches through dynamic
+# scope may be aliased by a ref parameter of a caller, and an assignment to
+# that parameter's name (also found through dynamic scope) changes its type.
+# Dropping all types on every such assignment would leave almost nothing
+# proven, so the interpreter treats proven types as predictions and keeps a
+# type tag check wherever it relies on one.
+# With short-circuit evaluation the right operand of && and || may not run, so
+# only a left operand of the wrong type makes them certain to fail; when they
+# return, the result is a bool either way.
+from intbase import InterpreterBase
+from type_value_v4 import Type
+
+LITERAL_TYPES = {
+    InterpreterBase.INT_DEF: Type.INT,
+    InterpreterBase.STRING_DEF: Type.STRING,
+    InterpreterBase.BOOL_DEF: Type.BOOL,
+    InterpreterBase.NIL_DEF: Type.NIL,
+    InterpreterBase.OBJ_DEF: Type.OBJECT,
+}
+
+# the operators Interpreter.__setup_ops defines for each type
+INT_OPS = {"+", "-", "*", "/", "==", "!=", "<", "<=", ">", ">="}
+BOOL_OPS = {"&&", "||", "==", "!="}
+BIN_OPS = INT_OPS | BOOL_OPS
+OPS_BY_TYPE = {
+    Type.INT: INT_OPS,
+    Type.STRING: {"+", "==", "!="},
+    Type.BOOL: BOOL_OPS,
+    Type.NIL: {"==", "!="},
+    Type.CLOSURE: {"==", "!="},
+    Type.OBJECT: {"==", "!="},
+}
+
+
+# result type of a binary operation on operands of the given types, or None if
+# the operation is a type error; mirrors Interpreter.__bin_op_promotion and
+# Interpreter.__compatible_types
+def bin_op_type(oper, left, right):
+    if oper in BOOL_OPS and not (oper in INT_OPS and left is Type.INT and right is Type.INT):
+        left = Type.BOOL if left is Type.INT else left
+        right = Type.BOOL if right is Type.INT else right
+    if oper in INT_OPS:
+        left = Type.INT if left is Type.BOOL else left
+        right = Type.INT if right is Type.BOOL else right
+    if oper not in ("==", "!=") and left is not right:
+        return None
+    if oper not in OPS_BY_TYPE[left]:
+        return None
+    if oper in ("+", "-", "*", "/"):
+        return left
+    return Type.BOOL
+
+
+# result type of a unary operation, or None if it is a type error; mirrors
+# Interpreter.__apply_unary
+def unary_op_type(oper, operand):
+    if oper == InterpreterBase.NOT_DEF and operand in (Type.INT, Type.BOOL):
+        return Type.BOOL
+    if oper == InterpreterBase.NEG_DEF and operand is Type.INT:
+        return Type.INT
+    return None
+
+
+class TypeInfo:
+    def __init__(self):
+        self.types = {}  # expression node -> proven Type
+        self.errors = {}  # node -> message, for nodes that always fail
+
+
+# joins the variable types known on two paths that meet; None marks a path that
+# can't reach the join (it returned)
+def join(state1, state2):
+    if state1 is None:
+        return state2
+    if state2 is None:
+        return state1
+    return {n: t for n, t in state1.items() if state2.get(n) is t}
+
+
+class _Analyzer:
+    def __init__(self, short_circuit):
+        self.short_circuit = short_circuit
+        self.info = TypeInfo()
+        # a node analyzed more than once (in a loop being iterated to a fixed
+        # point) keeps a type or error only if every visit agrees on it
+        self.visited = set()
+        self.dead = 0  # how many constant conditions the current code is under
+
+    def mark(self, node, t, error=None):
+        if node in self.visited:
+            if self.info.types.get(node) is not t:
+                self.info.types.pop(node, None)
+            if self.info.errors.get(node) != error:
+                self.info.errors.pop(node, None)
+            return
+        self.visited.add(node)
+        if t is not None:
+            self.info.types[node] = t
+        if error is not None and not self.dead:
+            self.info.errors[node] = error
+
+    def function(self, func_ast):
+        refs = {
+            arg.get("name")
+            for arg in func_ast.get("args")
+            if arg.elem_type == InterpreterBase.REFARG_DEF
+        }
+        self.block(func_ast.get("statements"), {}, refs)
+
+    def block(self, statements, state, refs, dead=False):
+        entry_names = set(state)
+        state = dict(state)
+        self.dead += dead
+        try:
+            for statement in statements:
+                state = self.statement(statement, state, refs)
+                if state is None:
+                    return None
+        finally:
+            self.dead -= dead
+        return {n: t for n, t in state.items() if n in entry_names}
+
+    def statement(self, statement, state, refs):
+        kind = statement.elem_type
+        if kind == InterpreterBase.FCALL_DEF or kind == InterpreterBase.MCALL_DEF:
+            self.expr(statement, state, refs)
+        elif kind == "=":
+            t = self.expr(statement.get("expression"), state, refs)
+            var_name = statement.get("name")
+            if var_name in refs:
+                state.clear()
+            elif var_name != "this" and "." not in var_name:
+                if t is None:
+                    state.pop(var_name, None)
+                else:
+                    state[var_name] = t
+        elif kind == InterpreterBase.RETURN_DEF:
+            if statement.get("expression") is not None:
+                self.expr(statement.get("expression"), state, refs)
+            return None
+        elif kind == InterpreterBase.IF_DEF:
+            self.condition(statement, state, refs)
+            constant = constant_condition(statement.get("condition"))
+            then_state = self.block(statement.get("statements"), state, refs, constant is False)
+            else_state = state
+            if statement.get("else_statements") is not None:
+                else_state = self.block(
+                    statement.get("else_statements"), state, refs, constant is True
+                )
+            return join(then_state, else_state)
+        elif kind == InterpreterBase.WHILE_DEF:
+            never_runs = constant_condition(statement.get("condition")) is False
+            head = state
+            while True:
+                state = dict(head)
+                self.condition(statement, state, refs)
+                body_state = self.block(statement.get("statements"), state, refs, never_runs)
+                new_head = join(head, body_state)
+                if new_head == head:
+                    return state
+                head = new_head
+        return state
+
+    def condition(self, statement, state, refs):
+        t = self.expr(statement.get("condition"), state, refs)
+        error = None
+        if t is not None and t not in (Type.INT, Type.BOOL):
+            error = f"Incompatible type for {statement.elem_type} condition"
+        self.mark(statement, None, error)
+
+    def expr(self, expr_ast, state, refs):
+        kind = expr_ast.elem_type
+        t = None
+        error = None
+        if kind in LITERAL_TYPES:
+            t = LITERAL_TYPES[kind]
+        elif kind == InterpreterBase.VAR_DEF:
+            var_name = expr_ast.get("name")
+            if var_name not in refs:
+                t = state.get(var_name)
+        elif kind == InterpreterBase.FCALL_DEF or kind == InterpreterBase.MCALL_DEF:
+            for arg in expr_ast.get("args"):
+                self.expr(arg, state, refs)
+            if kind == InterpreterBase.FCALL_DEF and expr_ast.get("name") == "print":
+                t = Type.NIL
+            elif kind == InterpreterBase.FCALL_DEF and expr_ast.get("name") == "inputi":
+                t = Type.INT
+            else:
+                state.clear()
+        elif kind == InterpreterBase.LAMBDA_DEF:
+            self.function(expr_ast)
+            t = Type.CLOSURE
+        elif kind == InterpreterBase.NEG_DEF or kind == InterpreterBase.NOT_DEF:
+            operand = self.expr(expr_ast.get("op1"), state, refs)
+            if operand is not None:
+                t = unary_op_type(kind, operand)
+                if t is None:
+                    error = f"Incompatible type for {kind} operation"
+        elif kind in BIN_OPS:
+            left = self.expr(expr_ast.get("op1"), state, refs)
+            right = self.expr(expr_ast.get("op2"), state, refs)
+            if self.short_circuit and kind in ("&&", "||"):
+                t = Type.BOOL
+                if left is not None and left not in (Type.INT, Type.BOOL):
+                    t = None
+                    error = f"Incompatible types for {kind} operation"
+            elif left is not None and right is not None:
+                t = bin_op_type(kind, left, right)
+                if t is None:
+                    error = f"Incompatible types for {kind} operation"
+        self.mark(expr_ast, t, error)
+        return t
+
+
+# True or False for a condition that is a bool or int literal, otherwise None
+def constant_condition(cond_ast):
+    if cond_ast.elem_type in (InterpreterBase.BOOL_DEF, InterpreterBase.INT_DEF):
+        return bool(cond_ast.get("val"))
+    return None
+
+
+# the functions main can call, directly or not: a function can only be called
+# through its name, so these are main and the functions whose names appear, in
+# a call or as a variable, in one of them
+def reachable_functions(func_defs):
+    by_name = {}
+    for func_def in func_defs:
+        by_name.setdefault(func_def.get("name"), []).append(func_def)
+    reachable = []
+    seen = set()
+    pending = ["main"]
+    while pending:
+        name = pending.pop()
+        if name in seen or name not in by_name:
+            continue
+        seen.add(name)
+        for func_def in by_name[name]:
+            reachable.append(func_def)
+            for node in func_def.walk():
+                if node.elem_type in (InterpreterBase.FCALL_DEF, InterpreterBase.VAR_DEF):
+                    pending.append(node.get("name"))
+    return reachable
+
+
+def infer_types(func_defs, short_circuit=True):
+    analyzer = _Analyzer(short_circuit)
+    for func_def in func_defs:
+        analyzer.function(func_def)
+    return analyzer.info